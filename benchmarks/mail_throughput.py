@@ -0,0 +1,92 @@
+"""
+Mail throughput against a local aiosmtpd server.
+
+Compares the previous way of sending (new SMTP connection and template
+compilation per message, as FastMail did) with the pooled MailSender.
+
+    python -m benchmarks.mail_throughput -n 500
+"""
+import argparse
+import asyncio
+import socket
+import time
+from email.message import EmailMessage
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+from jinja2 import Environment, FileSystemLoader
+
+from src.services.mailer import MailSender, TEMPLATE_FOLDER, render
+from src.services.mail import html_message
+
+
+TEMPLATE = "password_confirm_email.html"
+
+
+class Sink:
+    async def handle_DATA(self, server, session, envelope):
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def previous_send(port: int, number: int) -> None:
+    template = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER)).get_template(TEMPLATE)
+    body = template.render(host="http://localhost/", token="token", username=f"user{number}@example.com")
+    message = EmailMessage()
+    message["Subject"] = "Email confirmation"
+    message["From"] = "sender@example.com"
+    message["To"] = f"user{number}@example.com"
+    message.set_content(body, subtype="html")
+    client = aiosmtplib.SMTP(hostname="127.0.0.1", port=port, use_tls=False)
+    await client.connect()
+    await client.send_message(message)
+    await client.quit()
+
+
+async def pooled_send(sender: MailSender, number: int) -> None:
+    message = await html_message("Email confirmation", f"user{number}@example.com", TEMPLATE,
+                                 host="http://localhost/", token="token", username=f"user{number}@example.com")
+    await sender.send(message)
+
+
+async def measure(name: str, send, messages: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(number: int):
+        async with semaphore:
+            await send(number)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(limited(i) for i in range(messages)))
+    elapsed = time.perf_counter() - start
+    print(f"{name:<34} {messages / elapsed:8.1f} messages/s")
+
+
+async def main(messages: int, concurrency: int, pool_size: int) -> None:
+    controller = Controller(Sink(), hostname="127.0.0.1", port=free_port())
+    controller.start()
+    sender = MailSender(hostname="127.0.0.1", port=controller.port, use_tls=False, pool_size=pool_size)
+    try:
+        await render(TEMPLATE, host="", token="", username="")
+        await measure("previous (connection per message)", lambda i: previous_send(controller.port, i),
+                      messages, concurrency)
+        await measure(f"pooled ({pool_size} connections)", lambda i: pooled_send(sender, i),
+                      messages, concurrency)
+    finally:
+        await sender.close()
+        controller.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--messages", type=int, default=500)
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    parser.add_argument("-p", "--pool-size", type=int, default=4)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.messages, args.concurrency, args.pool_size))
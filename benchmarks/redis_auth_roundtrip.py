@@ -0,0 +1,97 @@
+"""
+Redis latency added to an authenticated, rate limited request.
+
+Compares the previous path (rate limiter script, then GET of the cached user)
+with the combined principal + rate limit script used by RateLimitedUser.
+
+    python -m benchmarks.redis_auth_roundtrip -n 5000
+    python -m benchmarks.redis_auth_roundtrip --fake   # smoke run without redis server
+"""
+import argparse
+import asyncio
+import pickle
+import statistics
+import time
+
+import redis.asyncio as redis
+
+from src.conf.config import settings
+from src.dependencies.rate_limit import fetch_principal
+from src.dependencies.token_user import user_cache_key
+
+
+# Script of fastapi_limiter.RateLimiter which was used before RateLimitedUser
+LIMITER_SCRIPT = """local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local expire_time = ARGV[2]
+
+local current = tonumber(redis.call('get', key) or "0")
+if current > 0 then
+    if current + 1 > limit then
+        return redis.call("PTTL",key)
+    else
+        redis.call("INCR", key)
+        return 0
+    end
+else
+    redis.call("SET", key, 1,"px",expire_time)
+    return 0
+end"""
+
+EMAIL = "benchmark@example.com"
+TIMES = 10 ** 9
+MILLISECONDS = 60_000
+
+
+async def previous_path(cache, limiter_sha: str) -> None:
+    await cache.evalsha(limiter_sha, 1, f"bench:old:{EMAIL}", TIMES, MILLISECONDS)
+    snapshot = await cache.get(user_cache_key(EMAIL))
+    pickle.loads(snapshot)
+
+
+async def combined_path(cache) -> None:
+    snapshot, *_ = await fetch_principal(cache, EMAIL, f"bench:new:{EMAIL}", TIMES, MILLISECONDS)
+    pickle.loads(snapshot)
+
+
+async def measure(func, iterations: int) -> list[float]:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return timings
+
+
+def percentile(timings: list[float], value: int) -> float:
+    return statistics.quantiles(timings, n=100)[value - 1]
+
+
+async def main(iterations: int, fake: bool) -> None:
+    if fake:
+        from fakeredis.aioredis import FakeRedis
+        cache = FakeRedis()
+    else:
+        cache = redis.Redis(host=settings.redis.host, port=settings.redis.port)
+
+    await cache.set(user_cache_key(EMAIL), pickle.dumps({"id": 1, "email": EMAIL}))
+    limiter_sha = await cache.script_load(LIMITER_SCRIPT)
+
+    for name, func in (("previous (limiter + GET)", lambda: previous_path(cache, limiter_sha)),
+                       ("combined script", lambda: combined_path(cache))):
+        await measure(func, min(iterations, 100))
+        timings = await measure(func, iterations)
+        print(f"{name:<26} p50={percentile(timings, 50):.3f} ms  p99={percentile(timings, 99):.3f} ms")
+
+    await cache.delete(user_cache_key(EMAIL), f"bench:old:{EMAIL}", f"bench:new:{EMAIL}")
+    await cache.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=2000)
+    parser.add_argument("--fake", action="store_true", help="Use fakeredis instead of a redis server")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.iterations, args.fake))
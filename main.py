@@ -1,15 +1,25 @@
+import asyncio
 import uvicorn
-from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi_limiter import FastAPILimiter
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-import redis.asyncio as redis 
+from prometheus_client import CONTENT_TYPE_LATEST
 
 from src.dependencies.db import get_db
-from src.routes import contacts, auth, users
+from src.dependencies.cache import init_cache, close_cache, get_client
+from src.routes import contacts, auth, users, well_known, media, admin
 from src.conf.config import settings
+from src.services.revocation import revocation_list
+from src.services.hash_handler import pwd_handler, HashPoolSaturated
+from src.services.media import close_http_client
+from src.services.mail import mail_sender
+from src.services.telemetry import PrometheusMiddleware, collect_metrics, shutdown_metrics
+from src.services.tracing import TracingMiddleware, instrument_fastapi, tracer
+from src.services.loop_monitor import LoopMonitorMiddleware, loop_monitor
+from src.services.profiling import ProfilingMiddleware
 
 
 @asynccontextmanager
@@ -24,13 +34,22 @@ async def lifespan(app: FastAPI):
     :return: A generator
     :doc-author: Trelent
     """
-    r = await redis.Redis(host=settings.redis.host, 
-                          port=settings.redis.port, 
-                          db=0, 
-                          encoding="utf-8", 
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
+    init_cache()
+    r = get_client()
+    revocation_sync = asyncio.create_task(revocation_list.run(r, settings.revocation.sync_interval))
+    if settings.loop_monitor.enabled:
+        loop_monitor.start()
     yield
+    await loop_monitor.stop()
+    revocation_sync.cancel()
+    with suppress(asyncio.CancelledError):
+        await revocation_sync
+    pwd_handler.shutdown()
+    await close_http_client()
+    await mail_sender.close()
+    await close_cache()
+    shutdown_metrics()
+    tracer.shutdown()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -43,6 +62,9 @@ origins = [
 app.include_router(contacts.router, prefix='/api')
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
+app.include_router(admin.router, prefix='/api')
+app.include_router(well_known.router)
+app.include_router(media.router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -52,6 +74,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# The last added middleware is the outermost one, so it also times CORS
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(LoopMonitorMiddleware)
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(TracingMiddleware)
+instrument_fastapi()
+
+@app.exception_handler(HashPoolSaturated)
+async def hash_pool_saturated_handler(request: Request, exc: HashPoolSaturated):
+    """
+    The hash_pool_saturated_handler function answers 503 when all password hashing
+    processes are busy and the queue is full, the client should retry later.
+    
+    :param request: Request: The request which was rejected
+    :param exc: HashPoolSaturated: The exception
+    :return: A JSONResponse with status code 503
+    :doc-author: Trelent
+    """
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"detail": "Server is busy, try again later"},
+                        headers={"Retry-After": "1"})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    The metrics function exposes application metrics in prometheus text format.
+    With several workers metrics of all workers are aggregated, see src.services.telemetry.
+    
+    :return: A Response with metrics
+    :doc-author: Trelent
+    """
+    return Response(content=collect_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/halthchecker")
 async def halthchecker(db: Session=Depends(get_db)):
     """
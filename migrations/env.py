@@ -7,6 +7,7 @@ from alembic import context
 
 from src.dependencies.db import SQLALCHEMY_DATABASE_URL
 from src.dependencies.db import Base
+from src.models.outbox import OutboxMessage
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
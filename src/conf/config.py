@@ -1,3 +1,7 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
@@ -6,6 +10,11 @@ load_dotenv(find_dotenv())
 class RedisSettings(BaseSettings):
     host: str = 'localhost'
     port: int = 6379
+    max_connections: int = 50
+    pool_timeout: float = 5.0
+    socket_timeout: float = 5.0
+    socket_connect_timeout: float = 2.0
+    health_check_interval: int = 30
 
     model_config = SettingsConfigDict(env_prefix='redis_')
 
@@ -16,23 +25,164 @@ class MailSettings(BaseSettings):
     mail_from: str
     port: int
     server: str
+    ssl_tls: bool = True
+    starttls: bool = False
+    use_credentials: bool = True
+    validate_certs: bool = True
+    pool_size: int = 4
+    batch_size: int = 20
+    timeout: float = 30.0
 
     model_config = SettingsConfigDict(env_prefix='mail_')
 
 
 class CloudinarySettings(BaseSettings):
-    cloud_name: str
-    api_key: str
-    api_secret: str
-    folder: str
+    cloud_name: str | None = None
+    api_key: str | None = None
+    api_secret: str | None = None
+    folder: str | None = None
 
     model_config = SettingsConfigDict(env_prefix='cloudinary_')
 
 
+class MediaSettings(BaseSettings):
+    backend: Literal["cloudinary", "local"] = "cloudinary"
+    root: str = "media"
+    base_url: str = "/media"
+
+    model_config = SettingsConfigDict(env_prefix='media_')
+
+
+class JWTSettings(BaseSettings):
+    keys_dir: str | None = None
+    active_kid: str | None = None
+    jwks_max_age: int = 300
+    reload_interval: float = 30.0
+    legacy_hs256_until: datetime | None = None
+    ephemeral_keys: bool = False
+
+    model_config = SettingsConfigDict(env_prefix='jwt_')
+
+
+class RevocationSettings(BaseSettings):
+    capacity: int = 100_000
+    error_rate: float = 0.001
+    sync_interval: float = 1.0
+
+    model_config = SettingsConfigDict(env_prefix='revocation_')
+
+
+class HashSettings(BaseSettings):
+    pool_size: int = 2
+    queue_size: int = 32
+    schemes: list[str] = ["bcrypt"]
+    rounds: int | None = None
+
+    model_config = SettingsConfigDict(env_prefix='hash_')
+
+
+class RateLimitPolicy(BaseModel):
+    times: int
+    seconds: int
+    burst: int | None = None
+
+
+class RateLimitSettings(BaseSettings):
+    local_slack: float = 1.0
+    local_max_keys: int = 10_000
+    policies: dict[str, RateLimitPolicy] = {
+        "default": RateLimitPolicy(times=5, seconds=60),
+        "contacts:list": RateLimitPolicy(times=20, seconds=60),
+        "contacts:read": RateLimitPolicy(times=30, seconds=60),
+        "contacts:write": RateLimitPolicy(times=10, seconds=60),
+        "contacts:birthdays": RateLimitPolicy(times=35, seconds=60),
+    }
+    tiers: dict[str, float] = {"default": 1.0}
+
+    model_config = SettingsConfigDict(env_prefix='rate_limit_')
+
+
+class LoginSettings(BaseSettings):
+    account_attempts: int = 5
+    ip_attempts: int = 20
+    base_delay: float = 1.0
+    max_delay: float = 900.0
+    window: int = 3600
+    unknown_email_ttl: int = 300
+
+    model_config = SettingsConfigDict(env_prefix='login_')
+
+
+class OutboxSettings(BaseSettings):
+    batch_size: int = 50
+    concurrency: int = 8
+    max_attempts: int = 8
+    base_delay: float = 5.0
+    max_delay: float = 3600.0
+    lease: float = 300.0
+    poll_interval: float = 1.0
+
+    model_config = SettingsConfigDict(env_prefix='outbox_')
+
+
+class QueryLogSettings(BaseSettings):
+    slow_threshold: float = 0.2
+    explain: bool = True
+    repeat_threshold: int = 10
+
+    model_config = SettingsConfigDict(env_prefix='query_log_')
+
+
+class TracingSettings(BaseSettings):
+    exporter: Literal["none", "stdout", "file"] = "none"
+    file: str = "traces.jsonl"
+    service_name: str = "contacts-api"
+    sample_rate: float = 0.01
+
+    model_config = SettingsConfigDict(env_prefix='tracing_')
+
+
+class LoopMonitorSettings(BaseSettings):
+    enabled: bool = True
+    interval: float = 0.25
+    threshold: float = 0.1
+
+    model_config = SettingsConfigDict(env_prefix='loop_monitor_')
+
+
+class ProfilingSettings(BaseSettings):
+    header: str = "X-Profile"
+    sample_rate: float = 0.0
+    interval: float = 0.001
+    format: Literal["html", "speedscope"] = "html"
+    dir: str = "profiles"
+    keep: int = 100
+
+    model_config = SettingsConfigDict(env_prefix='profiling_')
+
+
+class MemorySettings(BaseSettings):
+    frames: int = 1
+    max_snapshots: int = 10
+    top: int = 20
+
+    model_config = SettingsConfigDict(env_prefix='memory_')
+
+
+class BirthdaySettings(BaseSettings):
+    days: int = 7
+    batch_size: int = 500
+    cursor_ttl: int = 2 * 24 * 3600
+
+    model_config = SettingsConfigDict(env_prefix='birthdays_')
+
+
 class Settings(BaseSettings):
     sqlalchemy_database_url: str
     secret_key: str
     algorithm: str
+
+    admin_emails: list[str] = []
     
     mail: MailSettings
 
@@ -40,5 +190,37 @@ class Settings(BaseSettings):
 
     cloudinary: CloudinarySettings
 
+    media: MediaSettings
+
+    jwt: JWTSettings
+
+    revocation: RevocationSettings
+
+    hash: HashSettings
+
+    rate_limit: RateLimitSettings
+
+    login: LoginSettings
+
+    outbox: OutboxSettings
+
+    birthdays: BirthdaySettings
+
+    query_log: QueryLogSettings
+
+    tracing: TracingSettings
+
+    loop_monitor: LoopMonitorSettings
+
+    profiling: ProfilingSettings
+
+    memory: MemorySettings
+
 
-settings = Settings(mail=MailSettings(), redis=RedisSettings(), cloudinary=CloudinarySettings())
\ No newline at end of file
+settings = Settings(mail=MailSettings(), redis=RedisSettings(), cloudinary=CloudinarySettings(),
+                    media=MediaSettings(), jwt=JWTSettings(), revocation=RevocationSettings(),
+                    hash=HashSettings(), rate_limit=RateLimitSettings(),
+                    login=LoginSettings(), outbox=OutboxSettings(),
+                    birthdays=BirthdaySettings(), query_log=QueryLogSettings(),
+                    tracing=TracingSettings(), loop_monitor=LoopMonitorSettings(),
+                    profiling=ProfilingSettings(), memory=MemorySettings())
\ No newline at end of file
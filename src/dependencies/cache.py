@@ -1,8 +1,137 @@
+import time
+
 import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
 
 from src.conf.config import settings
+from src.services.metrics import REDIS_POOL_IN_USE, REDIS_POOL_CREATED, REDIS_POOL_MAX, REDIS_COMMAND_LATENCY
+from src.services.tracing import tracer, KIND_CLIENT
+
+
+# Labelled children of REDIS_COMMAND_LATENCY by command name
+command_latency: dict[str, object] = {}
+
+
+def observe_command(command, started: float) -> None:
+    name = command.decode() if isinstance(command, bytes) else str(command)
+    child = command_latency.get(name)
+    if child is None:
+        child = command_latency[name] = REDIS_COMMAND_LATENCY.labels(name.upper())
+    elapsed = time.perf_counter() - started
+    child.observe(elapsed)
+    end_ns = time.time_ns()
+    tracer.record(f"redis {name.upper()}", end_ns - int(elapsed * 1e9), end_ns, KIND_CLIENT, **{"db.system": "redis"})
+
+
+class InstrumentedPipeline(Pipeline):
+    """
+    Pipeline timed as one MULTI (transaction) or PIPELINE command.
+    """
+
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            observe_command("MULTI" if self.is_transaction else "PIPELINE", started)
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Redis client which reports the duration of every command by its name.
+    """
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            observe_command(args[0], started)
+
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """
+    Connection pool which waits for a free connection when max_connections are in use
+    and reports pool usage to metrics. The in-use gauge is read from the pool after every
+    checkout and release, so failed checkouts which release the connection themselves
+    can't make it drift.
+    """
+
+    def make_connection(self):
+        REDIS_POOL_CREATED.inc()
+        return super().make_connection()
+
+
+    async def get_connection(self, *args, **kwargs):
+        try:
+            return await super().get_connection(*args, **kwargs)
+        finally:
+            REDIS_POOL_IN_USE.set(len(self._in_use_connections))
+
+
+    async def release(self, connection):
+        await super().release(connection)
+        REDIS_POOL_IN_USE.set(len(self._in_use_connections))
+
+
+pool: InstrumentedConnectionPool | None = None
+
+
+def init_cache(**kwargs) -> InstrumentedConnectionPool:
+    """
+    The init_cache function creates the connection pool shared by the whole application:
+    cache, rate limiter, revocation list sync and pub/sub. It is called by the lifespan.
+
+    :param kwargs: Options overriding settings, e.g. connection_class for tests
+    :return: The connection pool
+    :doc-author: Trelent
+    """
+    global pool
+    options = dict(host=settings.redis.host,
+                   port=settings.redis.port,
+                   db=0,
+                   max_connections=settings.redis.max_connections,
+                   timeout=settings.redis.pool_timeout,
+                   socket_timeout=settings.redis.socket_timeout,
+                   socket_connect_timeout=settings.redis.socket_connect_timeout,
+                   health_check_interval=settings.redis.health_check_interval)
+    options.update(kwargs)
+    pool = InstrumentedConnectionPool(**options)
+    REDIS_POOL_MAX.set(settings.redis.max_connections)
+
+    return pool
+
+
+async def close_cache() -> None:
+    """
+    The close_cache function disconnects all connections of the pool on shutdown.
+
+    :return: None
+    :doc-author: Trelent
+    """
+    global pool
+    if pool is not None:
+        await pool.disconnect()
+        pool = None
+
+
+def get_client() -> redis.Redis:
+    """
+    The get_client function returns a client bound to the shared pool.
+    Creating the client is cheap, connections are taken from the pool per command.
+
+    :return: Redis client
+    :doc-author: Trelent
+    """
+    if pool is None:
+        init_cache()
+
+    return InstrumentedRedis(connection_pool=pool)
+
 
 async def get_cache():
-    return await redis.Redis(host=settings.redis.host, 
-                             port=settings.redis.port, 
-                             db=0,)
\ No newline at end of file
+    return get_client()
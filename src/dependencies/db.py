@@ -1,22 +1,103 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.orm import declarative_base
 
 
 from ..models.user import Base
 from ..conf.config import settings
+from ..services.metrics import DB_SESSION_REQUESTS, DB_CONNECTIONS_ACQUIRED
+from ..services.telemetry import instrument_engine
+
 
+logger = logging.getLogger(__name__)
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = instrument_engine(create_engine(SQLALCHEMY_DATABASE_URL))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+class LazySession:
+    def __init__(self, factory: sessionmaker) -> None:
+        """
+        The __init__ function keeps the session factory, the session is created on first use.
+
+        :param self: Represent the instance of the class
+        :param factory: sessionmaker: Factory of sessions
+        :return: None
+        :doc-author: Trelent
+        """
+        self._factory = factory
+        self._session: Session | None = None
+        self.connections = 0
+
+
+    @property
+    def session(self) -> Session:
+        """
+        The session property creates the session on first access and counts
+        the connections it acquires from the pool.
+
+        :param self: Represent the instance of the class
+        :return: The real Session
+        :doc-author: Trelent
+        """
+        if self._session is None:
+            self._session = self._factory()
+            event.listen(self._session, "after_begin", self._on_begin)
+
+        return self._session
+
+
+    def _on_begin(self, session, transaction, connection) -> None:
+        self.connections += 1
+        DB_CONNECTIONS_ACQUIRED.inc()
+
+
+    def __getattr__(self, name: str):
+        return getattr(self.session, name)
+
+
+    @property
+    def usage(self) -> str:
+        """
+        The usage property tells how far the request went into the database.
+
+        :param self: Represent the instance of the class
+        :return: unused if no session was created, session if no connection was acquired, otherwise connection
+        :doc-author: Trelent
+        """
+        if self._session is None:
+            return "unused"
+
+        return "connection" if self.connections else "session"
+
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+
+
 # Dependency
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    """
+    The get_db function yields a session which acquires a connection only when it is used,
+    so requests answered from cache do not touch the database.
+    Usage of the session is stored in request.state.db and counted in metrics.
+
+    :param request: Request: Store the session usage of the request
+    :return: A LazySession
+    :doc-author: Trelent
+    """
+    db = LazySession(SessionLocal)
+    request.state.db = db
     try:
         yield db
     finally:
         db.close()
-
+        DB_SESSION_REQUESTS.labels(db.usage).inc()
+        logger.debug("%s %s: database %s, %d connections",
+                     request.method, request.url.path, db.usage, db.connections)
@@ -0,0 +1,213 @@
+import hashlib
+import math
+from typing import Callable
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from redis.exceptions import NoScriptError
+from sqlalchemy.orm import Session
+
+from src.dependencies.cache import get_cache
+from src.dependencies.db import get_db
+from src.dependencies.token_user import oauth2_scheme, get_access_payload, resolve_user, user_cache_key
+from src.conf.config import settings, RateLimitPolicy
+from src.models.user import User
+from src.services.metrics import RATE_LIMIT_REJECTED
+from src.services.token_bucket import LocalRateLimiter
+from src.services.tracing import tracer
+
+
+# KEYS[1] - cached user, KEYS[2] - rate limit window, KEYS[3] - burst window
+# ARGV[1] - limit, ARGV[2] - window in milliseconds, ARGV[3] - request cost,
+# ARGV[4] - burst (0 without burst), ARGV[5] - burst window in milliseconds
+# Returns cached user (or nil), 1 if allowed else 0, used budget, milliseconds to window reset,
+# milliseconds to wait if not allowed
+PRINCIPAL_RATE_LIMIT_SCRIPT = """
+local user = redis.call('GET', KEYS[1])
+local limit = tonumber(ARGV[1])
+local cost = tonumber(ARGV[3])
+local burst = tonumber(ARGV[4])
+local current = tonumber(redis.call('GET', KEYS[2]) or '0')
+local ttl = redis.call('PTTL', KEYS[2])
+if current + cost > limit then
+    return {user, 0, current, ttl, ttl}
+end
+if burst > 0 then
+    local spent = tonumber(redis.call('GET', KEYS[3]) or '0')
+    local burst_ttl = redis.call('PTTL', KEYS[3])
+    if spent + cost > burst then
+        return {user, 0, current, ttl, burst_ttl}
+    end
+    redis.call('INCRBY', KEYS[3], cost)
+    if burst_ttl < 0 then
+        redis.call('PEXPIRE', KEYS[3], ARGV[5])
+    end
+end
+current = redis.call('INCRBY', KEYS[2], cost)
+if ttl < 0 then
+    redis.call('PEXPIRE', KEYS[2], ARGV[2])
+    ttl = tonumber(ARGV[2])
+end
+return {user, 1, current, ttl, 0}
+"""
+PRINCIPAL_RATE_LIMIT_SHA = hashlib.sha1(PRINCIPAL_RATE_LIMIT_SCRIPT.encode()).hexdigest()
+
+
+async def fetch_principal(cache, email: str, rate_key: str, times: int, milliseconds: int, cost: int=1,
+                          burst: int | None=None):
+    """
+    The fetch_principal function reads the cached user and updates the rate limit window
+    atomically in one round trip to redis.
+    With a burst the budget spent at once is limited too: no more than burst units
+    are spent in the time the window budget needs to accrue them.
+
+    :param cache: Redis client
+    :param email: str: Email of the user
+    :param rate_key: str: Key of the rate limit window
+    :param times: int: Allowed budget per window
+    :param milliseconds: int: Window length
+    :param cost: int: Cost of the request
+    :param burst: int | None: Budget which may be spent at once, not limited by default
+    :return: A tuple of cached user snapshot, allowed flag, used budget, milliseconds to window reset
+             and milliseconds to wait if not allowed
+    :doc-author: Trelent
+    """
+    burst_milliseconds = max(1, milliseconds * burst // times) if burst else 0
+    keys_and_args = (3, user_cache_key(email), rate_key, f"{rate_key}:burst",
+                     times, milliseconds, cost, burst or 0, burst_milliseconds)
+    try:
+        snapshot, allowed, current, ttl, wait = await cache.evalsha(PRINCIPAL_RATE_LIMIT_SHA, *keys_and_args)
+    except NoScriptError:
+        snapshot, allowed, current, ttl, wait = await cache.eval(PRINCIPAL_RATE_LIMIT_SCRIPT, *keys_and_args)
+
+    return snapshot, bool(allowed), int(current), int(ttl), int(wait)
+
+
+local_limiter = LocalRateLimiter(slack=settings.rate_limit.local_slack, max_keys=settings.rate_limit.local_max_keys)
+
+
+def rate_limit_headers(policy: RateLimitPolicy, times: int, remaining: int, reset: float) -> dict[str, str]:
+    """
+    The rate_limit_headers function builds RateLimit-* headers of the current window.
+
+    :param policy: RateLimitPolicy: Policy of the route
+    :param times: int: Budget of the user tier per window
+    :param remaining: int: Budget left in the window
+    :param reset: float: Seconds to the window reset
+    :return: A dictionary of headers
+    :doc-author: Trelent
+    """
+    return {"RateLimit-Limit": str(times),
+            "RateLimit-Remaining": str(max(0, remaining)),
+            "RateLimit-Reset": str(max(0, math.ceil(reset))),
+            "RateLimit-Policy": f"{times};w={policy.seconds}"}
+
+
+def too_many_requests(retry_after: float, headers: dict[str, str] | None=None) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                         detail="Too Many Requests",
+                         headers={**(headers or {}), "Retry-After": str(max(1, math.ceil(retry_after)))})
+
+
+class RateLimitedUser:
+    def __init__(self, policy: str, cost: Callable[[Request], int] | int=1) -> None:
+        """
+        The __init__ function takes the rate limit policy of the route from settings.
+        Budget is counted in cost units, so an expensive request spends more of it than a cheap one.
+
+        :param self: Represent the instance of the class
+        :param policy: str: Name of the policy in settings.rate_limit.policies, the default policy if missing
+        :param cost: Callable[[Request], int] | int: Cost of a request or a function which computes it from the request
+        :return: None
+        :doc-author: Trelent
+        """
+        policies = settings.rate_limit.policies
+        self.name = policy
+        self.policy = policies.get(policy) or policies["default"]
+        self.cost = cost
+
+
+    @property
+    def description(self) -> str:
+        """
+        The description property describes the policy for the route documentation.
+
+        :param self: Represent the instance of the class
+        :return: A string with the budget of the route
+        :doc-author: Trelent
+        """
+        cost = "depends on the request" if callable(self.cost) else str(self.cost)
+        burst = f", {self.policy.burst} units at once" if self.policy.burst else ""
+        return f"No more than {self.policy.times} units per {self.policy.seconds} seconds{burst}, request cost {cost}"
+
+
+    def request_cost(self, request: Request, times: int) -> int:
+        """
+        The request_cost function computes the cost of the request.
+        The cost is kept between 1 and the budget, so any request can pass in an empty window.
+
+        :param self: Represent the instance of the class
+        :param request: Request: Incoming request
+        :param times: int: Budget per window, or the burst if it is smaller
+        :return: The cost of the request
+        :doc-author: Trelent
+        """
+        cost = self.cost(request) if callable(self.cost) else self.cost
+
+        return min(max(1, cost), times)
+
+
+    async def __call__(self,
+                       request: Request,
+                       response: Response,
+                       token: str=Depends(oauth2_scheme),
+                       cache=Depends(get_cache),
+                       db: Session=Depends(get_db)) -> User:
+        """
+        The __call__ function authenticates the user and applies the rate limit.
+        The limit is counted per authenticated user (not per client IP) and policy,
+        the budget of the policy and its burst are scaled by the user tier from the access token.
+        Cached user, the limit window and the burst window are handled by one lua script, so a request
+        needs a single round trip to redis unless the user is not cached yet.
+        Clients which are clearly over the limit are rejected by the local limiter
+        without any redis call.
+
+        :param self: Represent the instance of the class
+        :param request: Request: Get the request to compute its cost
+        :param response: Response: Set RateLimit-* headers
+        :param token: str: Access token
+        :param cache: Redis client
+        :param db: Session: Database session used on cache miss
+        :return: The authenticated User
+        :doc-author: Trelent
+        """
+        payload = await get_access_payload(token, cache)
+        email = payload.get("sub", "")
+        principal = payload.get("uid") or email
+        rate_key = f"ratelimit:{principal}:{self.name}"
+
+        factor = settings.rate_limit.tiers.get(payload.get("tier") or "default", 1.0)
+        times = max(1, int(self.policy.times * factor))
+        burst = self.policy.burst and min(times, max(1, int(self.policy.burst * factor)))
+        cost = self.request_cost(request, burst or times)
+
+        with tracer.span("rate_limit", policy=self.name, cost=cost):
+            retry_after = local_limiter.acquire(rate_key, times, self.policy.seconds, cost, burst)
+            if retry_after:
+                RATE_LIMIT_REJECTED.labels("local").inc()
+                raise too_many_requests(retry_after, rate_limit_headers(self.policy, times, 0, retry_after))
+
+            snapshot, allowed, current, ttl, wait = await fetch_principal(cache, email, rate_key, times,
+                                                                          self.policy.seconds * 1000, cost, burst)
+            headers = rate_limit_headers(self.policy, times, times - current, ttl / 1000)
+
+            if current >= times:
+                local_limiter.block(rate_key, ttl / 1000)
+
+            if not allowed:
+                RATE_LIMIT_REJECTED.labels("redis").inc()
+                raise too_many_requests(wait / 1000, headers)
+
+        response.headers.update(headers)
+
+        with tracer.span("user.lookup", cached=snapshot is not None):
+            return await resolve_user(email, snapshot, cache, db)
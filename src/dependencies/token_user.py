@@ -1,4 +1,3 @@
-import redis.asyncio as redis
 import pickle
 
 from fastapi.security import OAuth2PasswordBearer
@@ -6,10 +5,12 @@ from fastapi import Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from src.dependencies.db import get_db
-from src.services.auth import auth_token
-from src.repository.users_repo import UserRepo
+from src.services.auth import auth_token, is_admin
+from src.services.revocation import revocation_list
+from src.repository.users_repo import UserRepo, USER_CACHE_TTL, user_cache_key
 from src.models.user import User
 from src.dependencies.cache import get_cache
+from src.services.tracing import tracer
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/signin")
@@ -23,16 +24,41 @@ async def get_user_by_token(token: str = Depends(oauth2_scheme),
 
     Args:
         token (str, optional): encoded JWT-token string. Defaults to Depends(oauth2_scheme).
+        cache (Redis, optional): redis client. Defaults to Depends(get_cache).
         db (Session, optional): database session object. Defaults to Depends(get_db).
 
     Raises:
         HTTPException: 401 invalid email
         HTTPException: 401 invalid token
         HTTPException: 401 invalid token scope
+        HTTPException: 401 revoked token
 
     Returns:
         User: user object from database
     """
+    payload = await get_access_payload(token, cache)
+    email = payload.get("sub", "")
+
+    with tracer.span("user.lookup"):
+        return await resolve_user(email, await cache.get(user_cache_key(email)), cache, db)
+
+
+async def get_access_payload(token: str, cache) -> dict:
+    """Return payload of a valid not revoked access token
+        else raise HTTPException with status code 401
+
+    Args:
+        token (str): encoded JWT-token string.
+        cache (Redis): redis client.
+
+    Raises:
+        HTTPException: 401 invalid token
+        HTTPException: 401 invalid token scope
+        HTTPException: 401 revoked token
+
+    Returns:
+        dict: token payload
+    """
     payload = await auth_token.get_payload(token)
 
     if not payload:
@@ -49,14 +75,38 @@ async def get_user_by_token(token: str = Depends(oauth2_scheme),
                             headers={"WWW-Authenticate": "Bearer"},
                             )
     
-    email = payload.get("sub", "")
+    jti = payload.get("jti")
+    if jti and await revocation_list.is_revoked(cache, jti):
+        raise HTTPException(
+                            status_code=status.HTTP_401_UNAUTHORIZED,
+                            detail="Token revoked",
+                            headers={"WWW-Authenticate": "Bearer"},
+                            )
+    
+    return payload
+
+
+async def resolve_user(email: str, snapshot: bytes | None, cache, db: Session) -> User:
+    """Return user from the cached snapshot, on cache miss load user from database
+        and cache it, raise HTTPException with status code 401 if there is no such user
+
+    Args:
+        email (str): email from the token.
+        snapshot (bytes | None): cached user or None.
+        cache (Redis): redis client.
+        db (Session): database session object.
+
+    Raises:
+        HTTPException: 401 invalid email
 
-    user = await cache.get(f"user:{email}")
-    if user:
-        user = pickle.loads(user)
+    Returns:
+        User: user object
+    """
+    if snapshot:
+        user = pickle.loads(snapshot)
     else:
         user = await UserRepo(db).get_user_by_email(email)
-        await cache.setex(f"user:{email}", 900, pickle.dumps(user))
+        await cache.setex(user_cache_key(email), USER_CACHE_TTL, pickle.dumps(user))
         
 
     if not user:
@@ -69,8 +119,20 @@ async def get_user_by_token(token: str = Depends(oauth2_scheme),
     return user
 
 
+async def get_admin_user(user: User=Depends(get_user_by_token)) -> User:
+    """Return the current user if it is an administrator
+        else raise HTTPException with status code 403
 
+    Args:
+        user (User, optional): current user. Defaults to Depends(get_user_by_token).
 
-    
+    Raises:
+        HTTPException: 403 not an administrator
 
+    Returns:
+        User: user object
+    """
+    if not is_admin(user.email):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
 
+    return user
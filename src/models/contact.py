@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Date, UniqueConstraint, ForeignKey
+from sqlalchemy import Column, String, Date, UniqueConstraint, ForeignKey, Index, extract
 from sqlalchemy.orm import relationship
 from .base_models import BaseModel, Base
 
@@ -15,7 +15,8 @@ class Contact(BaseModel):
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     user = relationship('User', back_populates='contacts')
 
-    __table_args__ = (UniqueConstraint(first_name, last_name, email, user_id, name="first_last_email"),)
+    __table_args__ = (UniqueConstraint(first_name, last_name, email, user_id, name="first_last_email"),
+                      Index("ix_contacts_birth_month_day", extract("month", birth_date), extract("day", birth_date)))
 
 
 
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text, JSON, Index, func, text
+
+from .base_models import BaseModel
+
+
+PENDING = "pending"
+SENT = "sent"
+#Dead letters: messages which failed max attempts, see python -m src.workers.outbox --requeue-dead
+DEAD = "dead"
+
+
+class OutboxMessage(BaseModel):
+    __tablename__ = "outbox"
+
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(10), nullable=False, default=PENDING, server_default=PENDING)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    available_at = Column(DateTime, nullable=False, default=func.now(), server_default=func.now())
+    last_error = Column(Text)
+    sent_at = Column(DateTime)
+    #Unique key of messages which must be sent once, e.g. a daily digest
+    dedup_key = Column(String(120), unique=True)
+
+    __table_args__ = (Index("ix_outbox_pending", available_at, postgresql_where=text("status = 'pending'")),)
@@ -13,8 +13,10 @@ class User(BaseModel):
     refresh_token = Column(String(255))
     contacts = relationship('Contact', back_populates='user')
     avatar = Column(String(), nullable=True)
-    #Cloudinary public_id. It's also recommended to store by developers of cloudinary
+    #Cloudinary public_id or content hash of the local media storage. It's also recommended to store by developers of cloudinary
     avatar_cld = Column(String(150), nullable=True)
     confirmed = Column(Boolean(), default=False, nullable=True)
+    #Rate limit tier, see settings.rate_limit.tiers
+    tier = Column(String(20), default="default", server_default="default", nullable=False)
 
 
@@ -1,19 +1,50 @@
 
+import logging
+
 from sqlalchemy.orm import Session
 from typing import List
-from datetime import timedelta, datetime
-from sqlalchemy.sql import func, or_, and_, extract
+from datetime import timedelta, datetime, date
+import redis.asyncio as redis
+from sqlalchemy.sql import func, or_, and_, extract, tuple_
 
 from src.models.contact import Contact
 from src.models.user import User
 from src.schemas.contact_schema import ContactModel
+from src.services.birthday_calendar import birthday_calendar, upcoming_days
+from src.services.metrics import BIRTHDAY_CALENDAR_READS, BIRTHDAY_CALENDAR_ERRORS
+
+
+logger = logging.getLogger(__name__)
+
+
+def birthday_filter(days: list[tuple[int, int]]):
+    """
+    The birthday_filter function returns a condition on contacts born on the given days.
+    It matches the expressions of the ix_contacts_birth_month_day index.
 
+    :param days: list[tuple[int, int]]: (month, day) pairs, see upcoming_days
+    :return: SQL condition
+    :doc-author: Trelent
+    """
+    return tuple_(extract("month", Contact.birth_date), extract("day", Contact.birth_date)).in_(days)
 
 
 class ContactRepo:
-    def __init__(self, db: Session, user: User):
+    def __init__(self, db: Session, user: User, cache: redis.Redis | None=None):
+        """
+        The __init__ function sets the database session and the owner of contacts.
+        With a cache the birthday calendar of the owner is kept up to date.
+
+        :param self: Represent the instance of the class
+        :param db: Session: Database session
+        :param user: User: Owner of the contacts
+        :param cache: redis.Redis | None: Redis client of the birthday calendar
+        :return: None
+        :doc-author: Trelent
+        """
         self.db = db
         self.user = user
+        self.cache = cache
 
 
     async def get_contacts(self, 
@@ -66,6 +97,7 @@ class ContactRepo:
         self.db.add(contact)
         self.db.commit()
         self.db.refresh(contact)
+        await self.update_calendar(contact.id, contact.birth_date)
         
         return contact
 
@@ -120,6 +152,7 @@ class ContactRepo:
         upd_contact.description = contact.description
 
         self.db.commit()
+        await self.update_calendar(upd_contact.id, upd_contact.birth_date)
 
         return upd_contact
 
@@ -144,33 +177,99 @@ class ContactRepo:
 
         self.db.delete(contact)
         self.db.commit()
+        await self.update_calendar(contact.id, None)
 
         return contact
 
 
+    async def update_calendar(self, contact_id: int, birth_date: date | None) -> None:
+        """
+        The update_calendar function puts the changed contact on the birthday calendar,
+        a contact without birthday is removed. It runs after the commit, so a redis error
+        is only logged and counted, the nightly rebuild repairs the calendar.
+
+        :param self: Represent the instance of the class
+        :param contact_id: int: Id of the changed contact
+        :param birth_date: date | None: New birthday, None for deleted contacts
+        :return: None
+        :doc-author: Trelent
+        """
+        if self.cache is None:
+            return
+
+        try:
+            await birthday_calendar.add(self.cache, self.user.id, contact_id, birth_date)
+        except redis.RedisError as err:
+            BIRTHDAY_CALENDAR_ERRORS.labels("update").inc()
+            logger.warning("Birthday calendar of user %s was not updated: %r", self.user.id, err)
+
+
     async def get_birthdays(self, days_count: int) -> List[Contact]:
         """
         The get_birthdays function returns a list of contacts whose 
         birthdays are within the next `days` days.
+        With a cache the ids are read from the birthday calendar, which is built
+        on first use, and the contacts are fetched by id in one query.
         
         :param self: Refer to the class instance itself
         :param days: int: Specify how many days in the future to look for birthdays
         :return: A list of Contact objects
         :doc-author: Trelent
         """
-        start_date = datetime.now()
         days = days_count if days_count < 10 else 10
-        dates = []
-        for i in range(0,days):
-            delta = timedelta(days=i)
-            new_date = start_date + delta
-            dates.append(new_date.strftime("%d.%m"))
+        if self.cache is not None:
+            try:
+                contacts = await self.get_birthdays_from_calendar(days)
+            except redis.RedisError as err:
+                BIRTHDAY_CALENDAR_ERRORS.labels("read").inc()
+                logger.warning("Birthday calendar of user %s is not available: %r", self.user.id, err)
+                contacts = None
+            if contacts is not None:
+                return contacts
+
+        dates = upcoming_days(date.today(), days)
 
         contacts = self.db.query(Contact)\
-            .where(and_(Contact.user_id == self.user.id, func.to_char(Contact.birth_date, "DD.MM").in_(dates)))\
+            .where(and_(Contact.user_id == self.user.id, birthday_filter(dates)))\
             .all()
         
         return contacts
+
+
+    async def build_birthday_calendar(self) -> bool:
+        """
+        The build_birthday_calendar function builds the calendar of the user from Postgres.
+        The version is read before the contacts, a contact changed meanwhile makes the build fail
+        instead of writing a calendar without the change.
+
+        :param self: Represent the instance of the class
+        :return: True if the calendar was built
+        :doc-author: Trelent
+        """
+        version = await birthday_calendar.version(self.cache, self.user.id)
+        birthdays = self.db.query(Contact.id, Contact.birth_date).filter(Contact.user_id == self.user.id).all()
+
+        return await birthday_calendar.build(self.cache, self.user.id, birthdays, version)
+
+
+    async def get_birthdays_from_calendar(self, days: int) -> List[Contact] | None:
+        ids = await birthday_calendar.upcoming(self.cache, self.user.id, date.today(), days)
+        if ids is None:
+            BIRTHDAY_CALENDAR_READS.labels("miss").inc()
+            if not await self.build_birthday_calendar():
+                BIRTHDAY_CALENDAR_READS.labels("conflict").inc()
+                return None
+            ids = await birthday_calendar.upcoming(self.cache, self.user.id, date.today(), days)
+        else:
+            BIRTHDAY_CALENDAR_READS.labels("hit").inc()
+
+        if not ids:
+            return []
+
+        contacts = {contact.id: contact
+                    for contact in self.db.query(Contact).filter(Contact.id.in_(ids), Contact.user_id == self.user.id)}
+
+        return [contacts[pk] for pk in ids if pk in contacts]
         
         
     async def get_unique_contact(self, contact: Contact | ContactModel):
@@ -0,0 +1,134 @@
+from datetime import timedelta
+
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from src.models.outbox import OutboxMessage, PENDING, SENT, DEAD
+
+
+class OutboxRepo:
+    def __init__(self, db: Session):
+        """
+        The __init__ function sets the database session of the repository.
+
+        :param self: Represent the instance of the class
+        :param db: Session: Database session
+        :return: None
+        :doc-author: Trelent
+        """
+        self.db = db
+
+
+    def enqueue(self, kind: str, payload: dict, commit: bool=False) -> OutboxMessage:
+        """
+        The enqueue function adds a message to the session. By default it is not committed,
+        so it is written in the same transaction as the change which caused it.
+
+        :param self: Represent the instance of the class
+        :param kind: str: Handler of the message, e.g. confirm_email
+        :param payload: dict: Keyword arguments of the handler
+        :param commit: bool: Commit the message at once
+        :return: The new OutboxMessage
+        :doc-author: Trelent
+        """
+        message = OutboxMessage(kind=kind, payload=payload)
+        self.db.add(message)
+        if commit:
+            self.db.commit()
+
+        return message
+
+
+    def enqueue_unique(self, messages: list[tuple[str, dict, str]]) -> int:
+        """
+        The enqueue_unique function inserts messages with a dedup key in one statement and commits them.
+        Messages whose key is already in the outbox are skipped, so a repeated run sends nothing twice.
+
+        :param self: Represent the instance of the class
+        :param messages: list[tuple[str, dict, str]]: Kind, payload and dedup key of every message
+        :return: Number of inserted messages
+        :doc-author: Trelent
+        """
+        if not messages:
+            return 0
+
+        statement = (insert(OutboxMessage)
+                     .values([{"kind": kind, "payload": payload, "dedup_key": key} for kind, payload, key in messages])
+                     .on_conflict_do_nothing(index_elements=[OutboxMessage.dedup_key]))
+        result = self.db.execute(statement)
+        self.db.commit()
+
+        return result.rowcount
+
+
+    def claim(self, limit: int, lease: float) -> list:
+        """
+        The claim function takes due pending messages and hides them from other workers
+        for the lease time. Rows locked by other workers are skipped.
+        A message of a crashed worker becomes due again when the lease expires.
+
+        :param self: Represent the instance of the class
+        :param limit: int: Largest number of messages to take
+        :param lease: float: Seconds the messages are hidden
+        :return: A list of rows with id, kind, payload and attempts
+        :doc-author: Trelent
+        """
+        due = (select(OutboxMessage.id)
+               .where(OutboxMessage.status == PENDING, OutboxMessage.available_at <= func.now())
+               .order_by(OutboxMessage.available_at)
+               .limit(limit)
+               .with_for_update(skip_locked=True))
+        claimed = (update(OutboxMessage)
+                   .where(OutboxMessage.id.in_(due.scalar_subquery()))
+                   .values(attempts=OutboxMessage.attempts + 1,
+                           available_at=func.now() + timedelta(seconds=lease))
+                   .returning(OutboxMessage.id, OutboxMessage.kind, OutboxMessage.payload, OutboxMessage.attempts))
+        rows = self.db.execute(claimed).all()
+        self.db.commit()
+
+        return rows
+
+
+    def mark_sent(self, message_id: int) -> None:
+        self.db.execute(update(OutboxMessage)
+                        .where(OutboxMessage.id == message_id)
+                        .values(status=SENT, sent_at=func.now(), last_error=None))
+        self.db.commit()
+
+
+    def mark_failed(self, message_id: int, error: str, retry_in: float | None) -> None:
+        """
+        The mark_failed function schedules the next attempt or moves the message to dead letters.
+
+        :param self: Represent the instance of the class
+        :param message_id: int: Id of the message
+        :param error: str: Description of the failure
+        :param retry_in: float | None: Seconds to the next attempt, None for a dead letter
+        :return: None
+        :doc-author: Trelent
+        """
+        values = {"last_error": error[:2000]}
+        if retry_in is None:
+            values["status"] = DEAD
+        else:
+            values["available_at"] = func.now() + timedelta(seconds=retry_in)
+
+        self.db.execute(update(OutboxMessage).where(OutboxMessage.id == message_id).values(**values))
+        self.db.commit()
+
+
+    def requeue_dead(self) -> int:
+        """
+        The requeue_dead function returns dead letters to the queue with a fresh attempts budget.
+
+        :param self: Represent the instance of the class
+        :return: Number of requeued messages
+        :doc-author: Trelent
+        """
+        result = self.db.execute(update(OutboxMessage)
+                                 .where(OutboxMessage.status == DEAD)
+                                 .values(status=PENDING, attempts=0, available_at=func.now()))
+        self.db.commit()
+
+        return result.rowcount
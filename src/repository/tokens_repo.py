@@ -0,0 +1,139 @@
+"""
+Refresh token families stored in Redis.
+
+Every signin starts a new family (one per device). A refresh token carries the
+family id (``fid``) and its own id (``jti``). Only the latest ``jti`` of a family
+can be exchanged; presenting an older one means the token was stolen and reused,
+so the whole family is revoked.
+
+Refresh tokens issued before families were introduced have no ``fid`` claim and
+are checked against the ``users.refresh_token`` column once, then moved to a
+family and the column is cleared. When the refresh token life time has passed
+after deploy the column is not used anymore and can be dropped.
+"""
+import secrets
+from datetime import timedelta
+from enum import Enum
+
+
+REFRESH_LIFE_TIME = timedelta(days=1)
+
+ROTATE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], 'jti')
+if not current then
+    return 0
+end
+if current ~= ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    redis.call('SREM', KEYS[2], ARGV[3])
+    return -1
+end
+redis.call('HSET', KEYS[1], 'jti', ARGV[2])
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+redis.call('PEXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+
+class RotateResult(Enum):
+    ROTATED = 1
+    UNKNOWN = 0
+    REUSED = -1
+
+
+class RefreshTokenRepo:
+    def __init__(self, cache, life_time: timedelta=REFRESH_LIFE_TIME):
+        """
+        The __init__ function stores the redis client used to keep token families.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param life_time: timedelta: Life time of the family since the last rotation
+        :return: An instance of the class
+        :doc-author: Trelent
+        """
+        self.cache = cache
+        self.ttl = int(life_time.total_seconds() * 1000)
+
+
+    @staticmethod
+    def family_key(fid: str) -> str:
+        return f"refresh:family:{fid}"
+
+
+    @staticmethod
+    def user_key(email: str) -> str:
+        return f"refresh:user:{email}"
+
+
+    async def create_family(self, email: str) -> tuple[str, str]:
+        """
+        The create_family function starts a new token family for the user.
+
+        :param self: Represent the instance of the class
+        :param email: str: Owner of the family
+        :return: A tuple of the family id and the id of the first refresh token
+        :doc-author: Trelent
+        """
+        fid = secrets.token_urlsafe(16)
+        jti = secrets.token_urlsafe(16)
+
+        async with self.cache.pipeline(transaction=True) as pipe:
+            pipe.hset(self.family_key(fid), mapping={"sub": email, "jti": jti})
+            pipe.pexpire(self.family_key(fid), self.ttl)
+            pipe.sadd(self.user_key(email), fid)
+            pipe.pexpire(self.user_key(email), self.ttl)
+            await pipe.execute()
+
+        return fid, jti
+
+
+    async def rotate(self, email: str, fid: str, jti: str) -> tuple[RotateResult, str | None]:
+        """
+        The rotate function exchanges the presented refresh token id for a new one.
+        Check and update are done atomically by a lua script in one round trip.
+
+        :param self: Represent the instance of the class
+        :param email: str: Owner of the family
+        :param fid: str: Family id from the refresh token
+        :param jti: str: Token id from the refresh token
+        :return: Rotation result and the new token id if rotated
+        :doc-author: Trelent
+        """
+        new_jti = secrets.token_urlsafe(16)
+        result = await self.cache.eval(ROTATE_SCRIPT, 2,
+                                       self.family_key(fid), self.user_key(email),
+                                       jti, new_jti, fid, self.ttl)
+        result = RotateResult(int(result))
+
+        return result, new_jti if result is RotateResult.ROTATED else None
+
+
+    async def revoke_family(self, email: str, fid: str) -> None:
+        """
+        The revoke_family function signs out a single device.
+
+        :param self: Represent the instance of the class
+        :param email: str: Owner of the family
+        :param fid: str: Family id
+        :return: None
+        :doc-author: Trelent
+        """
+        async with self.cache.pipeline(transaction=True) as pipe:
+            pipe.delete(self.family_key(fid))
+            pipe.srem(self.user_key(email), fid)
+            await pipe.execute()
+
+
+    async def revoke_user(self, email: str) -> None:
+        """
+        The revoke_user function signs out all devices of the user.
+
+        :param self: Represent the instance of the class
+        :param email: str: Owner of the families
+        :return: None
+        :doc-author: Trelent
+        """
+        fids = await self.cache.smembers(self.user_key(email))
+        keys = [self.family_key(fid.decode() if isinstance(fid, bytes) else fid) for fid in fids]
+        await self.cache.delete(self.user_key(email), *keys)
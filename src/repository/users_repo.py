@@ -1,15 +1,25 @@
 
+import pickle
+from typing import Iterable
+
 from sqlalchemy.orm import Session
 
 from src.models.user import User
+from src.repository.outbox_repo import OutboxRepo
 from src.schemas.user_schema import UserModel, UserUpdatePassword
 from src.services.hash_handler import pwd_handler
-from src.services.media import MediaCloud
+from src.services.media import media_storage
+
+
+USER_CACHE_TTL = 900
+
 
+def user_cache_key(email: str) -> str:
+    return f"user:{email}"
 
 
 class UserRepo:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, cache=None):
         """
         The __init__ function is called when the class is instantiated.
         It allows us to set up any attributes that we want to use in the class.
@@ -18,18 +28,41 @@ class UserRepo:
         
         :param self: Represent the instance of the class
         :param db: Session: Pass in the database session to the class
+        :param cache: Redis client with user snapshots, updates keep the snapshot fresh if it is passed
         :return: An instance of the class
         :doc-author: Trelent
         """
         self.db = db
+        self.cache = cache
+
+
+    async def cache_user(self, user: User) -> User:
+        """
+        The cache_user function stores the snapshot of the user which is read by authenticated requests
+        instead of the database.
+        
+        :param self: Represent the instance of the class
+        :param user: User: Committed user object
+        :return: The same User object
+        :doc-author: Trelent
+        """
+        if self.cache is None or user is None:
+            return user
+        
+        self.db.refresh(user)
+        await self.cache.setex(user_cache_key(user.email), USER_CACHE_TTL, pickle.dumps(user))
+
+        return user
 
 
-    async def create_user(self, user: UserModel):
+    async def create_user(self, user: UserModel, messages: Iterable[tuple[str, dict]]=()):
         """
         The create_user function creates a new user in the database.
+        Outbox messages are written in the same transaction, so they exist if and only if the user does.
 
         :param self: Represent the instance of a class
         :param user: UserModel: Pass in the user object that was created by the usermodel class
+        :param messages: Iterable[tuple[str, dict]]: Kinds and payloads of outbox messages
         :return: A new User object
         :doc-author: Trelent
         """
@@ -38,8 +71,11 @@ class UserRepo:
         if not is_unique:
             return None
         
-        new_user = User(email=user.username, password=pwd_handler.get_password_hash(user.password))
+        new_user = User(email=user.username, password=await pwd_handler.get_password_hash_async(user.password))
         self.db.add(new_user)
+        outbox = OutboxRepo(self.db)
+        for kind, payload in messages:
+            outbox.enqueue(kind, payload)
         self.db.commit()
         self.db.refresh(new_user)
         
@@ -57,13 +93,32 @@ class UserRepo:
         :return: The user object with the new password and a refresh token
         :doc-author: Trelent
         """
-        user.password = pwd_handler.get_password_hash(password)
+        user.password = await pwd_handler.get_password_hash_async(password)
         user.refresh_token = None
         self.db.commit()
+        await self.cache_user(user)
 
         return user            
 
 
+    async def rehash_password(self, user: User, hashed_password: str) -> User:
+        """
+        The rehash_password function replaces the stored hash of the same password
+        with a hash made by the current scheme and cost. Sessions are not revoked.
+        
+        :param self: Represent the instance of the class
+        :param user: User: Pass in the user object that is being updated
+        :param hashed_password: str: New hash of the user's password
+        :return: The updated User object
+        :doc-author: Trelent
+        """
+        user.password = hashed_password
+        self.db.commit()
+        await self.cache_user(user)
+
+        return user
+
+
     async def get_user_by_email(self, email) -> User:
         """
         The get_user_by_email function returns a user object based on the email address provided.
@@ -89,6 +144,7 @@ class UserRepo:
         """
         user.refresh_token = refresh_token
         self.db.commit()
+        await self.cache_user(user)
 
         return user
 
@@ -106,26 +162,28 @@ class UserRepo:
         if user:
             user.confirmed = True
             self.db.commit()
+            await self.cache_user(user)
 
         return user
 
 
-    async def update_avatar(self, email, file) -> User:
+    async def update_avatar(self, email, data: bytes) -> User:
         """
         The update_avatar function updates the avatar of a user.
         
         :param self: Represent the instance of the class
         :param email: Get the user from the database
-        :param file: Upload the avatar to cloudinary
+        :param data: bytes: Prepared avatar image to store in the media storage
         :return: The updated User object
         :doc-author: Trelent
         """
         user = await self.get_user_by_email(email)
         
-        avatar = await MediaCloud().avatar_upload(file, public_id=user.avatar_cld)
+        avatar = await media_storage.avatar_upload(data, public_id=user.avatar_cld)
         user.avatar = avatar.url
         user.avatar_cld = avatar.public_id
         self.db.commit()
+        await self.cache_user(user)
 
         return user
 
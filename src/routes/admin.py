@@ -0,0 +1,152 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from src.conf.config import settings
+from src.dependencies.token_user import get_admin_user
+from src.models.user import User
+from src.schemas.admin_schema import (ProfileResponse, TracemallocStatus, SnapshotResponse,
+                                      AllocationDiff, ObjectCounts)
+from src.services.file_response import RangedFileResponse
+from src.services.memory import memory_profiler, object_counts, TracingNotStarted, UnknownSnapshot
+from src.services.profiling import profile_store
+
+
+router = APIRouter(prefix='/admin', tags=["admin"])
+
+
+@router.get("/profiles", response_model=list[ProfileResponse])
+async def list_profiles(admin: User=Depends(get_admin_user)):
+    """
+    The list_profiles function returns stored request profiles, the latest first.
+    A request is profiled when an administrator sends it with the profiling header,
+    see src.services.profiling.
+
+    :param admin: User: Current user, only administrators are allowed
+    :return: A list of ProfileResponse
+    :doc-author: Trelent
+    """
+    profiles = []
+    for path in profile_store.list():
+        stat = path.stat()
+        profiles.append(ProfileResponse(name=path.name, size=stat.st_size,
+                                        created_at=datetime.fromtimestamp(stat.st_mtime, timezone.utc)))
+
+    return profiles
+
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str, admin: User=Depends(get_admin_user)):
+    """
+    The download_profile function sends a stored profile. HTML profiles open in a browser,
+    speedscope files are opened at https://www.speedscope.app.
+
+    :param name: str: File name of the profile from the X-Profile-Id header
+    :param admin: User: Current user, only administrators are allowed
+    :return: The profile file
+    :doc-author: Trelent
+    """
+    path = profile_store.path(name)
+    if path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+
+    media_type = "text/html" if name.endswith(".html") else "application/json"
+
+    return RangedFileResponse(path, media_type=media_type,
+                              headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+
+@router.get("/memory/tracemalloc", response_model=TracemallocStatus)
+async def tracemalloc_status(admin: User=Depends(get_admin_user)):
+    """
+    The tracemalloc_status function shows if allocations are traced, traced memory and kept snapshots.
+    Tracing state is per worker, pid tells which worker answered.
+
+    :param admin: User: Current user, only administrators are allowed
+    :return: TracemallocStatus
+    :doc-author: Trelent
+    """
+    return memory_profiler.status()
+
+
+@router.post("/memory/tracemalloc/start", response_model=TracemallocStatus)
+async def start_tracemalloc(frames: int=Query(default=None, ge=1, le=100, description="Depth of stored tracebacks"),
+                            admin: User=Depends(get_admin_user)):
+    """
+    The start_tracemalloc function starts tracing allocations of the worker.
+    Every allocation is slower while tracing runs, stop it when snapshots are taken.
+
+    :param frames: int: Depth of stored tracebacks, settings.memory.frames by default
+    :param admin: User: Current user, only administrators are allowed
+    :return: TracemallocStatus
+    :doc-author: Trelent
+    """
+    memory_profiler.start(frames or settings.memory.frames)
+
+    return memory_profiler.status()
+
+
+@router.post("/memory/tracemalloc/stop", response_model=TracemallocStatus)
+async def stop_tracemalloc(admin: User=Depends(get_admin_user)):
+    """
+    The stop_tracemalloc function stops tracing allocations and drops the snapshots.
+
+    :param admin: User: Current user, only administrators are allowed
+    :return: TracemallocStatus
+    :doc-author: Trelent
+    """
+    memory_profiler.stop()
+
+    return memory_profiler.status()
+
+
+@router.post("/memory/snapshots", response_model=SnapshotResponse, status_code=status.HTTP_201_CREATED)
+async def take_snapshot(admin: User=Depends(get_admin_user)):
+    """
+    The take_snapshot function takes a snapshot of traced allocations of the worker.
+
+    :param admin: User: Current user, only administrators are allowed
+    :return: SnapshotResponse with the id of the snapshot
+    :doc-author: Trelent
+    """
+    try:
+        return await asyncio.to_thread(memory_profiler.take_snapshot)
+    except TracingNotStarted as err:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(err))
+
+
+@router.get("/memory/snapshots/diff", response_model=list[AllocationDiff])
+async def diff_snapshots(first: int, second: int,
+                         group_by: Literal["lineno", "filename"]="lineno",
+                         limit: int=Query(default=None, ge=1, le=1000),
+                         admin: User=Depends(get_admin_user)):
+    """
+    The diff_snapshots function returns the locations where memory grew the most between two snapshots.
+
+    :param first: int: Id of the earlier snapshot
+    :param second: int: Id of the later snapshot
+    :param group_by: str: Group allocations by lineno or filename
+    :param limit: int: Number of locations, settings.memory.top by default
+    :param admin: User: Current user, only administrators are allowed
+    :return: A list of AllocationDiff
+    :doc-author: Trelent
+    """
+    try:
+        return await asyncio.to_thread(memory_profiler.diff, first, second, group_by, limit or settings.memory.top)
+    except UnknownSnapshot as err:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Snapshot {err.args[0]} not found")
+
+
+@router.get("/memory/objects", response_model=ObjectCounts)
+async def get_object_counts(admin: User=Depends(get_admin_user)):
+    """
+    The get_object_counts function counts live ORM entities, sessions with their identity maps
+    and Redis clients, pools and connections of the worker.
+
+    :param admin: User: Current user, only administrators are allowed
+    :return: ObjectCounts
+    :doc-author: Trelent
+    """
+    return await asyncio.to_thread(object_counts)
@@ -1,9 +1,10 @@
+import math
+
 from fastapi import (APIRouter,
                     HTTPException, 
                     Depends, 
                     status, 
                     Security, 
-                    BackgroundTasks, 
                     Request,
                     )
 from fastapi.security import (OAuth2PasswordRequestForm,
@@ -15,17 +16,24 @@ from sqlalchemy.orm import Session
 
 
 from src.dependencies.db import get_db
+from src.dependencies.cache import get_cache
+from src.dependencies.token_user import resolve_user
 from src.services.auth import auth_token
 from src.services.hash_handler import pwd_handler
-from src.repository.users_repo import UserRepo
+from src.repository.users_repo import UserRepo, user_cache_key
+from src.repository.tokens_repo import RefreshTokenRepo, RotateResult
+from src.repository.outbox_repo import OutboxRepo
 from src.schemas.user_schema import (UserModel, 
                                     UserCreatedResponse,
                                     TokenModel, 
                                     UserMail, 
                                     ResetPassword, 
                                     PasswordResponse,
+                                    LogoutModel,
                                     )
-from src.services.mail import password_reset_email, confirm_email
+from src.services.revocation import revocation_list
+from src.services.login_throttle import login_throttle
+from src.services.metrics import PASSWORD_REHASHED
 
 
 router = APIRouter(prefix='/auth', tags=["auth"])
@@ -34,59 +42,93 @@ security = HTTPBearer()
 
 @router.post("/signup", response_model=UserCreatedResponse, status_code=status.HTTP_201_CREATED)
 async def signup(user: UserModel, 
-                 background_tasks: BackgroundTasks,
                  request: Request, 
+                 cache=Depends(get_cache),
                  db: Session=Depends(get_db)):
     """
     The signup function creates a new user and sends an email to the user's email address.
         The function returns the newly created UserModel object.
+        The email is written to the outbox with the user and sent by the outbox worker.
     
     
     :param user: UserModel: Get the user data from the request body
-    :param background_tasks: BackgroundTasks: Add tasks to the background task queue
     :param request: Request: Get the base_url of the application
+    :param cache: Redis client to drop the unknown email mark
     :param db: Session: Get the database session
     :return: A dictionary with a single key, user
     :doc-author: Trelent
     """
-    new_user = await UserRepo(db).create_user(user)
+    confirmation = ("confirm_email", {"email": user.username, "host": str(request.base_url)})
+    new_user = await UserRepo(db).create_user(user, messages=[confirmation])
     if new_user is None:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="user is already exists")
-
-    background_tasks.add_task(confirm_email, new_user, request.base_url)
+    
+    await login_throttle.forget_unknown(cache, new_user.email)
     
     return {"user": new_user}
 
 
 @router.post("/signin", response_model=TokenModel)
-async def signin(request_user: OAuth2PasswordRequestForm=Depends(), db: Session=Depends(get_db)) -> TokenModel:
+async def signin(request: Request,
+                 request_user: OAuth2PasswordRequestForm=Depends(), 
+                 cache=Depends(get_cache), 
+                 db: Session=Depends(get_db)) -> TokenModel:
     """
     The signin function is used to sign in a user.
     It takes the email and password of the user as input, and returns an access token and refresh token
-    if successful.
+    if successful. Every signin starts a new refresh token family, so a user can have several devices.
+    If the stored hash uses an old scheme or cost, it is replaced by a new hash of the same password.
+    Failed attempts lock the account and the client IP with a growing delay. Locked attempts
+    and attempts with a known unregistered email are rejected before the database and the password check.
     
     
+    :param request: Request: Get the client IP
     :param request_user: OAuth2PasswordRequestForm: Get the username and password from the request body
+    :param cache: Redis client to store the refresh token family and failed attempts
     :param db: Session: Get the database session
     :return: A tokenmodel object
     :doc-author: Trelent
     """
-    user_repo = UserRepo(db)
-    cur_user = await user_repo.get_user_by_email(request_user.username)
+    email = request_user.username
+    ip = request.client.host if request.client else "unknown"
+
+    retry_after, unknown = await login_throttle.check(cache, email, ip)
+    if retry_after:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, 
+                            detail="Too many failed attempts",
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+    
+    if unknown:
+        await login_throttle.fail(cache, email, ip, "unknown_email")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
+
+    user_repo = UserRepo(db, cache)
+    cur_user = await user_repo.get_user_by_email(email)
 
     if cur_user is None:
+        await login_throttle.remember_unknown(cache, email)
+        await login_throttle.fail(cache, email, ip, "unknown_email")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     
     if not cur_user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
 
-    if not pwd_handler.verify_password(request_user.password, cur_user.password):
+    verified, new_hash = await pwd_handler.verify_and_update_async(request_user.password, cur_user.password)
+    if not verified:
+        await login_throttle.fail(cache, email, ip, "password")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     
-    access_token = await auth_token.create_access_token(data={"sub": cur_user.email})
-    refresh_token = await auth_token.create_refresh_token(data={"sub": cur_user.email})
+    await login_throttle.succeed(cache, email)
+
+    if new_hash:
+        await user_repo.rehash_password(cur_user, new_hash)
+        PASSWORD_REHASHED.inc()
+    
+    fid, jti = await RefreshTokenRepo(cache).create_family(cur_user.email)
 
-    await user_repo.update_refresh_token(cur_user, refresh_token)
+    claims = {"sub": cur_user.email, "uid": cur_user.id, "tier": cur_user.tier}
+    access_token = await auth_token.create_access_token(data=claims)
+    refresh_token = await auth_token.create_refresh_token(data={**claims, "fid": fid, "jti": jti})
     
     return {"access_token": access_token,
             "refresh_token": refresh_token,
@@ -94,25 +136,65 @@ async def signin(request_user: OAuth2PasswordRequestForm=Depends(), db: Session=
     
 
 @router.get("/refresh_token", response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials=Security(security), db: Session=Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials=Security(security), 
+                        cache=Depends(get_cache), 
+                        db: Session=Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token.
     It takes in a valid refresh token and returns a new access_token, otherwise raises an HTTPException 401 
     and updated refresh_token pair. The old tokens are invalidated.
+    Refresh token families live in redis, so refreshing needs no database writes.
+    Reuse of an old refresh token revokes the whole family.
+    User id and rate limit tier are read from the cached user snapshot (or the database),
+    so changes of the tier apply to the next refreshed pair.
     
     :param credentials: HTTPAuthorizationCredentials: Get the authorization header from the request
-    :param db: Session: Pass the database session to the function
+    :param cache: Redis client with refresh token families
+    :param db: Session: Pass the database session to the function (on cache miss and for legacy tokens)
     :return: A dict that contains the new access_token, refresh_token and token_type
     :doc-author: Trelent
     """
     token = credentials.credentials
     payload = await auth_token.get_payload(token)
-    if payload is None:
+    if payload is None or payload.get("scope") != "refresh_token":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     
+    email = payload.get("sub", "")
+    tokens_repo = RefreshTokenRepo(cache)
+
+    if payload.get("fid") is None:
+        uid, tier, fid, jti = await legacy_refresh_token(token, email, tokens_repo, db)
+    else:
+        fid = payload["fid"]
+        result, jti = await tokens_repo.rotate(email, fid, payload.get("jti", ""))
+        if result is not RotateResult.ROTATED:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        user = await resolve_user(email, await cache.get(user_cache_key(email)), cache, db)
+        uid, tier = user.id, user.tier
+    
+    claims = {"sub": email, "uid": uid, "tier": tier}
+    access_token = await auth_token.create_access_token(claims)
+    refresh_token = await auth_token.create_refresh_token({**claims, "fid": fid, "jti": jti})
 
-    user_repo = UserRepo(db)
-    user = await user_repo.get_user_by_email(payload.get("sub", ""))
+    return {"access_token": access_token,
+            "refresh_token": refresh_token,
+            "token_type": "bearer"}
+
+
+async def legacy_refresh_token(token: str, email: str, tokens_repo: RefreshTokenRepo, db: Session):
+    """
+    The legacy_refresh_token function checks a refresh token issued before token families
+    against the users.refresh_token column and moves it to a new family.
+    
+    :param token: str: Refresh token without family id
+    :param email: str: Email from the token
+    :param tokens_repo: RefreshTokenRepo: Repository of token families
+    :param db: Session: Get the database session
+    :return: A tuple of the user id, rate limit tier, new family id and token id
+    :doc-author: Trelent
+    """
+    user_repo = UserRepo(db, tokens_repo.cache)
+    user = await user_repo.get_user_by_email(email)
 
     if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
@@ -121,19 +203,43 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials=Security(secur
         await user_repo.update_refresh_token(user, None)
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
     
-    access_token = await auth_token.create_access_token({"sub": user.email})
-    refresh_token = await auth_token.create_refresh_token({"sub": user.email})
+    await user_repo.update_refresh_token(user, None)
+    fid, jti = await tokens_repo.create_family(email)
 
-    await user_repo.update_refresh_token(user, refresh_token)
+    return user.id, user.tier, fid, jti
 
-    return {"access_token": access_token,
-            "refresh_token": refresh_token,
-            "token_type": "bearer"}
+
+@router.post("/logout", response_model=PasswordResponse)
+async def logout(body: LogoutModel=LogoutModel(),
+                 credentials: HTTPAuthorizationCredentials=Security(security),
+                 cache=Depends(get_cache)):
+    """
+    The logout function revokes the access token before it expires.
+    If the refresh token is passed, its token family (device) is signed out too.
+    
+    :param body: LogoutModel: Optional refresh token of the same device
+    :param credentials: HTTPAuthorizationCredentials: Get the access token from the authorization header
+    :param cache: Redis client
+    :return: A dictionary with two keys: result and detail
+    :doc-author: Trelent
+    """
+    payload = await auth_token.get_payload(credentials.credentials)
+    if payload is None or payload.get("scope") != "access_token" or payload.get("jti") is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    
+    await revocation_list.revoke(cache, payload["jti"], payload["exp"])
+
+    if body.refresh_token:
+        refresh_payload = await auth_token.get_payload(body.refresh_token)
+        if refresh_payload and refresh_payload.get("fid") and refresh_payload.get("sub") == payload.get("sub"):
+            await RefreshTokenRepo(cache).revoke_family(payload["sub"], refresh_payload["fid"])
+
+    return {"result": True,
+            "detail": "Signed out"}
 
 
 @router.post("/forgot_password", response_model=PasswordResponse)
 async def forgot_password(data: UserMail,
-                          background_tasks: BackgroundTasks, 
                           request: Request, 
                           db: Session=Depends(get_db)):
     """
@@ -141,9 +247,9 @@ async def forgot_password(data: UserMail,
     
     The forgot_password function will send an email with a link that allows the user 
     to reset their password. The link expires after 30 minutes. 
+    The email is written to the outbox and sent by the outbox worker.
     
     :param data: UserMail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: To get the base url of the application
     :param db: Session: Get the database session
     :return: dict with result and detail key
@@ -151,7 +257,8 @@ async def forgot_password(data: UserMail,
     """
     user = await UserRepo(db).get_user_by_email(data.email)
     if user:
-        background_tasks.add_task(password_reset_email, user, request.base_url)
+        OutboxRepo(db).enqueue("password_reset_email", {"email": user.email, "host": str(request.base_url)},
+                               commit=True)
     
     return {"result": True,
             "detail": "We've sent you an email with instructions for password reset"}
@@ -185,14 +292,15 @@ async def reset_token_validate(token: str,
 
 
 @router.post("/reset_password/complete", response_model=PasswordResponse)
-async def reset_password(data: ResetPassword, db: Session=Depends(get_db)):
+async def reset_password(data: ResetPassword, cache=Depends(get_cache), db: Session=Depends(get_db)):
     """
     The reset_password function is used to reset a user's password.
     It takes in the ResetPassword data model and returns a dict with the result of the operation.
-    If the token is invalid raises HTTPException 400
+    If the token is invalid raises HTTPException 400. All devices of the user are signed out.
     
     
     :param data: ResetPassword: Get the token and password from the request body
+    :param cache: Redis client with refresh token families
     :param db: Session: Get the database session
     :return: A dictionary with two keys: result and detail
     :doc-author: Trelent
@@ -203,26 +311,28 @@ async def reset_password(data: ResetPassword, db: Session=Depends(get_db)):
         payload.get("scope") is not None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
     
-    user_repo = UserRepo(db)
+    user_repo = UserRepo(db, cache)
     user = await user_repo.get_user_by_email(payload.get("sub", ""))
 
     if not user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
 
     await user_repo.update_password(user, data.password)
+    await RefreshTokenRepo(cache).revoke_user(user.email)
 
     return {"result": True,
             "detail": "Password was successfully reseted"}
 
 
 @router.get("/confirmed_email/{token}")
-async def confirmed_email(token: str,  db: Session = Depends(get_db)):
+async def confirmed_email(token: str, cache=Depends(get_cache), db: Session = Depends(get_db)):
     """
     The confirmed_email function confirms the user's email address
     by temporary token sent to user by mail.
     Returns True if the token is valid, and False raises HTTPException code 400.
     
     :param token: str: Get the token from the url
+    :param cache: Redis client to refresh the cached user
     :param db: Session: Get the database session
     :return: A dictionary with two keys: result and detail
     :doc-author: Trelent
@@ -233,7 +343,7 @@ async def confirmed_email(token: str,  db: Session = Depends(get_db)):
         payload.get("scope") is not None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
     
-    user_repo = UserRepo(db)
+    user_repo = UserRepo(db, cache)
     user = await user_repo.get_user_by_email(payload.get("sub", ""))
 
     if not user:
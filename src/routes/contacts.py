@@ -1,31 +1,68 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
+import math
+
+from fastapi import APIRouter, HTTPException, Depends, Request, status, Path, Query
 from typing import List, Annotated
-from fastapi_limiter.depends import RateLimiter
 from sqlalchemy.orm import Session
 from pydantic import EmailStr
+import redis.asyncio as redis
 
 
 from src.dependencies.db import get_db
-from src.dependencies.token_user import get_user_by_token
+from src.dependencies.cache import get_cache
+from src.dependencies.rate_limit import RateLimitedUser
 from src.repository.contacts_repo import ContactRepo
 from src.schemas.contact_schema import ContactModel, ContactResponse
 from src.models.user import User
 
-TIMES = 5
-SECONDS = 60
+CONTACTS_PER_UNIT = 25
+
+
+def list_cost(request: Request) -> int:
+    """
+    The list_cost function scales the cost of a contacts list by the requested page size.
+
+    :param request: Request: Get the limit query parameter
+    :return: One unit per started CONTACTS_PER_UNIT contacts
+    :doc-author: Trelent
+    """
+    try:
+        limit = int(request.query_params.get("limit", 100))
+    except ValueError:
+        return 1
+
+    return math.ceil(limit / CONTACTS_PER_UNIT)
+
+
+def birthdays_cost(request: Request) -> int:
+    """
+    The birthdays_cost function scales the cost of a birthdays scan by the period in days.
+
+    :param request: Request: Get the days query parameter
+    :return: One unit per day
+    :doc-author: Trelent
+    """
+    try:
+        return int(request.query_params.get("days", 7))
+    except ValueError:
+        return 1
+
+
+list_user = RateLimitedUser("contacts:list", cost=list_cost)
+read_user = RateLimitedUser("contacts:read")
+write_user = RateLimitedUser("contacts:write")
+birthdays_user = RateLimitedUser("contacts:birthdays", cost=birthdays_cost)
 
 router = APIRouter(prefix='/contacts', tags=["contacts"])
 
 @router.get("/", 
             response_model=List[ContactResponse],
-            description='No more than 5 requests per minute',
-            dependencies=[Depends(RateLimiter(times=TIMES, seconds=SECONDS))])
+            description=list_user.description)
 async def get_contacts(first_name: str=None, 
                         last_name: str=None, 
                         email: EmailStr=None, 
                         skip: int = 0, 
                         limit: int = 100,
-                        user: User=Depends(get_user_by_token),
+                        user: User=Depends(list_user),
                         db: Session = Depends(get_db)):
     """
     The cget_contacts function returns a list of contacts.
@@ -48,10 +85,10 @@ async def get_contacts(first_name: str=None,
 
 @router.post("/", 
              response_model=ContactResponse, 
-             description='No more than 5 requests per minute',
-             dependencies=[Depends(RateLimiter(times=TIMES, seconds=SECONDS))],
+             description=write_user.description,
              status_code=status.HTTP_201_CREATED)
-async def create_contact(body: ContactModel, user: User=Depends(get_user_by_token), db: Session = Depends(get_db)):
+async def create_contact(body: ContactModel, user: User=Depends(write_user), db: Session = Depends(get_db),
+                         cache: redis.Redis = Depends(get_cache)):
     """
     The create_contact function creates a new contact in the database.
     The function takes a ContactModel object as input and returns the created contact.
@@ -60,10 +97,11 @@ async def create_contact(body: ContactModel, user: User=Depends(get_user_by_toke
     :param body: ContactModel: Validate the data that is sent in the request body
     :param user: User: Get the user_id from the token
     :param db: Session: Pass the database session to the contactrepo class
+    :param cache: redis.Redis: Keep the birthday calendar up to date
     :return: A ContactResponse schema object
     :doc-author: Trelent
     """
-    contact = await ContactRepo(db, user).create_contact(body)
+    contact = await ContactRepo(db, user, cache).create_contact(body)
 
     if contact is None:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, 
@@ -74,31 +112,31 @@ async def create_contact(body: ContactModel, user: User=Depends(get_user_by_toke
 
 @router.get("/birthdays", 
             response_model=List[ContactResponse],
-            description='No more than 5 requests per minute',
-            dependencies=[Depends(RateLimiter(times=TIMES, seconds=SECONDS))])
+            description=birthdays_user.description)
 async def get_birthdays(days: int=Query(default=7, gt=0, lt=10, description="Period in days started from current date"), 
-                         user: User=Depends(get_user_by_token), db: Session = Depends(get_db)):
+                         user: User=Depends(birthdays_user), db: Session = Depends(get_db),
+                         cache: redis.Redis = Depends(get_cache)):
     """
     The get_birthdays function returns a list of contacts with birthdays in the next 7 days.
     
     :param days: int: Specify the period in days from 1 to 10 started from current date
     :param user: User: Get the user object from the token
     :param db: Session: Get the database session
+    :param cache: redis.Redis: Read the birthday calendar
     :return: A list of ContactResponse schema objects
     :doc-author: Trelent
     """
     
-    contacts = await ContactRepo(db, user).get_birthdays(days)
+    contacts = await ContactRepo(db, user, cache).get_birthdays(days)
 
     return contacts
 
 
 @router.get("/{contact_id}", 
             response_model=ContactResponse,
-            description='No more than 5 requests per minute',
-            dependencies=[Depends(RateLimiter(times=TIMES, seconds=SECONDS))])
+            description=read_user.description)
 async def get_contact(contact_id: Annotated[int, Path(title="The ID of the item to get")],
-                       user: User=Depends(get_user_by_token),
+                       user: User=Depends(read_user),
                        db: Session = Depends(get_db)):
     """
     The get_contact function returns a contact by its ID.
@@ -119,13 +157,13 @@ async def get_contact(contact_id: Annotated[int, Path(title="The ID of the item
 
 @router.put("/{contact_id}", 
             response_model=ContactResponse,
-            description='No more than 5 requests per minute',
-            dependencies=[Depends(RateLimiter(times=TIMES, seconds=SECONDS))]
+            description=write_user.description
             )
 async def update_contact(contact_id: Annotated[int, Path(title="The ID of the item to get")], 
                          body: ContactModel, 
-                         user: User=Depends(get_user_by_token),
-                         db: Session = Depends(get_db)):
+                         user: User=Depends(write_user),
+                         db: Session = Depends(get_db),
+                         cache: redis.Redis = Depends(get_cache)):
     """
     The update_contact function updates a contact in the database.
     
@@ -133,10 +171,11 @@ async def update_contact(contact_id: Annotated[int, Path(title="The ID of the it
     :param body: ContactModel: Get the data from the request body
     :param user: User: Get the user from the token (Dependency injection)
     :param db: Session: Get a database session (Dependency injection)
+    :param cache: redis.Redis: Keep the birthday calendar up to date (Dependency injection)
     :return: A ContactResponse schema object
     :doc-author: Trelent
     """
-    contact = await ContactRepo(db, user).update_contact(contact_id, body)
+    contact = await ContactRepo(db, user, cache).update_contact(contact_id, body)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="contact not found")
     
@@ -145,11 +184,11 @@ async def update_contact(contact_id: Annotated[int, Path(title="The ID of the it
 
 @router.delete("/{contact_id}", 
                response_model=ContactResponse,
-               description='No more than 5 requests per minute',
-               dependencies=[Depends(RateLimiter(times=TIMES, seconds=SECONDS))])
+               description=write_user.description)
 async def delete_contact(contact_id: Annotated[int, Path(title="The ID of the item to get")], 
-                         user: User=Depends(get_user_by_token),
-                         db: Session = Depends(get_db)):
+                         user: User=Depends(write_user),
+                         db: Session = Depends(get_db),
+                         cache: redis.Redis = Depends(get_cache)):
     """
     The delete_contact function deletes a contact from the database
     by it's ID
@@ -157,10 +196,11 @@ async def delete_contact(contact_id: Annotated[int, Path(title="The ID of the it
     :param contact_id: Annotated[int: Get the id of the contact to be deleted
     :param user: User: Get the user from the token (Dependency injection)
     :param db: Session: Pass the database session to the contactrepo class (Dependency injection)
+    :param cache: redis.Redis: Keep the birthday calendar up to date (Dependency injection)
     :return: A ContactResponse schema object
     :doc-author: Trelent
     """
-    contact = await ContactRepo(db, user).delete_contact(contact_id)
+    contact = await ContactRepo(db, user, cache).delete_contact(contact_id)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="contact not found")
     
@@ -0,0 +1,53 @@
+import re
+
+from fastapi import APIRouter, HTTPException, Request, Response, status
+
+from src.services.file_response import RangedFileResponse
+from src.services.media import LocalMediaStorage, media_storage
+
+
+router = APIRouter(prefix='/media', tags=["media"])
+
+CONTENT_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+# Urls contain the content hash, so a file under the url never changes
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+
+    return any(tag.strip() in (etag, "*") for tag in header.split(","))
+
+
+@router.api_route("/{content_id}.jpeg", methods=["GET", "HEAD"])
+async def media_file(content_id: str, request: Request):
+    """
+    The media_file function serves a file of the local content addressed media storage.
+    The file is sent with sendfile when the server supports it, single byte ranges are supported.
+    The url changes with the content, so responses are cached forever and the strong ETag
+    is the content hash.
+
+    :param content_id: str: Sha256 hash of the content
+    :param request: Request: Get conditional and Range headers
+    :return: The file, a part of it or 304 Not Modified
+    :doc-author: Trelent
+    """
+    if not isinstance(media_storage, LocalMediaStorage) or not CONTENT_ID_RE.match(content_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+
+    path = media_storage.path(content_id)
+    if not path.is_file():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+
+    etag = f'"{content_id}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        range_header = None
+
+    return RangedFileResponse(path, headers=headers, media_type="image/jpeg", range_header=range_header)
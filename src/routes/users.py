@@ -1,62 +1,89 @@
+import logging
 from typing import Any
 from fastapi import (APIRouter, 
+                     BackgroundTasks,
                      Depends, 
+                     HTTPException,
                      UploadFile, 
                      File,
-                     Request,
+                     status,
                     )
 
-from sqlalchemy.orm import Session
 
 
-from src.dependencies.db import get_db
+from src.dependencies.db import SessionLocal
 from src.dependencies.cache import get_cache
 from src.dependencies.token_user import get_user_by_token
 from src.models.user import User
 from src.repository.users_repo import UserRepo
-from src.schemas.user_schema import UserResponse
+from src.schemas.user_schema import UserResponse, AvatarResponse
+from src.services.images import prepare_avatar_async, InvalidImage
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix='/users', tags=["users"])
 
 
 @router.get("/me", response_model=UserResponse)
-async def current_user(user: User=Depends(get_user_by_token),
-                       db: Session=Depends(get_db)):
+async def current_user(user: User=Depends(get_user_by_token)):
     """
     The current_user function returns the current signin in user.
+    The user comes from the cached snapshot which is kept fresh by UserRepo updates,
+    so a warm request does not query the database.
     
     
     :param user: User: Get the user object from the get_user_by_token function
-    :param db: Session: Pass the database session to the function
     :return: The UserResponse schema object
     :doc-author: Trelent
     """
-    cur_user = await UserRepo(db).get_user_by_email(user.email)
-    return cur_user
+    return user
+
+
+async def upload_avatar(email: str, data: bytes, cache: Any) -> None:
+    """
+    The upload_avatar function uploads the prepared avatar in the background.
+    It runs after the response is sent, so it uses its own database session.
+    
+    :param email: str: Email of the user
+    :param data: bytes: Prepared avatar image
+    :param cache: Redis client to refresh the cached user
+    :return: None
+    :doc-author: Trelent
+    """
+    db = SessionLocal()
+    try:
+        await UserRepo(db, cache).update_avatar(email, data)
+    except Exception:
+        logger.exception("Avatar upload of %s failed", email)
+    finally:
+        db.close()
 
 
-@router.patch("/avatar", response_model=UserResponse)
-async def update_avatar(request: Request,
+@router.patch("/avatar", response_model=AvatarResponse, status_code=status.HTTP_202_ACCEPTED)
+async def update_avatar(background_tasks: BackgroundTasks,
                         file: UploadFile=File(),
                         user: User=Depends(get_user_by_token),
-                        cache: Any=Depends(get_cache),
-                        db: Session = Depends(get_db)):
+                        cache: Any=Depends(get_cache)):
     """
     The update_avatar function updates the avatar of a user.
         The function takes in an UploadFile object, which is a file that has been uploaded to the server. 
         It also takes in a User object, which is obtained by calling get_user_by_token(). 
-        This function returns an updated User object.
+        The image is cropped and encoded locally, the upload finishes in the background,
+        so the function returns the user with a pending status.
     
+    :param background_tasks: BackgroundTasks: Upload the avatar after the response
     :param file: UploadFile: Get the file from the request body
     :param user: User: Get the user's email from the token (Dependency injection)
-    :param cache: Delete the user from the cache (Dependency injection)
-    :param db: Session: Get the database session (Dependency injection)
-    :return: A UserResponse schema object, which is the updated user
+    :param cache: Refresh the cached user (Dependency injection)
+    :return: An AvatarResponse schema object with the current user and pending status
     :doc-author: Trelent
     """
+    try:
+        data = await prepare_avatar_async(await file.read())
+    except InvalidImage:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid image")
     
-    upd_user = await UserRepo(db).update_avatar(user.email, file.file)
-    cache.delete(f"user:{user.email}")
+    background_tasks.add_task(upload_avatar, user.email, data, cache)
     
-    return upd_user
\ No newline at end of file
+    return {"user": user}
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Request, Response, status
+
+from src.conf.config import settings
+from src.services.auth import auth_token
+
+
+router = APIRouter(prefix='/.well-known', tags=["well-known"])
+
+EMPTY_JWKS = b'{"keys":[]}'
+
+
+@router.get("/jwks.json")
+async def jwks(request: Request):
+    """
+    The jwks function returns public keys which are used to sign access tokens.
+    The document is prepared in memory, so it costs neither database nor cache calls.
+    With symmetric algorithms the secret key is never published and the key set is empty.
+
+    :param request: Request: Get the If-None-Match header
+    :return: JSON Web Key Set document
+    :doc-author: Trelent
+    """
+    headers = {"Cache-Control": f"public, max-age={settings.jwt.jwks_max_age}"}
+    keyring = auth_token.keyring
+    if keyring is None:
+        return Response(content=EMPTY_JWKS, media_type="application/json", headers=headers)
+
+    headers["ETag"] = keyring.jwks_etag
+    if request.headers.get("if-none-match") == keyring.jwks_etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(content=keyring.jwks_body, media_type="application/json", headers=headers)
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class ProfileResponse(BaseModel):
+    name: str
+    size: int
+    created_at: datetime
+
+
+class SnapshotResponse(BaseModel):
+    id: int
+    taken_at: datetime
+    size: int
+    count: int
+
+    class Config:
+        from_attributes = True
+
+
+class TracemallocStatus(BaseModel):
+    pid: int
+    tracing: bool
+    frames: int
+    traced: int
+    peak: int
+    overhead: int
+    snapshots: list[SnapshotResponse]
+
+
+class AllocationDiff(BaseModel):
+    location: str
+    size_diff: int
+    size: int
+    count_diff: int
+    count: int
+
+
+class EntityCount(BaseModel):
+    total: int
+    detached: int
+
+
+class RedisObjectCount(BaseModel):
+    clients: int
+    pools: int
+    connections: int
+
+
+class ObjectCounts(BaseModel):
+    pid: int
+    entities: dict[str, EntityCount]
+    sessions: int
+    identity_map: int
+    redis: RedisObjectCount
@@ -21,6 +21,11 @@ class UserCreatedResponse(BaseModel):
     user: UserResponse
     detail: str="User successfully created. Check your email for confirmation."
 
+class AvatarResponse(BaseModel):
+    user: UserResponse
+    status: str = "pending"
+    detail: str = "Avatar is being uploaded"
+
 class UserUpdatePassword(BaseModel):
     curr_password: str
     new_password: str
@@ -32,6 +37,10 @@ class TokenModel(BaseModel):
     token_type: str = "bearer"
 
 
+class LogoutModel(BaseModel):
+    refresh_token: str | None = None
+
+
 class UserMail(BaseModel):
     email: EmailStr
 
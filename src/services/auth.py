@@ -1,3 +1,4 @@
+import secrets
 from jose import jwt, JWTError
 from dotenv import load_dotenv, find_dotenv
 from os import getenv
@@ -8,6 +9,8 @@ from fastapi import HTTPException, status
 
 from ..conf.config import settings
 from src.repository.users_repo import UserRepo
+from src.services.keys import KeyRing, ASYMMETRIC_ALGORITHMS
+from src.services.tracing import traced
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/signin")
@@ -19,6 +22,8 @@ class AuthToken:
         The __init__ function is called when the class is instantiated.
         It sets up the instance of the class with a secret key and an algorithm.
         The secret key should be set to settings.secret_key, which will be imported from settings.py.
+        For asymmetric algorithms (ES256, RS256) tokens are signed by the active key of the key ring
+        and other services can verify them with the public keys from /.well-known/jwks.json.
         
         :param self: Represent the instance of the class
         :return: None
@@ -26,6 +31,56 @@ class AuthToken:
         """
         self.SECRET_KEY = settings.secret_key
         self.ALGORITHM = settings.algorithm or "HS256"
+        self.keyring = None
+        if self.ALGORITHM in ASYMMETRIC_ALGORITHMS:
+            self.keyring = KeyRing(self.ALGORITHM, settings.jwt.keys_dir, settings.jwt.active_kid,
+                                   settings.jwt.reload_interval, settings.jwt.ephemeral_keys)
+
+
+    def encode(self, payload: dict) -> str:
+        """
+        The encode function signs the payload with the secret key or with the active key of the key ring.
+        Asymmetric tokens carry the key id in the kid header.
+        
+        :param self: Represent the instance of the class
+        :param payload: dict: Claims of the token
+        :return: The JWT token string
+        :doc-author: Trelent
+        """
+        if self.keyring is None:
+            return jwt.encode(payload, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        
+        key = self.keyring.active
+        return jwt.encode(payload, key.private_pem, algorithm=key.algorithm, headers={"kid": key.kid})
+
+
+    def decode(self, token: str) -> dict:
+        """
+        The decode function verifies the token signature and returns its claims.
+        Tokens without kid header are verified with the secret key only until
+        settings.jwt.legacy_hs256_until, so tokens issued before switching to an asymmetric
+        algorithm stay valid for a transition period and the secret key can't mint tokens after it.
+        
+        :param self: Represent the instance of the class
+        :param token: str: The JWT token string
+        :return: A dictionary of the payload
+        :doc-author: Trelent
+        """
+        if self.keyring is None:
+            return jwt.decode(token, self.SECRET_KEY, self.ALGORITHM)
+        
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            until = settings.jwt.legacy_hs256_until
+            if until is None or datetime.now(until.tzinfo) >= until:
+                raise JWTError("Token without key id")
+            return jwt.decode(token, self.SECRET_KEY, "HS256")
+        
+        key = self.keyring.get(kid)
+        if key is None:
+            raise JWTError("Unknown signing key")
+        
+        return jwt.decode(token, key.public_jwk, key.algorithm)
 
 
     async def create_access_token(self, data: dict, life_time: timedelta=timedelta(minutes=15)):
@@ -33,6 +88,7 @@ class AuthToken:
         The create_access_token function creates a JWT token with the given payload.
         The function takes in a dictionary of data, and an optional life_time argument.
         The data is a dictionary that can contain any key-value pairs.
+        Every access token gets a unique jti claim, so it can be revoked before it expires.
 
         
         :param self: Represent the instance of the class
@@ -46,9 +102,10 @@ class AuthToken:
         payload.update({
                         "iat": datetime.utcnow(),
                         "exp": datetime.utcnow() + life_time,
-                        "scope": "access_token"
+                        "scope": "access_token",
+                        "jti": secrets.token_urlsafe(16),
                         })
-        token = jwt.encode(payload, self.SECRET_KEY, self.ALGORITHM)
+        token = self.encode(payload)
 
         return token
     
@@ -71,7 +128,7 @@ class AuthToken:
                         "exp": datetime.utcnow() + life_time,
                         "scope": "refresh_token"
                         })
-        refresh_token = jwt.encode(payload, self.SECRET_KEY, self.ALGORITHM)
+        refresh_token = self.encode(payload)
 
         return refresh_token
     
@@ -91,11 +148,12 @@ class AuthToken:
         payload = data.copy()
         expire = datetime.utcnow() + life_time
         payload.update({"iat": datetime.utcnow(), "exp": expire})
-        token = jwt.encode(payload, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        token = self.encode(payload)
         
         return token
     
 
+    @traced("jwt.decode")
     async def get_payload(self, token: str):
         """
         The get_payload function takes a JWT token as an argument and returns the payload of that token.
@@ -107,11 +165,23 @@ class AuthToken:
         :doc-author: Trelent
         """
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, self.ALGORITHM)
+            payload = self.decode(token)
             return payload
         except JWTError:
             return None
 
 
+def is_admin(email: str | None) -> bool:
+    """
+    The is_admin function checks if the user with the email is an administrator,
+    administrators are listed in settings.admin_emails.
+
+    :param email: str | None: Email of the user
+    :return: True for administrators
+    :doc-author: Trelent
+    """
+    return bool(email) and email in settings.admin_emails
+
+
 auth_token = AuthToken()
 
@@ -0,0 +1,211 @@
+"""
+Per user calendar of contact birthdays kept in redis.
+
+Every user has a sorted set of contact ids scored by the day of year of the
+birthday, counted in a leap year so February 29 has its own day. Upcoming
+birthdays are read with one or two ZRANGEBYSCORE (when the period crosses
+the new year) and the contacts are fetched by id in one query.
+
+The set always holds a placeholder member scored 0, so an existing key means
+the calendar of the user is built, even if the user has no birthdays.
+ContactRepo keeps the calendar up to date, ``python -m src.workers.birthday_calendar``
+rebuilds it from Postgres.
+
+Every change bumps a version of the calendar, even when the calendar is not
+built. A build, on first read or by the nightly rebuild, takes the version
+before reading Postgres and writes the calendar only if the version did not
+change meanwhile, so a contact changed during the build is not lost.
+"""
+from calendar import isleap
+from datetime import date, timedelta
+
+import redis.asyncio as redis
+
+
+PLACEHOLDER = "-"
+DAYS_IN_CALENDAR = 366
+
+# KEYS[1] - calendar, KEYS[2] - version, ARGV[1] - score, ARGV[2] - contact id
+# The contact is added only to a built calendar
+ADD_SCRIPT = """
+redis.call('INCR', KEYS[2])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1] - calendar, KEYS[2] - version, ARGV[1] - contact id
+REMOVE_SCRIPT = """
+redis.call('INCR', KEYS[2])
+return redis.call('ZREM', KEYS[1], ARGV[1])
+"""
+
+# KEYS[1] - calendar, KEYS[2] - version, ARGV[1] - expected version, ARGV[2..] - score, member pairs
+# The calendar is replaced only if nothing changed since the version was read
+BUILD_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+for i = 2, #ARGV, 2 do
+    redis.call('ZADD', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+def upcoming_days(start: date, days: int) -> list[tuple[int, int]]:
+    """
+    The upcoming_days function returns (month, day) pairs of `days` days from start.
+    Birthdays on February 29 are celebrated on February 28 in common years.
+
+    :param start: date: First day
+    :param days: int: Number of days
+    :return: A list of (month, day) tuples
+    :doc-author: Trelent
+    """
+    result = []
+    for i in range(days):
+        day = start + timedelta(days=i)
+        result.append((day.month, day.day))
+        if (day.month, day.day) == (2, 28) and not isleap(day.year):
+            result.append((2, 29))
+
+    return result
+
+
+def calendar_key(user_id: int) -> str:
+    return f"calendar:birthdays:{user_id}"
+
+
+def version_key(user_id: int) -> str:
+    return f"calendar:birthdays:{user_id}:version"
+
+
+def day_of_year(month: int, day: int) -> int:
+    """
+    The day_of_year function returns the number of the day in a leap year, 1 to 366.
+
+    :param month: int: Month of the birthday
+    :param day: int: Day of the birthday
+    :return: Score of the birthday
+    :doc-author: Trelent
+    """
+    return date(2000, month, day).timetuple().tm_yday
+
+
+class BirthdayCalendar:
+
+    async def add(self, cache: redis.Redis, user_id: int, contact_id: int, birth_date: date | None) -> None:
+        """
+        The add function puts the contact on the calendar or moves it to the new birthday.
+        A calendar which is not built yet is left alone, it is built from Postgres on first read.
+
+        :param self: Represent the instance of the class
+        :param cache: redis.Redis: Redis client
+        :param user_id: int: Owner of the contact
+        :param contact_id: int: Id of the contact
+        :param birth_date: date | None: Birthday, a contact without it is removed
+        :return: None
+        :doc-author: Trelent
+        """
+        if birth_date is None:
+            await self.remove(cache, user_id, contact_id)
+            return
+
+        await cache.eval(ADD_SCRIPT, 2, calendar_key(user_id), version_key(user_id),
+                         day_of_year(birth_date.month, birth_date.day), contact_id)
+
+
+    async def remove(self, cache: redis.Redis, user_id: int, contact_id: int) -> None:
+        await cache.eval(REMOVE_SCRIPT, 2, calendar_key(user_id), version_key(user_id), contact_id)
+
+
+    async def version(self, cache: redis.Redis, user_id: int) -> int:
+        """
+        The version function returns the number of changes of the calendar, read it before
+        reading contacts for build.
+
+        :param self: Represent the instance of the class
+        :param cache: redis.Redis: Redis client
+        :param user_id: int: Owner of the contacts
+        :return: Version of the calendar
+        :doc-author: Trelent
+        """
+        return int(await cache.get(version_key(user_id)) or 0)
+
+
+    async def versions(self, cache: redis.Redis, user_ids: list[int]) -> dict[int, int]:
+        """
+        The versions function returns versions of calendars of several users in one round trip.
+
+        :param self: Represent the instance of the class
+        :param cache: redis.Redis: Redis client
+        :param user_ids: list[int]: Owners of the contacts
+        :return: A dict of versions by user id
+        :doc-author: Trelent
+        """
+        values = await cache.mget([version_key(user_id) for user_id in user_ids])
+
+        return {user_id: int(value or 0) for user_id, value in zip(user_ids, values)}
+
+
+    async def build(self, cache: redis.Redis, user_id: int, birthdays: list[tuple[int, date | None]],
+                    version: int) -> bool:
+        """
+        The build function replaces the calendar of the user atomically,
+        if it was not changed since the version was read.
+
+        :param self: Represent the instance of the class
+        :param cache: redis.Redis: Redis client
+        :param user_id: int: Owner of the contacts
+        :param birthdays: list[tuple[int, date | None]]: Ids and birthdays of all contacts of the user
+        :param version: int: Version read before the contacts
+        :return: True if the calendar was written
+        :doc-author: Trelent
+        """
+        scores = {PLACEHOLDER: 0}
+        scores.update({contact_id: day_of_year(birth_date.month, birth_date.day)
+                       for contact_id, birth_date in birthdays if birth_date is not None})
+        pairs = [item for member, score in scores.items() for item in (score, member)]
+
+        return bool(await cache.eval(BUILD_SCRIPT, 2, calendar_key(user_id), version_key(user_id), version, *pairs))
+
+
+    async def upcoming(self, cache: redis.Redis, user_id: int, start: date, days: int) -> list[int] | None:
+        """
+        The upcoming function returns ids of contacts with birthdays in `days` days from start,
+        ordered by the birthday.
+
+        :param self: Represent the instance of the class
+        :param cache: redis.Redis: Redis client
+        :param user_id: int: Owner of the contacts
+        :param start: date: First day of the period
+        :param days: int: Length of the period
+        :return: A list of contact ids, or None if the calendar is not built
+        :doc-author: Trelent
+        """
+        scores = [day_of_year(month, day) for month, day in upcoming_days(start, days)]
+        if not scores:
+            return []
+
+        first, last = scores[0], scores[-1]
+        key = calendar_key(user_id)
+
+        async with cache.pipeline(transaction=False) as pipe:
+            pipe.exists(key)
+            if first <= last:
+                pipe.zrangebyscore(key, first, last)
+            else:
+                pipe.zrangebyscore(key, first, DAYS_IN_CALENDAR)
+                pipe.zrangebyscore(key, 1, last)
+            exists, *ranges = await pipe.execute()
+
+        if not exists:
+            return None
+
+        return [int(member) for members in ranges for member in members]
+
+
+birthday_calendar = BirthdayCalendar()
@@ -0,0 +1,121 @@
+"""
+File response with single byte range support.
+
+The body is sent with the ASGI ``http.response.zerocopysend`` extension (sendfile)
+when the server supports it, otherwise the file is streamed in chunks read
+in a worker thread.
+"""
+import os
+import re
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    The parse_range function parses a single byte range of the Range header.
+    Multiple ranges and malformed headers are ignored, so the whole file is sent.
+
+    :param header: str | None: Value of the Range header
+    :param size: int: Size of the file
+    :return: A tuple of the first byte and the number of bytes, or None for the whole file
+    :doc-author: Trelent
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        start = max(0, size - int(last))
+        end = size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end and last:
+            return None
+
+    if start >= size or size == 0:
+        raise RangeNotSatisfiable(header)
+
+    return start, end - start + 1
+
+
+class RangedFileResponse(Response):
+    chunk_size = 64 * 1024
+
+    def __init__(self,
+                 path: str | os.PathLike,
+                 headers: dict[str, str] | None=None,
+                 media_type: str | None=None,
+                 range_header: str | None=None) -> None:
+        """
+        The __init__ function prepares status and headers of a full or partial response.
+        Unsatisfiable ranges give 416 with the size of the file.
+
+        :param self: Represent the instance of the class
+        :param path: str | os.PathLike: File to send
+        :param headers: dict[str, str] | None: Extra headers, e.g. ETag and Cache-Control
+        :param media_type: str | None: Content type
+        :param range_header: str | None: Value of the Range header if the range should be served
+        :return: None
+        :doc-author: Trelent
+        """
+        self.path = path
+        self.media_type = media_type
+        self.background = None
+        size = os.stat(path).st_size
+
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            byte_range = None
+            self.status_code = 416
+            self.offset, self.count = 0, 0
+        else:
+            self.status_code = 206 if byte_range else 200
+            self.offset, self.count = byte_range or (0, size)
+
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["content-length"] = str(self.count)
+        if self.status_code == 416:
+            self.headers["content-range"] = f"bytes */{size}"
+        elif byte_range:
+            self.headers["content-range"] = f"bytes {self.offset}-{self.offset + self.count - 1}/{size}"
+
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if scope["method"].upper() == "HEAD" or not self.count:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.zerocopysend", "file": file,
+                            "offset": self.offset, "count": self.count, "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.count
+            while remaining:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+        if remaining:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -1,17 +1,84 @@
+import argparse
+import asyncio
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 from passlib.context import CryptContext
+from passlib.registry import get_crypt_handler
+
+from src.conf.config import settings
+from src.services.metrics import HASH_QUEUE_DEPTH, HASH_IN_FLIGHT, HASH_LATENCY, HASH_REJECTED
+from src.services.tracing import tracer
+
+
+class HashPoolSaturated(Exception):
+    pass
+
+
+_worker_context = None
+
+
+def make_context(schemes: list[str], rounds: int | None=None) -> CryptContext:
+    """
+    The make_context function creates a CryptContext which hashes new passwords with
+    the first scheme and the given cost. Hashes made by other schemes or with other
+    cost are reported by needs_update, so they can be upgraded on signin.
+
+    :param schemes: list[str]: Hashing algorithms, the first one is used for new hashes
+    :param rounds: int | None: Cost of the first scheme, passlib default if None
+    :return: A CryptContext object
+    :doc-author: Trelent
+    """
+    options = {}
+    if rounds is not None:
+        options[f"{schemes[0]}__rounds"] = rounds
+
+    return CryptContext(schemes=schemes, deprecated="auto", **options)
+
+
+def _init_worker(schemes: list[str], rounds: int | None) -> None:
+    global _worker_context
+    _worker_context = make_context(schemes, rounds)
+
+
+def _verify(plain_password, hashed_password) -> bool:
+    return _worker_context.verify(plain_password, hashed_password)
+
+
+def _hash(password: str) -> str:
+    return _worker_context.hash(password)
+
+
+def _verify_and_update(plain_password, hashed_password) -> tuple[bool, str | None]:
+    return _worker_context.verify_and_update(plain_password, hashed_password)
+
 
 class PasswordHandler:
-    def __init__(self, schemes: list[str]=["bcrypt"]) -> None:
+    def __init__(self, schemes: list[str]=["bcrypt"], rounds: int | None=None, 
+                 pool_size: int=2, queue_size: int=32) -> None:
         """
         The __init__ function initializes the class with a list of schemes.
         The default is bcrypt, but you can add more if you want to use other hashing algorithms.
-        
+        Async variants of the methods run in a process pool of pool_size processes,
+        no more than queue_size jobs can wait for a free process.
+
         :param self: Represent the instance of the class
         :param schemes: list[str]: Specify the hashing algorithms to be used by the cryptcontext class
+        :param rounds: int | None: Cost of the first scheme, see calibrate
+        :param pool_size: int: Number of processes which hash passwords
+        :param queue_size: int: Number of jobs which can wait for a free process
         :return: None
         :doc-author: Trelent
         """
-        self.pwd_context = CryptContext(schemes=schemes, deprecated="auto")
+        self.schemes = schemes
+        self.rounds = rounds
+        self.pwd_context = make_context(schemes, rounds)
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self._executor = None
+        self._pending = 0
 
     
     def verify_password(self, plain_password, hashed_password) -> bool:
@@ -43,4 +110,166 @@ class PasswordHandler:
         return self.pwd_context.hash(password)
 
 
-pwd_handler = PasswordHandler()
\ No newline at end of file
+    async def verify_password_async(self, plain_password, hashed_password) -> bool:
+        """
+        The verify_password_async function checks the password in the process pool,
+        so the event loop is not blocked while bcrypt is running.
+
+        :param self: Represent the instance of the class
+        :param plain_password: Verify the password entered by the user
+        :param hashed_password: Check if the password is correct
+        :return: A boolean value
+        :doc-author: Trelent
+        """
+        return await self._submit("verify", _verify, plain_password, hashed_password)
+
+
+    async def get_password_hash_async(self, password: str) -> str:
+        """
+        The get_password_hash_async function hashes the password in the process pool,
+        so the event loop is not blocked while bcrypt is running.
+
+        :param self: Represent the instance of the class
+        :param password: str: Pass in the password that is going to be hashed
+        :return: A string of the hashed password
+        :doc-author: Trelent
+        """
+        return await self._submit("hash", _hash, password)
+
+
+    async def verify_and_update_async(self, plain_password, hashed_password) -> tuple[bool, str | None]:
+        """
+        The verify_and_update_async function checks the password in the process pool and
+        if the stored hash uses an old scheme or cost returns a new hash of the password.
+
+        :param self: Represent the instance of the class
+        :param plain_password: Verify the password entered by the user
+        :param hashed_password: Check if the password is correct
+        :return: A tuple of the check result and a new hash or None if the hash is up to date
+        :doc-author: Trelent
+        """
+        return await self._submit("verify", _verify_and_update, plain_password, hashed_password)
+
+
+    async def _submit(self, operation: str, func, *args):
+        """
+        The _submit function runs func in the process pool.
+        If all processes are busy and the queue is full HashPoolSaturated is raised
+        instead of waiting, so the caller can ask the client to retry later.
+
+        :param self: Represent the instance of the class
+        :param operation: str: Name of the operation for metrics
+        :param func: Function to run in the pool
+        :return: Result of func
+        :doc-author: Trelent
+        """
+        if self._pending >= self.pool_size + self.queue_size:
+            HASH_REJECTED.labels(operation).inc()
+            raise HashPoolSaturated(f"Password hash queue is full ({self.queue_size})")
+
+        self._pending += 1
+        self._update_gauges()
+        start = time.perf_counter()
+        try:
+            with tracer.span(f"password.{operation}", queued=self._pending):
+                return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self._pending -= 1
+            self._update_gauges()
+            HASH_LATENCY.labels(operation).observe(time.perf_counter() - start)
+
+
+    def _update_gauges(self) -> None:
+        HASH_IN_FLIGHT.set(self._pending)
+        HASH_QUEUE_DEPTH.set(max(0, self._pending - self.pool_size))
+
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.pool_size,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker,
+                                                 initargs=(self.schemes, self.rounds))
+        return self._executor
+
+
+    def shutdown(self) -> None:
+        """
+        The shutdown function stops the processes of the pool. Queued jobs are cancelled,
+        running ones finish in the background, so the event loop is not blocked.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def calibrate(target_ms: float, scheme: str="bcrypt", samples: int=3) -> list[tuple[int, float]]:
+    """
+    The calibrate function measures hash time on this host for increasing cost
+    until it is over target_ms.
+
+    :param target_ms: float: Desired time of one hash in milliseconds
+    :param scheme: str: Hashing algorithm
+    :param samples: int: Number of hashes measured for every cost
+    :return: A list of tuples of the cost and median hash time in milliseconds
+    :doc-author: Trelent
+    """
+    handler = get_crypt_handler(scheme)
+    if "rounds" not in handler.setting_kwds:
+        raise ValueError(f"{scheme} has no configurable cost")
+
+    rounds = handler.min_rounds if handler.rounds_cost == "log2" else handler.default_rounds // 8
+    results = []
+    while rounds <= handler.max_rounds:
+        context = make_context([scheme], rounds)
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            context.hash("calibration password")
+            timings.append((time.perf_counter() - start) * 1000)
+
+        elapsed = statistics.median(timings)
+        results.append((rounds, elapsed))
+        if elapsed > target_ms:
+            break
+
+        rounds = rounds + 1 if handler.rounds_cost == "log2" else rounds * 2
+
+    return results
+
+
+def recommend(results: list[tuple[int, float]], target_ms: float) -> int:
+    """
+    The recommend function picks the highest cost which is not slower than target_ms.
+
+    :param results: list[tuple[int, float]]: Result of calibrate
+    :param target_ms: float: Desired time of one hash in milliseconds
+    :return: The recommended cost
+    :doc-author: Trelent
+    """
+    fitting = [rounds for rounds, elapsed in results if elapsed <= target_ms]
+
+    return fitting[-1] if fitting else results[0][0]
+
+
+pwd_handler = PasswordHandler(schemes=settings.hash.schemes, 
+                              rounds=settings.hash.rounds,
+                              pool_size=settings.hash.pool_size, 
+                              queue_size=settings.hash.queue_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommend password hash cost for this host")
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--scheme", default=settings.hash.schemes[0])
+    args = parser.parse_args()
+
+    results = calibrate(args.target_ms, args.scheme)
+    for rounds, elapsed in results:
+        print(f"rounds={rounds:<8} {elapsed:8.1f} ms")
+    print(f"HASH_SCHEMES='[\"{args.scheme}\"]' HASH_ROUNDS={recommend(results, args.target_ms)}")
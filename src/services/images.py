@@ -0,0 +1,60 @@
+"""
+Local processing of uploaded images.
+
+Avatars are decoded, cropped to a square thumbnail and re-encoded before upload,
+so only a small JPEG goes over the network. Decoding is CPU bound and runs in a
+worker thread (Pillow releases the GIL while decoding and resampling).
+"""
+import asyncio
+import io
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+
+AVATAR_SIZE = 300
+AVATAR_QUALITY = 85
+# Faces are usually above the center of a portrait, so the crop is biased upwards
+AVATAR_CENTERING = (0.5, 0.35)
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def prepare_avatar(data: bytes, size: int=AVATAR_SIZE, quality: int=AVATAR_QUALITY) -> bytes:
+    """
+    The prepare_avatar function makes a square JPEG thumbnail of the uploaded image.
+
+    :param data: bytes: Uploaded image
+    :param size: int: Side of the thumbnail in pixels
+    :param quality: int: JPEG quality
+    :return: JPEG encoded thumbnail
+    :doc-author: Trelent
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEG is decoded at a reduced scale which is still larger than the thumbnail
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as err:
+        raise InvalidImage(str(err)) from err
+
+    thumbnail = ImageOps.fit(image.convert("RGB"), (size, size), Image.Resampling.LANCZOS,
+                             centering=AVATAR_CENTERING)
+    output = io.BytesIO()
+    thumbnail.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+
+    return output.getvalue()
+
+
+async def prepare_avatar_async(data: bytes, size: int=AVATAR_SIZE, quality: int=AVATAR_QUALITY) -> bytes:
+    """
+    The prepare_avatar_async function runs prepare_avatar in a worker thread.
+
+    :param data: bytes: Uploaded image
+    :param size: int: Side of the thumbnail in pixels
+    :param quality: int: JPEG quality
+    :return: JPEG encoded thumbnail
+    :doc-author: Trelent
+    """
+    return await asyncio.to_thread(prepare_avatar, data, size, quality)
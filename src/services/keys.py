@@ -0,0 +1,297 @@
+"""
+Asymmetric signing keys for JWT tokens.
+
+Keys are stored as PEM files in ``settings.jwt.keys_dir``, the file name (without
+extension) is used as the key id (``kid``). New keys are named with a timestamp
+prefix, so the lexically last file is the newest one and becomes the active
+signing key unless ``settings.jwt.active_kid`` pins another one.
+
+Rotation::
+
+    python -m src.services.keys rotate --dir keys      # add a new key
+    python -m src.services.keys retire <kid> --dir keys # drop an old key
+
+Old keys stay in the JWKS document until they are retired, so tokens signed by
+them can still be verified. Retire a key only after the longest token life time
+has passed since it stopped being active.
+
+Running workers check the directory for changes every ``settings.jwt.reload_interval``
+seconds, and at once (at most every second) when a token names an unknown key, so
+a key rotated on disk is picked up without a restart.
+
+Without keys the application does not start. For development with a single
+process ``settings.jwt.ephemeral_keys`` generates a key in memory instead, tokens
+signed by it are not valid after a restart or in other workers.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import secrets
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk
+
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = ("ES256", "RS256")
+# Minimal time between directory checks caused by unknown key ids
+FORCED_CHECK_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    algorithm: str
+    private_pem: str
+    public_jwk: dict
+
+
+def generate_private_pem(algorithm: str) -> str:
+    """
+    The generate_private_pem function creates a new private key for the given algorithm.
+
+    :param algorithm: str: ES256 or RS256
+    :return: The private key in PKCS8 PEM format
+    :doc-author: Trelent
+    """
+    if algorithm == "ES256":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+    elif algorithm == "RS256":
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+
+    return private_key.private_bytes(serialization.Encoding.PEM,
+                                     serialization.PrivateFormat.PKCS8,
+                                     serialization.NoEncryption()).decode()
+
+
+def new_kid() -> str:
+    return f"{datetime.utcnow():%Y%m%d%H%M%S}-{secrets.token_hex(4)}"
+
+
+class KeyRing:
+    def __init__(self, algorithm: str, keys_dir: str | None=None, active_kid: str | None=None,
+                 reload_interval: float=30.0, ephemeral: bool=False) -> None:
+        """
+        The __init__ function loads signing keys from keys_dir.
+        If there are no keys a ValueError is raised, or with ephemeral an in-memory key
+        is generated. It is only suitable for a single process, because every worker
+        would get its own key.
+
+        :param self: Represent the instance of the class
+        :param algorithm: str: ES256 or RS256
+        :param keys_dir: str | None: Directory with PEM files
+        :param active_kid: str | None: Key id used for signing. Defaults to the newest key
+        :param reload_interval: float: Seconds between checks of keys_dir for changes
+        :param ephemeral: bool: Generate a key when keys_dir has none, for development only
+        :return: None
+        :doc-author: Trelent
+        """
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise ValueError(f"Unsupported signing algorithm: {algorithm}")
+
+        self.algorithm = algorithm
+        self.keys_dir = Path(keys_dir) if keys_dir else None
+        self.active_kid = active_kid
+        self.reload_interval = reload_interval
+        self.ephemeral = ephemeral
+        self._checked = time.monotonic()
+        self._fingerprint = None
+        self.reload()
+
+
+    def reload(self) -> None:
+        """
+        The reload function reads keys from disk and rebuilds the JWKS document.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        keys = {}
+        fingerprint = self.fingerprint()
+        if self.keys_dir and self.keys_dir.is_dir():
+            for path in sorted(self.keys_dir.glob("*.pem")):
+                keys[path.stem] = self._make_key(path.stem, path.read_text())
+
+        if not keys:
+            if not self.ephemeral:
+                raise ValueError(f"No JWT signing keys found in {self.keys_dir}, "
+                                 f"add one with python -m src.services.keys rotate --dir <keys_dir>")
+            logger.warning("No JWT signing keys found, using an ephemeral %s key", self.algorithm)
+            kid = new_kid()
+            keys[kid] = self._make_key(kid, generate_private_pem(self.algorithm))
+
+        active_kid = self.active_kid or list(keys)[-1]
+        if active_kid not in keys:
+            raise ValueError(f"Active key {active_kid} is not found")
+
+        self._keys = keys
+        self._active = keys[active_kid]
+        self._fingerprint = fingerprint
+        self._build_jwks()
+
+
+    def fingerprint(self) -> tuple | None:
+        """
+        The fingerprint function describes key files by names, sizes and modification times.
+
+        :param self: Represent the instance of the class
+        :return: A tuple which changes with the key files, None without keys_dir
+        :doc-author: Trelent
+        """
+        if not self.keys_dir or not self.keys_dir.is_dir():
+            return None
+
+        files = []
+        for path in sorted(self.keys_dir.glob("*.pem")):
+            stat = path.stat()
+            files.append((path.name, stat.st_size, stat.st_mtime_ns))
+
+        return tuple(files)
+
+
+    def refresh(self, force: bool=False) -> bool:
+        """
+        The refresh function reloads keys when key files changed on disk.
+        Checks are throttled, forced checks for unknown key ids too. A failed reload
+        is logged and the loaded keys stay in use.
+
+        :param self: Represent the instance of the class
+        :param force: bool: Check after FORCED_CHECK_INTERVAL instead of reload_interval
+        :return: True if keys were reloaded
+        :doc-author: Trelent
+        """
+        if self.keys_dir is None:
+            return False
+
+        now = time.monotonic()
+        if now - self._checked < (FORCED_CHECK_INTERVAL if force else self.reload_interval):
+            return False
+
+        self._checked = now
+        try:
+            if self.fingerprint() == self._fingerprint:
+                return False
+            self.reload()
+        except Exception:
+            logger.exception("Reloading JWT signing keys from %s failed", self.keys_dir)
+            return False
+
+        logger.info("JWT signing keys reloaded, active key is %s", self._active.kid)
+
+        return True
+
+
+    def rotate(self) -> SigningKey:
+        """
+        The rotate function generates a new key and makes it active.
+        Previous keys are still used for verification.
+
+        :param self: Represent the instance of the class
+        :return: The new active SigningKey
+        :doc-author: Trelent
+        """
+        kid = new_kid()
+        pem = generate_private_pem(self.algorithm)
+        if self.keys_dir:
+            write_key(self.keys_dir, kid, pem)
+
+        key = self._make_key(kid, pem)
+        self._keys[kid] = key
+        self._active = key
+        self.active_kid = kid
+        self._fingerprint = self.fingerprint()
+        self._build_jwks()
+
+        return key
+
+
+    @property
+    def active(self) -> SigningKey:
+        self.refresh()
+        return self._active
+
+
+    def get(self, kid: str) -> SigningKey | None:
+        key = self._keys.get(kid)
+        if key is None and self.refresh(force=True):
+            key = self._keys.get(kid)
+
+        return key
+
+
+    @property
+    def jwks(self) -> dict:
+        self.refresh()
+        return self._jwks
+
+
+    @property
+    def jwks_body(self) -> bytes:
+        self.refresh()
+        return self._jwks_body
+
+
+    @property
+    def jwks_etag(self) -> str:
+        self.refresh()
+        return self._jwks_etag
+
+
+    def _make_key(self, kid: str, pem: str) -> SigningKey:
+        public_jwk = jwk.construct(pem, self.algorithm).public_key().to_dict()
+        public_jwk.update({"kid": kid, "use": "sig", "alg": self.algorithm})
+
+        return SigningKey(kid=kid, algorithm=self.algorithm, private_pem=pem, public_jwk=public_jwk)
+
+
+    def _build_jwks(self) -> None:
+        self._jwks = {"keys": [key.public_jwk for key in self._keys.values()]}
+        self._jwks_body = json.dumps(self._jwks, separators=(",", ":")).encode()
+        self._jwks_etag = '"' + hashlib.sha256(self._jwks_body).hexdigest()[:32] + '"'
+
+
+def write_key(keys_dir: Path, kid: str, pem: str) -> Path:
+    keys_dir.mkdir(parents=True, exist_ok=True)
+    path = keys_dir / f"{kid}.pem"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as file:
+        file.write(pem)
+
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage JWT signing keys")
+    parser.add_argument("command", choices=["rotate", "retire", "list"])
+    parser.add_argument("kid", nargs="?")
+    parser.add_argument("--dir", required=True, help="Directory with PEM files")
+    parser.add_argument("--alg", default="ES256", choices=ASYMMETRIC_ALGORITHMS)
+    args = parser.parse_args()
+
+    keys_dir = Path(args.dir)
+    if args.command == "rotate":
+        kid = new_kid()
+        write_key(keys_dir, kid, generate_private_pem(args.alg))
+        print(kid)
+    elif args.command == "retire":
+        if not args.kid:
+            parser.error("kid is required")
+        (keys_dir / f"{args.kid}.pem").unlink()
+    else:
+        for path in sorted(keys_dir.glob("*.pem")):
+            print(path.stem)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Throttling of failed sign in attempts which protects password hashing CPU.
+
+Failed attempts are counted in redis per account and per client IP. After the
+free attempts are spent, every next failure locks the account (or IP) for an
+exponentially growing delay. Locks are checked before the user lookup and the
+password check, so a throttled attempt costs one redis round trip instead of a
+bcrypt verify.
+
+Emails which are not registered are remembered for a short time, so repeated
+attempts with unknown emails do not reach the database either.
+"""
+import hashlib
+
+from redis.exceptions import NoScriptError
+
+from src.conf.config import settings
+from src.services.metrics import LOGIN_FAILED, LOGIN_THROTTLED, LOGIN_UNKNOWN_EMAIL_CACHED
+
+
+# KEYS[1], KEYS[2] - failures and lock of the account, KEYS[3], KEYS[4] - failures and lock of the IP
+# ARGV[1] - failures window in milliseconds, ARGV[2] - first delay in milliseconds, ARGV[3] - max delay,
+# ARGV[4] - free attempts of the account, ARGV[5] - free attempts of the IP
+# Returns milliseconds of the account lock and of the IP lock (0 if not locked)
+FAILURE_SCRIPT = """
+local function fail(counter, lock, free)
+    local failures = redis.call('INCR', counter)
+    redis.call('PEXPIRE', counter, ARGV[1])
+    if failures <= free then
+        return 0
+    end
+    local delay = math.floor(math.min(tonumber(ARGV[2]) * 2 ^ (failures - free - 1), tonumber(ARGV[3])))
+    redis.call('SET', lock, 1, 'PX', delay)
+    return delay
+end
+return {fail(KEYS[1], KEYS[2], tonumber(ARGV[4])), fail(KEYS[3], KEYS[4], tonumber(ARGV[5]))}
+"""
+FAILURE_SHA = hashlib.sha1(FAILURE_SCRIPT.encode()).hexdigest()
+
+
+def failures_key(scope: str, value: str) -> str:
+    return f"login:failures:{scope}:{value}"
+
+
+def lock_key(scope: str, value: str) -> str:
+    return f"login:lock:{scope}:{value}"
+
+
+def unknown_key(email: str) -> str:
+    return f"login:unknown:{email}"
+
+
+class LoginThrottle:
+    def __init__(self,
+                 account_attempts: int=5,
+                 ip_attempts: int=20,
+                 base_delay: float=1.0,
+                 max_delay: float=900.0,
+                 window: int=3600,
+                 unknown_email_ttl: int=300) -> None:
+        """
+        The __init__ function sets the throttling policy.
+
+        :param self: Represent the instance of the class
+        :param account_attempts: int: Failed attempts of an account before it is locked
+        :param ip_attempts: int: Failed attempts from an IP before it is locked
+        :param base_delay: float: Seconds of the first lock, every next lock is twice longer
+        :param max_delay: float: Longest lock in seconds
+        :param window: int: Seconds without failures after which the counters are forgotten
+        :param unknown_email_ttl: int: Seconds an unknown email is remembered
+        :return: None
+        :doc-author: Trelent
+        """
+        self.account_attempts = account_attempts
+        self.ip_attempts = ip_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.window = window
+        self.unknown_email_ttl = unknown_email_ttl
+
+
+    async def check(self, cache, email: str, ip: str) -> tuple[float, bool]:
+        """
+        The check function reads locks of the account and the IP and the unknown email mark
+        in one round trip.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param email: str: Email from the sign in form
+        :param ip: str: Client IP
+        :return: A tuple of seconds to wait (0 if not locked) and True if the email is known to be unregistered
+        :doc-author: Trelent
+        """
+        async with cache.pipeline(transaction=False) as pipe:
+            pipe.pttl(lock_key("account", email))
+            pipe.pttl(lock_key("ip", ip))
+            pipe.exists(unknown_key(email))
+            account_ttl, ip_ttl, unknown = await pipe.execute()
+
+        for scope, ttl in (("account", account_ttl), ("ip", ip_ttl)):
+            if ttl > 0:
+                LOGIN_THROTTLED.labels(scope).inc()
+                return max(account_ttl, ip_ttl) / 1000, False
+
+        if unknown:
+            LOGIN_UNKNOWN_EMAIL_CACHED.inc()
+
+        return 0.0, bool(unknown)
+
+
+    async def fail(self, cache, email: str, ip: str, reason: str) -> float:
+        """
+        The fail function counts a failed attempt of the account and the IP and locks them
+        when the free attempts are spent.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param email: str: Email from the sign in form
+        :param ip: str: Client IP
+        :param reason: str: Reason of the failure for metrics
+        :return: Seconds of the longest lock set by this failure
+        :doc-author: Trelent
+        """
+        LOGIN_FAILED.labels(reason).inc()
+        keys_and_args = (4, failures_key("account", email), lock_key("account", email),
+                         failures_key("ip", ip), lock_key("ip", ip),
+                         self.window * 1000, int(self.base_delay * 1000), int(self.max_delay * 1000),
+                         self.account_attempts, self.ip_attempts)
+        try:
+            delays = await cache.evalsha(FAILURE_SHA, *keys_and_args)
+        except NoScriptError:
+            delays = await cache.eval(FAILURE_SCRIPT, *keys_and_args)
+
+        return max(int(delay) for delay in delays) / 1000
+
+
+    async def succeed(self, cache, email: str) -> None:
+        """
+        The succeed function forgets failed attempts of the account after a successful sign in.
+        Failures of the IP are kept, an attacker may own one of the accounts.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: Trelent
+        """
+        await cache.delete(failures_key("account", email), lock_key("account", email))
+
+
+    async def remember_unknown(self, cache, email: str) -> None:
+        """
+        The remember_unknown function marks the email as not registered for a short time.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param email: str: Email which is not found in the database
+        :return: None
+        :doc-author: Trelent
+        """
+        await cache.setex(unknown_key(email), self.unknown_email_ttl, 1)
+
+
+    async def forget_unknown(self, cache, email: str) -> None:
+        """
+        The forget_unknown function drops the unknown mark when the email is registered.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param email: str: Email of the new user
+        :return: None
+        :doc-author: Trelent
+        """
+        await cache.delete(unknown_key(email))
+
+
+login_throttle = LoginThrottle(account_attempts=settings.login.account_attempts,
+                               ip_attempts=settings.login.ip_attempts,
+                               base_delay=settings.login.base_delay,
+                               max_delay=settings.login.max_delay,
+                               window=settings.login.window,
+                               unknown_email_ttl=settings.login.unknown_email_ttl)
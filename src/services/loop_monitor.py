@@ -0,0 +1,158 @@
+"""
+Event loop lag monitor.
+
+A heartbeat coroutine wakes up every interval and records how late it was
+woken as the event loop lag. A watchdog thread checks the heartbeat: when it
+is late by more than the threshold, the loop is blocked right now, so the
+stack of the loop thread is captured and logged once per blocking episode,
+together with the route of the request whose task is running. Synchronous
+database calls, hashing or HTTP requests in ``async def`` handlers show up
+with their exact line.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.conf.config import settings
+from src.services.metrics import EVENT_LOOP_LAG, EVENT_LOOP_BLOCKED
+from src.services.telemetry import BACKGROUND, route_template
+
+
+logger = logging.getLogger(__name__)
+
+# Scopes of requests by the task serving them
+task_scopes: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+class LoopMonitorMiddleware:
+    """
+    Remembers which request is served by which task, so a blocked loop is reported with its route.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        task = asyncio.current_task() if scope["type"] == "http" else None
+        if task is None:
+            await self.app(scope, receive, send)
+            return
+
+        task_scopes[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            task_scopes.pop(task, None)
+
+
+class LoopMonitor:
+    def __init__(self, interval: float=0.25, threshold: float=0.1, stack_limit: int=30) -> None:
+        """
+        The __init__ function sets the heartbeat interval and the blocking threshold.
+
+        :param self: Represent the instance of the class
+        :param interval: float: Seconds between heartbeats
+        :param threshold: float: Lag in seconds after which the loop is reported as blocked
+        :param stack_limit: int: Frames of the logged stack
+        :return: None
+        :doc-author: Trelent
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._heartbeat: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopping = threading.Event()
+        self._loop_thread_id: int | None = None
+        self._expected = 0.0
+        self._reported = False
+
+
+    def start(self) -> None:
+        """
+        The start function starts the heartbeat in the running loop and the watchdog thread.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._expected = time.monotonic() + self.interval
+        self._stopping.clear()
+        self._heartbeat = self.loop.create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 1)
+            self._watchdog = None
+
+
+    async def _beat(self) -> None:
+        while True:
+            self._expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._expected)
+            EVENT_LOOP_LAG.observe(lag)
+            self._reported = False
+
+
+    def _watch(self) -> None:
+        while not self._stopping.wait(self.threshold / 2):
+            blocked = time.monotonic() - self._expected
+            if blocked > self.threshold and not self._reported:
+                self._reported = True
+                self.report(blocked)
+
+
+    def running_route(self) -> str:
+        """
+        The running_route function returns the route of the request whose task is running in the loop.
+
+        :param self: Represent the instance of the class
+        :return: Route template, the unmatched label before routing or the background label outside of requests
+        :doc-author: Trelent
+        """
+        task = asyncio.current_task(self.loop)
+        scope = task_scopes.get(task) if task is not None else None
+        if scope is None:
+            return BACKGROUND
+
+        return route_template(scope)
+
+
+    def report(self, blocked: float) -> str:
+        """
+        The report function logs the stack of the loop thread while the loop is blocked.
+
+        :param self: Represent the instance of the class
+        :param blocked: float: Seconds the loop has been blocked so far
+        :return: The captured stack
+        :doc-author: Trelent
+        """
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=self.stack_limit)) if frame is not None else ""
+        route = self.running_route()
+        EVENT_LOOP_BLOCKED.labels(route).inc()
+        logger.warning("Event loop blocked for %.0f ms in %s:\n%s", blocked * 1000, route, stack)
+
+        return stack
+
+
+loop_monitor = LoopMonitor(interval=settings.loop_monitor.interval,
+                           threshold=settings.loop_monitor.threshold)
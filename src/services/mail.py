@@ -1,92 +1,93 @@
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
-from pathlib import Path
-from collections.abc import Coroutine
-from functools import wraps
+from email.message import EmailMessage
+from email.utils import formataddr
 from datetime import timedelta
 
 
 from src.conf.config import settings
-from src.models.user import User
 from src.services.auth import auth_token
+from src.services.mailer import MailSender, render
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail.username,
-    MAIL_PASSWORD=settings.mail.password,
-    MAIL_FROM=settings.mail.mail_from,
-    MAIL_PORT=settings.mail.port,
-    MAIL_SERVER=settings.mail.server,
-    MAIL_FROM_NAME=settings.mail.mail_from,
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent.parent.joinpath('templates'),
+mail_sender = MailSender(
+    hostname=settings.mail.server,
+    port=settings.mail.port,
+    username=settings.mail.username if settings.mail.use_credentials else None,
+    password=settings.mail.password,
+    use_tls=settings.mail.ssl_tls,
+    start_tls=settings.mail.starttls,
+    validate_certs=settings.mail.validate_certs,
+    pool_size=settings.mail.pool_size,
+    batch_size=settings.mail.batch_size,
+    timeout=settings.mail.timeout,
 )
 
-def error_handler(func: callable) -> Coroutine:
+
+async def html_message(subject: str, recipient: str, template_name: str, **context) -> EmailMessage:
     """
-    The error_handler function is a decorator that wraps the decorated function in an error handling try/except block.
-    All errors ocurred during mailing process are printed in console
+    The html_message function builds an html message from a cached template.
     
-    :param func: callable: Specify the type of parameter that will be passed to the wrapper function
-    :return: A coroutine, which is a function that can be suspended and resumed
+    :param subject: str: Subject of the message
+    :param recipient: str: Email address of the recipient
+    :param template_name: str: File name of the template
+    :param context: Template variables
+    :return: EmailMessage
     :doc-author: Trelent
     """
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        try:
-            result = await func(*args, **kwargs)
-        except ConnectionErrors as err:
-            print(err)
-        
-        return result
-    
-    return wrapper
+    message = EmailMessage()
+    message["Subject"] = subject
+    message["From"] = formataddr((settings.mail.mail_from, settings.mail.mail_from))
+    message["To"] = recipient
+    message.set_content(await render(template_name, **context), subtype="html")
+
+    return message
 
 
-@error_handler
-async def password_reset_email(user: User, host: str):
+async def password_reset_email(email: str, host: str):
     """
     The password_reset_email function sends an email with a link to reset their password.
-    The token is valid for 30 minutes.
+    The token is valid for 30 minutes. Errors are raised, the outbox worker retries the message.
     
-    :param user: User: Get the user's email address
+    :param email: str: Email address of the user
     :param host: str: Specify the hostname of the website
     :return: None
     :doc-author: Trelent
     """
-    token = await auth_token.create_token({"sub": user.email}, life_time=timedelta(minutes=30))
-    message = MessageSchema(
-        subject="Reset password",
-        recipients=[user.email],
-        template_body={"host": host, "token": token},
-        subtype=MessageType.html
-    )
+    token = await auth_token.create_token({"sub": email}, life_time=timedelta(minutes=30))
+    message = await html_message("Reset password", email, "password_reset_email.html",
+                                 host=host, token=token, username=email)
     
-    fm = FastMail(conf)
-    await fm.send_message(message, template_name="password_reset_email.html")
+    await mail_sender.send(message)
 
 
-@error_handler
-async def confirm_email(user: User, host: str):
+async def confirm_email(email: str, host: str):
     """
     The confirm_email function sends an email with a  clickable link 
-    to confirm this email address.
+    to confirm this email address. Errors are raised, the outbox worker retries the message.
     
-    :param user: User: Get the user's email address
+    :param email: str: Email address of the user
     :param host: str: Specify the host of the website
     :return: None
     :doc-author: Trelent
     """
-    token = await auth_token.create_token({"sub": user.email})
-    message = MessageSchema(
-        subject="Email confirmation",
-        recipients=[user.email],
-        template_body={"host": host, "token": token},
-        subtype=MessageType.html
-    )
+    token = await auth_token.create_token({"sub": email})
+    message = await html_message("Email confirmation", email, "password_confirm_email.html",
+                                 host=host, token=token, username=email)
+
+    await mail_sender.send(message)
+
+
 
+async def birthday_digest(email: str, day: str, contacts: list[dict]):
+    """
+    The birthday_digest function sends the list of contacts with upcoming birthdays.
+    Errors are raised, the outbox worker retries the message.
+    
+    :param email: str: Email address of the user
+    :param day: str: Date of the digest in ISO format
+    :param contacts: list[dict]: Names, birth dates, emails and phones of the contacts
+    :return: None
+    :doc-author: Trelent
+    """
+    message = await html_message("Upcoming birthdays", email, "birthday_digest.html",
+                                 username=email, day=day, contacts=contacts)
 
-    fm = FastMail(conf)
-    await fm.send_message(message, template_name="password_confirm_email.html")
+    await mail_sender.send(message)
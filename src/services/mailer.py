@@ -0,0 +1,229 @@
+"""
+Long-lived mail sender.
+
+Messages are queued and sent over a pool of authenticated SMTP connections
+which stay open between messages. Whenever a connection is idle it takes the
+next chunk of queued messages and sends them without a new handshake and
+login, so a slow transaction on one connection does not hold back the others.
+Templates are compiled once and cached by Jinja.
+"""
+import asyncio
+import logging
+from contextlib import suppress
+from email.message import EmailMessage
+from pathlib import Path
+
+import aiosmtplib
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_FOLDER = Path(__file__).parent.parent.joinpath('templates')
+
+templates = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER),
+                        autoescape=select_autoescape(["html"]),
+                        auto_reload=False,
+                        enable_async=True)
+
+
+async def render(template_name: str, **context) -> str:
+    """
+    The render function renders a cached compiled template.
+
+    :param template_name: str: File name of the template
+    :param context: Template variables
+    :return: Rendered template
+    :doc-author: Trelent
+    """
+    return await templates.get_template(template_name).render_async(**context)
+
+
+class MailSenderClosed(RuntimeError):
+    pass
+
+
+def resolve(future: asyncio.Future, result=None, error: Exception | None=None) -> None:
+    if future.done():
+        return
+
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class MailSender:
+    def __init__(self,
+                 hostname: str,
+                 port: int,
+                 username: str | None=None,
+                 password: str | None=None,
+                 use_tls: bool=True,
+                 start_tls: bool=False,
+                 validate_certs: bool=True,
+                 pool_size: int=4,
+                 batch_size: int=20,
+                 timeout: float=30.0) -> None:
+        """
+        The __init__ function sets connection options, connections are opened on first send.
+
+        :param self: Represent the instance of the class
+        :param hostname: str: SMTP server
+        :param port: int: SMTP port
+        :param username: str | None: Login, no authentication if None
+        :param password: str | None: Password
+        :param use_tls: bool: Connect with implicit TLS
+        :param start_tls: bool: Upgrade the connection with STARTTLS
+        :param validate_certs: bool: Validate server certificate
+        :param pool_size: int: Number of SMTP connections kept open
+        :param batch_size: int: Largest number of queued messages sent at once by all connections
+        :param timeout: float: Timeout of SMTP commands in seconds
+        :return: None
+        :doc-author: Trelent
+        """
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.validate_certs = validate_certs
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.chunk_size = max(1, batch_size // pool_size)
+        self.connections_opened = 0
+        self._loop = None
+
+
+    def _start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pool: asyncio.LifoQueue = asyncio.LifoQueue()
+        for _ in range(self.pool_size):
+            self._pool.put_nowait(None)
+        self._sending: set[asyncio.Task] = set()
+        self._worker = loop.create_task(self._run())
+
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, use_tls=self.use_tls,
+                                 start_tls=self.start_tls, validate_certs=self.validate_certs,
+                                 timeout=self.timeout)
+        await client.connect()
+        if self.username:
+            await client.login(self.username, self.password)
+        self.connections_opened += 1
+
+        return client
+
+
+    async def _send_chunk(self, client: aiosmtplib.SMTP | None,
+                          chunk: list[tuple[EmailMessage, asyncio.Future]]) -> None:
+        """
+        The _send_chunk function sends messages over one pooled connection and returns it to the pool.
+        A connection dropped by the server is reopened once per message.
+
+        :param self: Represent the instance of the class
+        :param client: aiosmtplib.SMTP | None: Pooled connection, None if it's not opened yet
+        :param chunk: list[tuple[EmailMessage, asyncio.Future]]: Messages and futures of their senders
+        :return: None
+        :doc-author: Trelent
+        """
+        try:
+            for message, future in chunk:
+                for attempt in range(2):
+                    try:
+                        if client is None or not client.is_connected:
+                            client = await self._connect()
+                        result = await client.send_message(message)
+                    except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, OSError) as err:
+                        logger.debug("SMTP connection failed: %s", err)
+                        client = None
+                        if attempt:
+                            resolve(future, error=err)
+                    except Exception as err:
+                        resolve(future, error=err)
+                        break
+                    else:
+                        resolve(future, result=result)
+                        break
+        finally:
+            self._pool.put_nowait(client)
+
+
+    async def _run(self) -> None:
+        """
+        The _run function waits for an idle connection and hands it the next chunk of queued messages.
+        Chunks are sent concurrently, up to one per pooled connection.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        while True:
+            client = await self._pool.get()
+            try:
+                chunk = [await self._queue.get()]
+            except asyncio.CancelledError:
+                self._pool.put_nowait(client)
+                raise
+            while len(chunk) < self.chunk_size and not self._queue.empty():
+                chunk.append(self._queue.get_nowait())
+
+            task = self._loop.create_task(self._send_chunk(client, chunk))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+
+    async def send(self, message: EmailMessage):
+        """
+        The send function queues the message and waits until it is sent.
+
+        :param self: Represent the instance of the class
+        :param message: EmailMessage: Message to send
+        :return: Server responses of the recipients
+        :doc-author: Trelent
+        """
+        self._start()
+        future = self._loop.create_future()
+        self._queue.put_nowait((message, future))
+
+        return await future
+
+
+    async def close(self) -> None:
+        """
+        The close function stops the sender and closes pooled connections.
+        Messages which are being sent are finished, messages still in the queue fail
+        with MailSenderClosed, so their senders don't wait forever.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        if self._loop is not asyncio.get_running_loop():
+            self._loop = None
+            return
+
+        self._worker.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._worker
+        await asyncio.gather(*self._sending, return_exceptions=True)
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            resolve(future, error=MailSenderClosed("Mail sender is closed"))
+
+        while not self._pool.empty():
+            client = self._pool.get_nowait()
+            if client is not None and client.is_connected:
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException:
+                    client.close()
+        self._loop = None
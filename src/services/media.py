@@ -1,9 +1,19 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+
 import cloudinary
-from cloudinary.uploader import upload_image, destroy
-from cloudinary import CloudinaryImage
+import httpx
+from cloudinary.utils import api_sign_request
 
 
 from src.conf.config import settings
+from src.services.tracing import tracer
 
 
 cloudinary.config( 
@@ -13,38 +23,120 @@ cloudinary.config(
 )
 
 DEFAULT_TAG = "avatar"
+API_URL = "https://api.cloudinary.com/v1_1"
+
+# Keep-alive connections to the media API shared by all uploads
+http_client: httpx.AsyncClient | None = None
+
+
+async def propagate_trace(request: httpx.Request) -> None:
+    traceparent = tracer.traceparent()
+    if traceparent:
+        request.headers["traceparent"] = traceparent
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    The get_http_client function returns the shared HTTP client, it is created on first use.
+
+    :return: httpx.AsyncClient
+    :doc-author: Trelent
+    """
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0),
+                                        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                                        event_hooks={"request": [propagate_trace]})
+
+    return http_client
+
+
+async def close_http_client() -> None:
+    """
+    The close_http_client function closes keep-alive connections on application shutdown.
+
+    :return: None
+    :doc-author: Trelent
+    """
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+
+@dataclass
+class UploadedMedia:
+    url: str
+    public_id: str
+
+
+class MediaStorage(ABC):
+
+    @abstractmethod
+    async def avatar_upload(self, data: bytes, public_id=None) -> UploadedMedia:
+        """
+        The avatar_upload function stores a prepared avatar image.
+
+        :param self: Represent the instance of the class
+        :param data: bytes: JPEG encoded avatar
+        :param public_id: Id of the current avatar of the user, if any
+        :return: UploadedMedia
+        :doc-author: Trelent
+        """
+
+
+    @abstractmethod
+    async def remove_media(self, public_id: str):
+        """
+        The remove_media function removes stored media.
+
+        :param self: Represent the instance of the class
+        :param public_id: str: Id of the media
+        :return: Result of the removal
+        :doc-author: Trelent
+        """
 
-class MediaCloud:
+
+class MediaCloud(MediaStorage):
     FOLDER = settings.cloudinary.folder
 
-    async def avatar_upload(self, file, public_id=None) -> CloudinaryImage:
+    def _signed(self, params: dict) -> dict:
+        params = {**params, "timestamp": int(time.time())}
+        signature = api_sign_request(params, settings.cloudinary.api_secret)
+
+        return {**params, "signature": signature, "api_key": settings.cloudinary.api_key}
+
+
+    async def avatar_upload(self, data: bytes, public_id=None) -> UploadedMedia:
         """
-        The avatar_upload function uploads an avatar image to Cloudinary, 
-        and returns an uploaded CloudinaryImage object.
-        
+        The avatar_upload function uploads a prepared avatar image to Cloudinary
+        over the shared keep-alive HTTP client, and returns the url and public id of the upload.
+        The image is expected to be already cropped and encoded by prepare_avatar.
+
         :param self: Represent the instance of the class
-        :param file: Upload the image to cloudinary
+        :param data: bytes: JPEG encoded avatar
         :param public_id: Specify the public id of the image to be uploaded
-        :return: A cloudinaryimage object
+        :return: UploadedMedia
         :doc-author: Trelent
         """
         options = {
-                    "overwrite": True,
-                    "width": 300,
-                    "crop": "thumb", 
-                    "gravity": "faces",
-                    "format": "jpeg",
+                    "overwrite": "true",
+                    "tags": DEFAULT_TAG,
                     }
-        
+
         if public_id:
             options.update({"public_id": public_id})
         else:
-            options.update({"folder": self.FOLDER + "/avatar"})
-        
-        image = upload_image(file, **options)
-        
-        return image
-    
+            options.update({"folder": f"{self.FOLDER}/avatar" if self.FOLDER else "avatar"})
+
+        response = await get_http_client().post(f"{API_URL}/{settings.cloudinary.cloud_name}/image/upload",
+                                                data=self._signed(options),
+                                                files={"file": ("avatar.jpeg", data, "image/jpeg")})
+        response.raise_for_status()
+        result = response.json()
+
+        return UploadedMedia(url=result["secure_url"], public_id=result["public_id"])
+
     async def remove_media(self, public_id: str):
         """
         The remove_media function is used to remove a media file from Cloudinary.
@@ -55,10 +147,143 @@ class MediaCloud:
         :return: response object
         :doc-author: Trelent
         """
-        result = destroy(public_id)
-        
-        return result
-        
+        response = await get_http_client().post(f"{API_URL}/{settings.cloudinary.cloud_name}/image/destroy",
+                                                data=self._signed({"public_id": public_id}))
+        response.raise_for_status()
+
+        return response.json()
+
+
+class LocalMediaStorage(MediaStorage):
+    def __init__(self, root: str, base_url: str) -> None:
+        """
+        The __init__ function sets the directory of the store and the url prefix of stored files.
+
+        :param self: Represent the instance of the class
+        :param root: str: Directory of the store
+        :param base_url: str: Url prefix under which the store is served
+        :return: None
+        :doc-author: Trelent
+        """
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+
+
+    def path(self, public_id: str) -> Path:
+        """
+        The path function returns the file of the media, files are spread over
+        subdirectories by the first characters of the hash.
+
+        :param self: Represent the instance of the class
+        :param public_id: str: Content hash of the media
+        :return: Path of the file
+        :doc-author: Trelent
+        """
+        return self.root / public_id[:2] / public_id[2:4] / f"{public_id}.jpeg"
+
+
+    def url(self, public_id: str) -> str:
+        return f"{self.base_url}/{public_id}.jpeg"
+
+
+    def _write(self, data: bytes, path: Path) -> None:
+        if path.exists():
+            try:
+                os.utime(path)
+                return
+            except FileNotFoundError:
+                pass
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(data)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+
+    async def avatar_upload(self, data: bytes, public_id=None) -> UploadedMedia:
+        """
+        The avatar_upload function stores the avatar under the sha256 hash of its content.
+        Identical uploads are stored once, an upload of a stored file only refreshes its
+        modification time, so collect_garbage keeps it for min_age. The file is written
+        to a temporary file and renamed, so readers never see a partial file.
+        The previous avatar is kept, it may be shared by other users.
+
+        :param self: Represent the instance of the class
+        :param data: bytes: JPEG encoded avatar
+        :param public_id: Id of the current avatar, not used by the content addressed store
+        :return: UploadedMedia
+        :doc-author: Trelent
+        """
+        content_id = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._write, data, self.path(content_id))
+
+        return UploadedMedia(url=self.url(content_id), public_id=content_id)
+
+
+    async def remove_media(self, public_id: str):
+        """
+        The remove_media function keeps the stored file, identical avatars of several users
+        are one file. Files which no user refers to are removed by collect_garbage,
+        see src.workers.media_gc.
+
+        :param self: Represent the instance of the class
+        :param public_id: str: Content hash of the media
+        :return: False, nothing is removed
+        :doc-author: Trelent
+        """
+        return False
+
+
+    def collect_garbage(self, referenced: set[str], min_age: float=3600.0) -> int:
+        """
+        The collect_garbage function removes files which are not referenced by any user.
+        Files younger than min_age are kept, so an avatar which is uploaded but not yet
+        saved to its user is not removed. Left over temporary files are removed too.
+        It's blocking, run it in a worker process or thread.
+
+        :param self: Represent the instance of the class
+        :param referenced: set[str]: Content hashes which are in use
+        :param min_age: float: Seconds a file is kept after it was written
+        :return: Number of removed files
+        :doc-author: Trelent
+        """
+        if not self.root.is_dir():
+            return 0
+
+        deadline = time.time() - min_age
+        removed = 0
+        for path in self.root.glob("*/*/*"):
+            if path.suffix == ".jpeg" and path.stem in referenced:
+                continue
+            if path.suffix not in (".jpeg", ".tmp") or path.stat().st_mtime > deadline:
+                continue
+            path.unlink(missing_ok=True)
+            removed += 1
+
+        return removed
+
+
+def make_storage(backend: str) -> MediaStorage:
+    """
+    The make_storage function creates the media storage selected in settings.
+
+    :param backend: str: cloudinary or local
+    :return: MediaStorage
+    :doc-author: Trelent
+    """
+    if backend == "cloudinary":
+        return MediaCloud()
+    if backend == "local":
+        return LocalMediaStorage(settings.media.root, settings.media.base_url)
 
+    raise ValueError(f"Unknown media backend {backend}")
 
 
+media_storage = make_storage(settings.media.backend)
@@ -0,0 +1,198 @@
+"""
+Memory profiling with tracemalloc snapshots.
+
+Tracing is off by default, so it costs nothing until an administrator starts
+it. While it runs every allocation records its traceback (``frames`` deep),
+which slows allocations down and takes memory of its own. Snapshots are kept
+in the worker which took them, the pid in responses tells which worker
+answered. The diff of two snapshots groups allocations by file and line and
+shows where memory grew between them.
+
+object_counts walks the objects tracked by the garbage collector and counts
+ORM entities (detached ones are usually unpickled cached users), sessions
+with their identity maps, and Redis clients, pools and connections.
+"""
+import gc
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import redis.asyncio as redis
+from redis.asyncio.connection import AbstractConnection
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.models.base_models import Base
+
+
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class TracingNotStarted(RuntimeError):
+    pass
+
+
+class UnknownSnapshot(KeyError):
+    pass
+
+
+@dataclass
+class SnapshotInfo:
+    id: int
+    taken_at: float
+    size: int
+    count: int
+
+
+class MemoryProfiler:
+    def __init__(self, max_snapshots: int=10) -> None:
+        """
+        The __init__ function sets the number of snapshots kept in memory,
+        the oldest snapshot is dropped when a new one is taken over the limit.
+
+        :param self: Represent the instance of the class
+        :param max_snapshots: int: Number of kept snapshots
+        :return: None
+        :doc-author: Trelent
+        """
+        self.max_snapshots = max_snapshots
+        self.snapshots: OrderedDict[int, tuple[SnapshotInfo, tracemalloc.Snapshot]] = OrderedDict()
+        self._next_id = 1
+
+
+    def status(self) -> dict:
+        """
+        The status function describes tracing of the current worker.
+
+        :param self: Represent the instance of the class
+        :return: A dict with the state of tracing, traced memory and overhead in bytes and kept snapshots
+        :doc-author: Trelent
+        """
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory()
+
+        return {"pid": os.getpid(),
+                "tracing": tracing,
+                "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+                "traced": current,
+                "peak": peak,
+                "overhead": tracemalloc.get_tracemalloc_memory(),
+                "snapshots": [info for info, _ in self.snapshots.values()]}
+
+
+    def start(self, frames: int=1) -> None:
+        """
+        The start function starts tracing allocations, it does nothing if tracing runs already.
+
+        :param self: Represent the instance of the class
+        :param frames: int: Depth of stored tracebacks, 1 is enough to group by line
+        :return: None
+        :doc-author: Trelent
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+
+    def stop(self) -> None:
+        """
+        The stop function stops tracing and drops the snapshots, so all memory of tracemalloc is freed.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        tracemalloc.stop()
+        self.snapshots.clear()
+
+
+    def take_snapshot(self) -> SnapshotInfo:
+        """
+        The take_snapshot function takes a snapshot of traced allocations without allocations
+        of tracemalloc and the import machinery.
+
+        :param self: Represent the instance of the class
+        :return: SnapshotInfo of the new snapshot
+        :doc-author: Trelent
+        """
+        if not tracemalloc.is_tracing():
+            raise TracingNotStarted("Tracing is not started")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        stats = snapshot.statistics("filename")
+        info = SnapshotInfo(id=self._next_id, taken_at=time.time(),
+                            size=sum(stat.size for stat in stats), count=sum(stat.count for stat in stats))
+        self._next_id += 1
+        self.snapshots[info.id] = (info, snapshot)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+
+        return info
+
+
+    def diff(self, first: int, second: int, group_by: str="lineno", limit: int=20) -> list[dict]:
+        """
+        The diff function compares two snapshots and returns the locations where memory grew the most.
+
+        :param self: Represent the instance of the class
+        :param first: int: Id of the earlier snapshot
+        :param second: int: Id of the later snapshot
+        :param group_by: str: lineno or filename
+        :param limit: int: Number of returned locations
+        :return: A list of dicts with the location, size and count and their differences
+        :doc-author: Trelent
+        """
+        if first not in self.snapshots or second not in self.snapshots:
+            raise UnknownSnapshot(first if first not in self.snapshots else second)
+
+        stats = self.snapshots[second][1].compare_to(self.snapshots[first][1], group_by)
+
+        return [{"location": str(stat.traceback[0]) if group_by == "lineno" else stat.traceback[0].filename,
+                 "size_diff": stat.size_diff,
+                 "size": stat.size,
+                 "count_diff": stat.count_diff,
+                 "count": stat.count}
+                for stat in stats[:limit]]
+
+
+def object_counts() -> dict:
+    """
+    The object_counts function counts live ORM entities, sessions and Redis objects.
+    It walks all objects tracked by the garbage collector, which takes a while on a large heap.
+
+    :return: A dict of counts
+    :doc-author: Trelent
+    """
+    entities = {mapper.class_: {"total": 0, "detached": 0} for mapper in Base.registry.mappers}
+    sessions = identity_map = clients = pools = connections = 0
+    for obj in gc.get_objects():
+        counts = entities.get(type(obj))
+        if counts is not None:
+            counts["total"] += 1
+            if inspect(obj).detached:
+                counts["detached"] += 1
+        elif isinstance(obj, Session):
+            sessions += 1
+            identity_map += len(obj.identity_map)
+        elif isinstance(obj, redis.Redis):
+            clients += 1
+        elif isinstance(obj, redis.ConnectionPool):
+            pools += 1
+        elif isinstance(obj, AbstractConnection):
+            connections += 1
+
+    return {"pid": os.getpid(),
+            "entities": {cls.__name__: counts for cls, counts in entities.items()},
+            "sessions": sessions,
+            "identity_map": identity_map,
+            "redis": {"clients": clients, "pools": pools, "connections": connections}}
+
+
+memory_profiler = MemoryProfiler(max_snapshots=settings.memory.max_snapshots)
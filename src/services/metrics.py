@@ -0,0 +1,115 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# In multiprocess mode (PROMETHEUS_MULTIPROC_DIR is set) gauges are aggregated over live workers
+# by their multiprocess_mode, counters and histograms are summed.
+
+HTTP_REQUESTS = Counter("http_requests_total",
+                        "Finished requests by route template and status code",
+                        ["method", "route", "status"])
+HTTP_LATENCY = Histogram("http_request_duration_seconds",
+                         "Time from receiving a request to the end of the response",
+                         ["method", "route"],
+                         buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight",
+                       "Requests being served",
+                       multiprocess_mode="livesum")
+
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds",
+                             "Duration of SQL statements",
+                             buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+DB_REQUEST_QUERIES = Histogram("db_queries_per_request",
+                               "SQL statements executed by a request",
+                               ["route"],
+                               buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+DB_REQUEST_SECONDS = Histogram("db_seconds_per_request",
+                               "Total duration of SQL statements executed by a request",
+                               ["route"],
+                               buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+DB_SLOW_QUERIES = Counter("db_slow_queries_total",
+                          "SQL statements slower than the slow query threshold",
+                          ["route"])
+DB_REPEATED_STATEMENTS = Counter("db_repeated_statements_total",
+                                 "Requests which ran one statement more times than the repeat threshold (N+1)",
+                                 ["route"])
+EVENT_LOOP_LAG = Histogram("event_loop_lag_seconds",
+                           "Delay of the loop monitor heartbeat, time the event loop could not run ready tasks",
+                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+EVENT_LOOP_BLOCKED = Counter("event_loop_blocked_total",
+                             "Times the event loop was blocked longer than the threshold, by running route",
+                             ["route"])
+
+REDIS_COMMAND_LATENCY = Histogram("redis_command_duration_seconds",
+                                  "Duration of redis commands and pipelines",
+                                  ["command"],
+                                  buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5))
+
+
+HASH_QUEUE_DEPTH = Gauge("password_hash_queue_depth",
+                         "Password hash jobs waiting for a free process",
+                         multiprocess_mode="livesum")
+HASH_IN_FLIGHT = Gauge("password_hash_in_flight",
+                       "Password hash jobs submitted to the process pool",
+                       multiprocess_mode="livesum")
+HASH_LATENCY = Histogram("password_hash_seconds",
+                         "Time from submitting a password hash job to its result",
+                         ["operation"],
+                         buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 10))
+HASH_REJECTED = Counter("password_hash_rejected_total",
+                        "Password hash jobs rejected because the pool queue is full",
+                        ["operation"])
+PASSWORD_REHASHED = Counter("password_rehashed_total",
+                            "Stored password hashes upgraded to the current scheme and cost on signin")
+
+REDIS_POOL_IN_USE = Gauge("redis_pool_connections_in_use",
+                          "Redis connections checked out of the shared pool",
+                          multiprocess_mode="livesum")
+REDIS_POOL_CREATED = Counter("redis_pool_connections_created_total",
+                             "Redis connections opened by the shared pool")
+REDIS_POOL_MAX = Gauge("redis_pool_connections_max",
+                       "Maximum number of connections of the shared redis pool",
+                       multiprocess_mode="livemax")
+
+RATE_LIMIT_REJECTED = Counter("rate_limit_rejected_total",
+                              "Requests rejected by the rate limiter",
+                              ["source"])
+
+LOGIN_FAILED = Counter("login_failed_total",
+                       "Failed sign in attempts",
+                       ["reason"])
+LOGIN_THROTTLED = Counter("login_throttled_total",
+                          "Sign in attempts rejected before the password check",
+                          ["scope"])
+LOGIN_UNKNOWN_EMAIL_CACHED = Counter("login_unknown_email_cached_total",
+                                     "Sign in attempts with an unknown email answered from cache")
+
+DB_SESSION_REQUESTS = Counter("db_session_requests_total",
+                              "Requests by use of the database session: unused, session or connection",
+                              ["usage"])
+DB_CONNECTIONS_ACQUIRED = Counter("db_connections_acquired_total",
+                                  "Connections acquired by request sessions")
+
+OUTBOX_DELIVERED = Counter("outbox_delivered_total",
+                           "Outbox messages delivered",
+                           ["kind"])
+OUTBOX_FAILED = Counter("outbox_failed_total",
+                        "Failed attempts of outbox messages",
+                        ["kind"])
+OUTBOX_DEAD = Counter("outbox_dead_total",
+                      "Outbox messages moved to dead letters",
+                      ["kind"])
+
+BIRTHDAY_DIGESTS = Counter("birthday_digests_total",
+                           "Birthday digests written to the outbox",
+                           ["result"])
+BIRTHDAY_CONTACTS = Counter("birthday_digest_contacts_total",
+                            "Contacts with upcoming birthdays read by the digest job")
+BIRTHDAY_JOB_SECONDS = Histogram("birthday_digest_job_seconds",
+                                 "Duration of a birthday digest run",
+                                 buckets=(1, 5, 15, 60, 300, 900, 3600))
+BIRTHDAY_CALENDAR_READS = Counter("birthday_calendar_reads_total",
+                                  "Birthday lookups served by the redis calendar",
+                                  ["result"])
+BIRTHDAY_CALENDAR_ERRORS = Counter("birthday_calendar_errors_total",
+                                   "Redis errors of birthday calendars, calendars are repaired by the nightly rebuild",
+                                   ["operation"])
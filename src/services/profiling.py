@@ -0,0 +1,215 @@
+"""
+On-demand CPU profiling of single requests.
+
+A request is profiled by pyinstrument, a sampling profiler, when it carries
+the profiling header (``X-Profile: 1``) with the access token of an
+administrator, or when it is picked by the sample rate. The profile is
+stored as an HTML flamegraph or a speedscope file, its name is returned in
+the ``X-Profile-Id`` response header and administrators download it from
+``/api/admin/profiles/{name}``. One request is profiled at a time, other
+requests are served as usual meanwhile.
+
+    curl -H "Authorization: Bearer $TOKEN" -H "X-Profile: 1" "$API/api/contacts/?limit=100"
+"""
+import asyncio
+import logging
+import random
+import re
+import secrets
+import time
+from pathlib import Path
+
+import redis.asyncio as redis
+from fastapi import HTTPException
+from pyinstrument import Profiler
+from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf.config import settings
+from src.dependencies.cache import get_client
+from src.dependencies.token_user import get_access_payload
+from src.services.auth import is_admin
+
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"html": ".html", "speedscope": ".speedscope.json"}
+PROFILE_NAME_RE = re.compile(r"^[\w-]+\.(html|speedscope\.json)$", re.ASCII)
+
+
+def route_slug(scope: Scope) -> str:
+    route = getattr(scope.get("route"), "path", None) or "unmatched"
+
+    return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+
+class ProfileStore:
+    def __init__(self, directory: str, fmt: str="html", keep: int=100) -> None:
+        """
+        The __init__ function sets the directory and the format of stored profiles.
+
+        :param self: Represent the instance of the class
+        :param directory: str: Directory of profiles
+        :param fmt: str: html or speedscope
+        :param keep: int: Number of latest profiles kept in the directory
+        :return: None
+        :doc-author: Trelent
+        """
+        self.directory = Path(directory)
+        self.fmt = fmt
+        self.keep = keep
+
+
+    def new_name(self, scope: Scope) -> str:
+        """
+        The new_name function names the profile of a request by time, method and route.
+
+        :param self: Represent the instance of the class
+        :param scope: Scope: ASGI scope of the request
+        :return: File name of the profile
+        :doc-author: Trelent
+        """
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+
+        return f"{stamp}-{scope['method']}-{route_slug(scope)}-{secrets.token_hex(4)}{EXTENSIONS[self.fmt]}"
+
+
+    def path(self, name: str) -> Path | None:
+        """
+        The path function returns the path of a stored profile, names which could
+        point outside of the directory are rejected.
+
+        :param self: Represent the instance of the class
+        :param name: str: File name of the profile
+        :return: Path of the existing profile or None
+        :doc-author: Trelent
+        """
+        if not PROFILE_NAME_RE.match(name):
+            return None
+
+        path = self.directory / name
+
+        return path if path.is_file() else None
+
+
+    def list(self) -> list[Path]:
+        """
+        The list function returns stored profiles, the latest first.
+
+        :param self: Represent the instance of the class
+        :return: A list of paths
+        :doc-author: Trelent
+        """
+        if not self.directory.is_dir():
+            return []
+
+        profiles = [path for path in self.directory.iterdir() if PROFILE_NAME_RE.match(path.name)]
+
+        return sorted(profiles, key=lambda path: path.stat().st_mtime, reverse=True)
+
+
+    def save(self, name: str, profiler: Profiler) -> Path:
+        """
+        The save function renders the profile and removes profiles over the limit.
+        It's blocking, call it in a worker thread.
+
+        :param self: Represent the instance of the class
+        :param name: str: File name of the profile
+        :param profiler: Profiler: Stopped profiler
+        :return: Path of the profile
+        :doc-author: Trelent
+        """
+        renderer = SpeedscopeRenderer() if self.fmt == "speedscope" else HTMLRenderer()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / name
+        path.write_text(profiler.output(renderer), encoding="utf-8")
+        for old in self.list()[self.keep:]:
+            old.unlink(missing_ok=True)
+
+        return path
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp, store: ProfileStore | None=None, header: str | None=None,
+                 sample_rate: float | None=None, interval: float | None=None) -> None:
+        self.app = app
+        self.store = store or profile_store
+        self.header = (header or settings.profiling.header).lower()
+        self.sample_rate = settings.profiling.sample_rate if sample_rate is None else sample_rate
+        self.interval = interval or settings.profiling.interval
+        self.busy = False
+
+
+    async def requested_by_admin(self, headers: Headers) -> bool:
+        """
+        The requested_by_admin function checks the profiling header and the access token of the request.
+        The token is checked like in get_user_by_token, revoked tokens included, the route still
+        authenticates the request as usual.
+
+        :param self: Represent the instance of the class
+        :param headers: Headers: Headers of the request
+        :return: True if an administrator asked to profile the request
+        :doc-author: Trelent
+        """
+        if headers.get(self.header, "").lower() not in ("1", "true", "yes"):
+            return False
+
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+
+        try:
+            payload = await get_access_payload(token, get_client())
+        except (HTTPException, redis.RedisError):
+            return False
+
+        return is_admin(payload.get("sub"))
+
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        The __call__ function serves the request, profiled if it's asked for or sampled.
+
+        :param self: Represent the instance of the class
+        :param scope: Scope: ASGI scope
+        :param receive: Receive: ASGI receive channel
+        :param send: Send: ASGI send channel
+        :return: None
+        :doc-author: Trelent
+        """
+        if scope["type"] != "http" or self.busy:
+            await self.app(scope, receive, send)
+            return
+
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not (sampled or await self.requested_by_admin(Headers(scope=scope))) or self.busy:
+            await self.app(scope, receive, send)
+            return
+
+        name = None
+
+        async def send_with_profile_id(message: Message) -> None:
+            nonlocal name
+            if message["type"] == "http.response.start":
+                name = self.store.new_name(scope)
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", name.encode())]
+            await send(message)
+
+        self.busy = True
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            self.busy = False
+            name = name or self.store.new_name(scope)
+            try:
+                await asyncio.to_thread(self.store.save, name, profiler)
+                logger.info("Profile of %s %s saved as %s", scope["method"], scope["path"], name)
+            except Exception:
+                logger.exception("Saving profile %s failed", name)
+
+
+profile_store = ProfileStore(settings.profiling.dir, settings.profiling.format, settings.profiling.keep)
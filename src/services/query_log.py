@@ -0,0 +1,136 @@
+"""
+Slow query log and N+1 detector.
+
+Statements slower than the threshold are logged with the route of the
+request and their EXPLAIN plan. Statements are also counted per request by
+shape (the SQL text with expanded IN lists collapsed), a request which runs
+one shape more times than the repeat threshold is reported at its end, which
+usually means lazy loads or queries in a loop. Parameters are never logged.
+"""
+import logging
+import re
+
+from src.conf.config import settings
+from src.services.metrics import DB_SLOW_QUERIES, DB_REPEATED_STATEMENTS
+
+
+logger = logging.getLogger(__name__)
+
+IN_LIST_RE = re.compile(r"IN \((?:[^()]|\([^()]*\))*\)")
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def statement_shape(statement: str) -> str:
+    """
+    The statement_shape function collapses lists of expanded IN parameters,
+    so one query with different numbers of ids has one shape.
+
+    :param statement: str: SQL text
+    :return: Shape of the statement
+    :doc-author: Trelent
+    """
+    if "IN (" not in statement:
+        return statement
+
+    return IN_LIST_RE.sub("IN (...)", statement)
+
+
+class QueryLog:
+    def __init__(self, slow_threshold: float=0.2, explain: bool=True, repeat_threshold: int=10) -> None:
+        """
+        The __init__ function sets the thresholds.
+
+        :param self: Represent the instance of the class
+        :param slow_threshold: float: Seconds after which a statement is logged as slow
+        :param explain: bool: Log the plan of slow statements
+        :param repeat_threshold: int: Runs of one statement shape in a request which are reported as N+1
+        :return: None
+        :doc-author: Trelent
+        """
+        self.slow_threshold = slow_threshold
+        self.explain = explain
+        self.repeat_threshold = repeat_threshold
+
+
+    def explain_plan(self, cursor, statement: str, parameters) -> str | None:
+        """
+        The explain_plan function runs EXPLAIN of the statement on the raw DBAPI connection,
+        so engine events are not triggered. A failed EXPLAIN is rolled back to a savepoint
+        and does not abort the transaction of the request.
+
+        :param self: Represent the instance of the class
+        :param cursor: DBAPI cursor which ran the statement
+        :param statement: str: SQL text
+        :param parameters: Parameters of the statement
+        :return: The plan or None
+        :doc-author: Trelent
+        """
+        if not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+
+        explain = cursor.connection.cursor()
+        try:
+            explain.execute("SAVEPOINT query_log_explain")
+            try:
+                explain.execute("EXPLAIN " + statement, parameters)
+                plan = "\n".join(row[0] for row in explain.fetchall())
+            except Exception as err:
+                explain.execute("ROLLBACK TO SAVEPOINT query_log_explain")
+                logger.debug("EXPLAIN failed: %r", err)
+                plan = None
+            explain.execute("RELEASE SAVEPOINT query_log_explain")
+        finally:
+            explain.close()
+
+        return plan
+
+
+    def slow(self, conn, cursor, statement: str, parameters, elapsed: float, route: str, executemany: bool) -> None:
+        """
+        The slow function logs a statement which took longer than the threshold.
+
+        :param self: Represent the instance of the class
+        :param conn: Connection: SQLAlchemy connection of the statement
+        :param cursor: DBAPI cursor which ran the statement
+        :param statement: str: SQL text
+        :param parameters: Parameters of the statement
+        :param elapsed: float: Duration in seconds
+        :param route: str: Route template of the request or the name of a worker
+        :param executemany: bool: The statement ran for many parameter sets
+        :return: None
+        :doc-author: Trelent
+        """
+        DB_SLOW_QUERIES.labels(route).inc()
+        plan = None
+        if self.explain and not executemany and conn.dialect.name == "postgresql":
+            try:
+                plan = self.explain_plan(cursor, statement, parameters)
+            except Exception as err:
+                logger.debug("EXPLAIN is not available: %r", err)
+
+        logger.warning("Slow query %.3f s in %s:\n%s%s", elapsed, route, statement,
+                       f"\n{plan}" if plan else "")
+
+
+    def repeated(self, statements: dict[str, int], route: str) -> list[tuple[str, int]]:
+        """
+        The repeated function reports statement shapes run more times than the threshold by one request.
+
+        :param self: Represent the instance of the class
+        :param statements: dict[str, int]: Runs of statement shapes in the request
+        :param route: str: Route template of the request
+        :return: A list of (shape, runs) tuples over the threshold
+        :doc-author: Trelent
+        """
+        found = [(shape, runs) for shape, runs in statements.items() if runs > self.repeat_threshold]
+        if found:
+            DB_REPEATED_STATEMENTS.labels(route).inc()
+            for shape, runs in found:
+                logger.warning("Possible N+1 in %s: statement ran %s times:\n%s", route, runs, shape)
+
+        return found
+
+
+query_log = QueryLog(slow_threshold=settings.query_log.slow_threshold,
+                     explain=settings.query_log.explain,
+                     repeat_threshold=settings.query_log.repeat_threshold)
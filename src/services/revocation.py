@@ -0,0 +1,302 @@
+"""
+Revocation of access tokens before they expire.
+
+Revoked token ids (``jti`` claim) are stored in redis with a TTL equal to the rest
+of the token life time. Every worker keeps a Bloom filter of revoked ids which is
+synced from redis in the background. The filter answers "definitely not revoked"
+without any I/O; only possible hits are checked in redis.
+
+A token revoked by another worker is seen after at most one sync interval.
+Every revocation bumps a version and is appended to a log scored by that
+version, so a sync only adds the entries after the version the worker has
+seen. The filter is rebuilt from the index of live revocations (in a worker
+thread) only on start, when the log was trimmed past the worker or when the
+filter is over its capacity.
+
+Report of the filter sizing and an empirical false positive rate::
+
+    python -m src.services.revocation
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import secrets
+import time
+
+from src.conf.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_KEY = "revoked:index"
+LOG_KEY = "revoked:log"
+VERSION_KEY = "revoked:version"
+# Revocations kept in the log for incremental syncs
+LOG_SIZE = 10_000
+
+# KEYS: token key, index, log, version
+# ARGV: jti, ttl, exp, now, log size
+REVOKE_SCRIPT = """
+redis.call('SET', KEYS[1], 1, 'EX', ARGV[2])
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[4])
+local version = redis.call('INCR', KEYS[4])
+redis.call('ZADD', KEYS[3], version, ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[3], 0, -tonumber(ARGV[5]) - 1)
+return version
+"""
+
+
+def revoked_key(jti: str) -> str:
+    return f"revoked:{jti}"
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        """
+        The __init__ function sizes the bit array and number of hashes
+        for the expected number of items and false positive rate.
+
+        :param self: Represent the instance of the class
+        :param capacity: int: Expected number of items
+        :param error_rate: float: Desired false positive rate
+        :return: None
+        :doc-author: Trelent
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+
+    def add(self, item: str) -> None:
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+    def expected_error_rate(self) -> float:
+        """
+        The expected_error_rate function returns the theoretical false positive rate
+        for the current number of items.
+
+        :param self: Represent the instance of the class
+        :return: False positive probability
+        :doc-author: Trelent
+        """
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class RevocationList:
+    def __init__(self, capacity: int=100_000, error_rate: float=0.001) -> None:
+        """
+        The __init__ function creates an empty filter, it is filled by sync.
+
+        :param self: Represent the instance of the class
+        :param capacity: int: Expected number of revoked not expired tokens
+        :param error_rate: float: Desired false positive rate of the filter
+        :return: None
+        :doc-author: Trelent
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.version = None
+        self.lookups = 0
+        self.filter_hits = 0
+        self.confirmed = 0
+
+
+    async def revoke(self, cache, jti: str, exp: int) -> None:
+        """
+        The revoke function marks the token id as revoked until the token expires.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param jti: str: Token id
+        :param exp: int: Token expiration timestamp
+        :return: None
+        :doc-author: Trelent
+        """
+        now = int(time.time())
+        ttl = exp - now
+        if ttl <= 0:
+            return
+
+        await cache.eval(REVOKE_SCRIPT, 4, revoked_key(jti), INDEX_KEY, LOG_KEY, VERSION_KEY,
+                         jti, ttl, exp, now, LOG_SIZE)
+
+        self.bloom.add(jti)
+
+
+    async def is_revoked(self, cache, jti: str) -> bool:
+        """
+        The is_revoked function checks the token id in the Bloom filter
+        and goes to redis only if the filter reports a possible hit.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param jti: str: Token id
+        :return: True if the token is revoked
+        :doc-author: Trelent
+        """
+        self.lookups += 1
+        if jti not in self.bloom:
+            return False
+
+        self.filter_hits += 1
+        revoked = bool(await cache.exists(revoked_key(jti)))
+        if revoked:
+            self.confirmed += 1
+
+        return revoked
+
+
+    async def sync(self, cache) -> None:
+        """
+        The sync function adds revocations made since the last sync to the filter.
+        The filter is rebuilt when the worker has not synced yet, the log was trimmed
+        past its version or the version was reset, and when the filter is full.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :return: None
+        :doc-author: Trelent
+        """
+        version = int(await cache.get(VERSION_KEY) or 0)
+        if version == self.version:
+            return
+
+        if self.version is None or version < self.version or self.bloom.count > self.bloom.capacity:
+            await self.rebuild(cache, version)
+            return
+
+        entries = await cache.zrangebyscore(LOG_KEY, f"({self.version}", version, withscores=True)
+        if not entries or int(entries[0][1]) != self.version + 1:
+            await self.rebuild(cache, version)
+            return
+
+        for jti, _ in entries:
+            self.bloom.add(jti.decode() if isinstance(jti, bytes) else jti)
+        self.version = version
+
+
+    async def rebuild(self, cache, version: int) -> None:
+        """
+        The rebuild function builds a new filter of all live revocations in a worker thread.
+        The version is read before the index, so revocations made meanwhile are added again
+        by the next sync, which is harmless.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param version: int: Version read before the index
+        :return: None
+        :doc-author: Trelent
+        """
+        jtis = await cache.zrangebyscore(INDEX_KEY, int(time.time()), "+inf")
+
+        self.bloom = await asyncio.to_thread(self.build_filter, jtis)
+        self.version = version
+
+
+    def build_filter(self, jtis: list) -> BloomFilter:
+        bloom = BloomFilter(max(self.capacity, 2 * len(jtis)), self.error_rate)
+        for jti in jtis:
+            bloom.add(jti.decode() if isinstance(jti, bytes) else jti)
+
+        return bloom
+
+
+    async def run(self, cache, interval: float) -> None:
+        """
+        The run function syncs the filter forever, it is started by the application lifespan.
+
+        :param self: Represent the instance of the class
+        :param cache: Redis client
+        :param interval: float: Seconds between syncs
+        :return: None
+        :doc-author: Trelent
+        """
+        while True:
+            try:
+                await self.sync(cache)
+            except Exception as err:
+                logger.warning("Revocation list sync failed: %s", err)
+            await asyncio.sleep(interval)
+
+
+    def report(self) -> dict:
+        """
+        The report function returns filter sizing and observed false positive rate.
+        Observed rate is a share of not revoked tokens which still needed a redis lookup.
+
+        :param self: Represent the instance of the class
+        :return: A dict with filter statistics
+        :doc-author: Trelent
+        """
+        negatives = self.lookups - self.confirmed
+        false_positives = self.filter_hits - self.confirmed
+
+        return {"capacity": self.bloom.capacity,
+                "items": self.bloom.count,
+                "bits": self.bloom.size,
+                "hashes": self.bloom.hashes,
+                "memory_bytes": len(self.bloom.bits),
+                "expected_false_positive_rate": self.bloom.expected_error_rate(),
+                "lookups": self.lookups,
+                "redis_lookups": self.filter_hits,
+                "revoked": self.confirmed,
+                "false_positives": false_positives,
+                "observed_false_positive_rate": false_positives / negatives if negatives else 0.0}
+
+
+def simulate(capacity: int, error_rate: float, items: int, probes: int=100_000) -> dict:
+    """
+    The simulate function fills a filter with random token ids
+    and measures the false positive rate on ids which were never added.
+
+    :param capacity: int: Expected number of revoked tokens the filter is sized for
+    :param error_rate: float: Desired false positive rate
+    :param items: int: Number of revoked tokens added to the filter
+    :param probes: int: Number of not revoked ids to check
+    :return: A dict with expected and measured rates
+    :doc-author: Trelent
+    """
+    bloom = BloomFilter(capacity, error_rate)
+    for _ in range(items):
+        bloom.add(secrets.token_urlsafe(16))
+
+    false_positives = sum(secrets.token_urlsafe(16) in bloom for _ in range(probes))
+
+    return {"items": items,
+            "bits": bloom.size,
+            "hashes": bloom.hashes,
+            "memory_bytes": len(bloom.bits),
+            "expected_false_positive_rate": bloom.expected_error_rate(),
+            "measured_false_positive_rate": false_positives / probes}
+
+
+revocation_list = RevocationList(settings.revocation.capacity, settings.revocation.error_rate)
+
+
+if __name__ == "__main__":
+    capacity = settings.revocation.capacity
+    for fill in (0.25, 0.5, 1.0, 2.0):
+        result = simulate(capacity, settings.revocation.error_rate, int(capacity * fill))
+        print(", ".join(f"{key}={value:.6f}" if isinstance(value, float) else f"{key}={value}"
+                        for key, value in result.items()))
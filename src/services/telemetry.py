@@ -0,0 +1,205 @@
+"""
+Request telemetry exported to prometheus.
+
+PrometheusMiddleware records latency, status codes and in-flight requests by
+route template, e.g. ``/api/contacts/{contact_id}``, so raw paths never become
+label values. SQL statements are timed by engine events and summed per request
+in a context variable, slow and repeated (N+1) statements are reported by
+src.services.query_log. Labelled children of metrics are cached, a request
+only allocates its small RequestStats.
+
+Set PROMETHEUS_MULTIPROC_DIR to an empty directory before the start of the
+server to aggregate metrics of several workers (``uvicorn --workers N``).
+"""
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import CollectorRegistry, REGISTRY, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.services.metrics import (HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT,
+                                  DB_QUERY_LATENCY, DB_REQUEST_QUERIES, DB_REQUEST_SECONDS)
+from src.services.query_log import query_log, statement_shape
+from src.services.tracing import tracer, KIND_CLIENT
+
+
+UNMATCHED = "unmatched"
+#Route label of statements run outside of requests, e.g. by workers
+BACKGROUND = "background"
+METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds", "statements")
+
+    def __init__(self, scope: Scope) -> None:
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+        #Runs of statement shapes
+        self.statements: dict[str, int] = {}
+
+
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def route_template(scope: Scope) -> str:
+    """
+    The route_template function returns the path template of the matched route.
+    Requests which matched no route share one label value.
+
+    :param scope: Scope: ASGI scope after the request was routed
+    :return: Path template of the route
+    :doc-author: Trelent
+    """
+    route = scope.get("route")
+
+    return getattr(route, "path", UNMATCHED)
+
+
+class PrometheusMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._route_metrics: dict[tuple[str, str], tuple] = {}
+        self._status_metrics: dict[tuple[str, str, int], object] = {}
+
+
+    def route_metrics(self, method: str, route: str) -> tuple:
+        key = (method, route)
+        children = self._route_metrics.get(key)
+        if children is None:
+            children = (HTTP_LATENCY.labels(method, route),
+                        DB_REQUEST_QUERIES.labels(route),
+                        DB_REQUEST_SECONDS.labels(route))
+            self._route_metrics[key] = children
+
+        return children
+
+
+    def status_metric(self, method: str, route: str, status: int):
+        key = (method, route, status)
+        child = self._status_metrics.get(key)
+        if child is None:
+            child = self._status_metrics[key] = HTTP_REQUESTS.labels(method, route, str(status))
+
+        return child
+
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        The __call__ function serves the request and records its metrics.
+        Latency is measured to the last byte of the response, background tasks are not included.
+
+        :param self: Represent the instance of the class
+        :param scope: Scope: ASGI scope
+        :param receive: Receive: ASGI receive channel
+        :param send: Send: ASGI send channel
+        :return: None
+        :doc-author: Trelent
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        finished = None
+        status = 500
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif not message.get("more_body", False):
+                finished = time.perf_counter()
+            await send(message)
+
+        stats = RequestStats(scope)
+        token = request_stats.set(stats)
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            request_stats.reset(token)
+            method = scope["method"] if scope["method"] in METHODS else "OTHER"
+            route = route_template(scope)
+            latency, queries, db_seconds = self.route_metrics(method, route)
+            latency.observe((finished or time.perf_counter()) - started)
+            queries.observe(stats.queries)
+            db_seconds.observe(stats.db_seconds)
+            self.status_metric(method, route, status).inc()
+            if stats.queries > query_log.repeat_threshold:
+                query_log.repeated(stats.statements, route)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_QUERY_LATENCY.observe(elapsed)
+    end_ns = time.time_ns()
+    tracer.record("db.query", end_ns - int(elapsed * 1e9), end_ns, KIND_CLIENT,
+                  **{"db.system": conn.dialect.name, "db.statement": statement})
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        shape = statement_shape(statement)
+        stats.statements[shape] = stats.statements.get(shape, 0) + 1
+
+    if elapsed >= query_log.slow_threshold:
+        route = route_template(stats.scope) if stats is not None else BACKGROUND
+        query_log.slow(conn, cursor, statement, parameters, elapsed, route, executemany)
+
+
+def instrument_engine(engine: Engine) -> Engine:
+    """
+    The instrument_engine function times every SQL statement of the engine
+    and adds it to the statistics of the current request.
+
+    :param engine: Engine: SQLAlchemy engine
+    :return: The same engine
+    :doc-author: Trelent
+    """
+    if not event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+    return engine
+
+
+def multiprocess_mode() -> bool:
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def collect_metrics() -> bytes:
+    """
+    The collect_metrics function renders metrics in prometheus text format,
+    aggregated over all workers in multiprocess mode.
+
+    :return: Metrics
+    :doc-author: Trelent
+    """
+    if not multiprocess_mode():
+        return generate_latest(REGISTRY)
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+
+    return generate_latest(registry)
+
+
+def shutdown_metrics() -> None:
+    """
+    The shutdown_metrics function removes live gauges of the stopping worker in multiprocess mode.
+
+    :return: None
+    :doc-author: Trelent
+    """
+    if multiprocess_mode():
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,100 @@
+"""
+In-process pre-limiter which rejects clearly over limit clients without redis.
+
+Every worker keeps a token bucket per rate limit key. The bucket allows the
+global rate multiplied by (1 + slack), so a client within the global limit is
+never rejected locally, while a flood is cut off after the first burst. The
+burst of a policy is enforced in redis, the bucket only mirrors it with slack.
+
+The bucket is synced with the global redis window on a lease basis: when redis
+reports that the window budget is spent, the key is blocked locally until the
+window resets and no request for it goes to redis in the meantime.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass
+class Bucket:
+    tokens: float
+    updated: float
+    blocked_until: float = 0.0
+
+
+class LocalRateLimiter:
+    def __init__(self, slack: float=1.0, max_keys: int=10_000, clock=time.monotonic) -> None:
+        """
+        The __init__ function creates an empty set of buckets.
+
+        :param self: Represent the instance of the class
+        :param slack: float: Share of the global limit allowed on top of it before local rejection
+        :param max_keys: int: Number of buckets kept, least recently used buckets are dropped
+        :param clock: Source of monotonic time
+        :return: None
+        :doc-author: Trelent
+        """
+        self.slack = slack
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: OrderedDict[str, Bucket] = OrderedDict()
+
+
+    def _bucket(self, key: str, capacity: float, now: float) -> Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = Bucket(tokens=capacity, updated=now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        return bucket
+
+
+    def acquire(self, key: str, times: int, seconds: float, cost: int=1, burst: int | None=None) -> float:
+        """
+        The acquire function takes cost tokens from the bucket of the key.
+
+        :param self: Represent the instance of the class
+        :param key: str: Rate limit key
+        :param times: int: Global budget per window
+        :param seconds: float: Window length
+        :param cost: int: Cost of the request
+        :param burst: int: Budget which may be spent at once, the global budget by default
+        :return: 0 if the request may go on, otherwise seconds to wait
+        :doc-author: Trelent
+        """
+        now = self.clock()
+        capacity = (burst or times) * (1 + self.slack)
+        rate = times * (1 + self.slack) / seconds
+        bucket = self._bucket(key, capacity, now)
+
+        if now < bucket.blocked_until:
+            return bucket.blocked_until - now
+
+        bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+        if bucket.tokens < cost:
+            return (cost - bucket.tokens) / rate
+
+        bucket.tokens -= cost
+
+        return 0.0
+
+
+    def block(self, key: str, seconds: float) -> None:
+        """
+        The block function takes a lease from the global window: the key is rejected
+        locally until the window resets.
+
+        :param self: Represent the instance of the class
+        :param key: str: Rate limit key
+        :param seconds: float: Time to the window reset
+        :return: None
+        :doc-author: Trelent
+        """
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket.blocked_until = self.clock() + seconds
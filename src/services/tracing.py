@@ -0,0 +1,504 @@
+"""
+Lightweight request tracing.
+
+A request is traced when the incoming W3C ``traceparent`` header is sampled,
+or, without the header, with the probability of TRACING_SAMPLE_RATE. Spans
+of a traced request (JWT decoding, user lookup, rate limiter, SQL statements,
+redis commands, password hashing, response serialization) are kept in memory
+and written as one OTLP/JSON line (ExportTraceServiceRequest) when the
+request ends, by a background thread, to stdout or a file. Untraced requests
+only pay a context variable lookup per instrumented call.
+
+The file can be read by any OTLP/JSON file receiver, or by the collector
+stand-in of this module which prints traces as trees:
+
+    python -m src.services.tracing traces.jsonl
+    python -m src.services.tracing traces.jsonl --min-ms 100
+"""
+import argparse
+import functools
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import IO, Callable
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.conf.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+INVALID_SPAN_ID = "0" * 16
+
+# OTLP span kinds and status codes
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """
+    The parse_traceparent function parses a W3C traceparent header.
+
+    :param header: str | None: Value of the header
+    :return: A tuple of trace id, parent span id and the sampled flag, or None if the header is invalid
+    :doc-author: Trelent
+    """
+    match = TRACEPARENT_RE.match(header.strip().lower()) if header else None
+    if match is None:
+        return None
+
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == INVALID_TRACE_ID or parent_id == INVALID_SPAN_ID:
+        return None
+
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str | None, kind: int=KIND_INTERNAL,
+                 attributes: dict | None=None, start_ns: int | None=None) -> None:
+        self.trace = trace
+        self.span_id = new_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+
+    def end(self, end_ns: int | None=None) -> None:
+        self.end_ns = end_ns or time.time_ns()
+        self.trace.spans.append(self)
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self, trace_id: str) -> None:
+        self.trace_id = trace_id
+        self.spans: list[Span] = []
+
+
+current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def attribute_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+
+    return {"stringValue": str(value)}
+
+
+def otlp_span(span: Span) -> dict:
+    result = {"traceId": span.trace.trace_id,
+              "spanId": span.span_id,
+              "name": span.name,
+              "kind": span.kind,
+              "startTimeUnixNano": str(span.start_ns),
+              "endTimeUnixNano": str(span.end_ns),
+              "attributes": [{"key": key, "value": attribute_value(value)} for key, value in span.attributes.items()],
+              "status": {"code": STATUS_ERROR, "message": span.error} if span.error else {"code": STATUS_OK}}
+    if span.parent_id:
+        result["parentSpanId"] = span.parent_id
+
+    return result
+
+
+class JsonLinesExporter:
+    def __init__(self, service_name: str, stream_factory: Callable[[], IO[str]]) -> None:
+        """
+        The __init__ function sets the destination, the writer thread is started on first export.
+
+        :param self: Represent the instance of the class
+        :param service_name: str: Value of the service.name resource attribute
+        :param stream_factory: Callable[[], IO[str]]: Opens the stream the traces are written to
+        :return: None
+        :doc-author: Trelent
+        """
+        self.service_name = service_name
+        self.stream_factory = stream_factory
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+
+    def export(self, trace: Trace) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        self._queue.put(trace)
+
+
+    def encode(self, trace: Trace) -> str:
+        """
+        The encode function renders a trace as an OTLP/JSON ExportTraceServiceRequest.
+
+        :param self: Represent the instance of the class
+        :param trace: Trace: Finished trace
+        :return: One line of JSON
+        :doc-author: Trelent
+        """
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [otlp_span(span) for span in trace.spans]}],
+        }]}
+
+        return json.dumps(request, separators=(",", ":"))
+
+
+    def _run(self) -> None:
+        stream = self.stream_factory()
+        while True:
+            trace = self._queue.get()
+            if trace is None:
+                break
+            try:
+                stream.write(self.encode(trace) + "\n")
+                if self._queue.empty():
+                    stream.flush()
+            except Exception as err:
+                logger.warning("Trace export failed: %r", err)
+        stream.flush()
+        if stream is not sys.stdout:
+            stream.close()
+
+
+    def shutdown(self) -> None:
+        """
+        The shutdown function writes queued traces and stops the writer thread.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class Tracer:
+    def __init__(self, exporter: JsonLinesExporter | None, sample_rate: float=0.01) -> None:
+        """
+        The __init__ function sets the exporter and the sampling rate, without an exporter nothing is traced.
+
+        :param self: Represent the instance of the class
+        :param exporter: JsonLinesExporter | None: Destination of finished traces
+        :param sample_rate: float: Probability to trace a request without a traceparent header
+        :return: None
+        :doc-author: Trelent
+        """
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+
+    def start_trace(self, name: str, traceparent: str | None=None, attributes: dict | None=None) -> Span | None:
+        """
+        The start_trace function makes the sampling decision and opens the root span of a request.
+        A sampled parent is always followed, a parent which was not sampled is never traced.
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the span
+        :param traceparent: str | None: Incoming traceparent header
+        :param attributes: dict | None: Attributes of the span
+        :return: The server span, or None if the request is not traced
+        :doc-author: Trelent
+        """
+        if self.exporter is None:
+            return None
+
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id, sampled = new_id(128), None, random.random() < self.sample_rate
+
+        if not sampled:
+            return None
+
+        return Span(Trace(trace_id), name, parent_id, KIND_SERVER, attributes)
+
+
+    def finish_trace(self, span: Span) -> None:
+        span.end()
+        self.exporter.export(span.trace)
+
+
+    @contextmanager
+    def _span(self, parent: Span, name: str, kind: int, attributes: dict):
+        span = Span(parent.trace, name, parent.span_id, kind, attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as err:
+            span.error = repr(err)
+            raise
+        finally:
+            current_span.reset(token)
+            span.end()
+
+
+    def span(self, name: str, kind: int=KIND_INTERNAL, **attributes):
+        """
+        The span function returns a context manager which times the block as a child
+        of the current span. Outside of a traced request it does nothing.
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the span
+        :param kind: int: OTLP span kind
+        :param attributes: Attributes of the span
+        :return: A context manager which yields the span or None
+        :doc-author: Trelent
+        """
+        parent = current_span.get()
+        if parent is None:
+            return nullcontext()
+
+        return self._span(parent, name, kind, attributes)
+
+
+    def record(self, name: str, start_ns: int, end_ns: int, kind: int=KIND_INTERNAL, **attributes) -> None:
+        """
+        The record function adds a finished span, e.g. timed by engine events, to the current trace.
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the span
+        :param start_ns: int: Start in nanoseconds since epoch
+        :param end_ns: int: End in nanoseconds since epoch
+        :param kind: int: OTLP span kind
+        :param attributes: Attributes of the span
+        :return: None
+        :doc-author: Trelent
+        """
+        parent = current_span.get()
+        if parent is not None:
+            Span(parent.trace, name, parent.span_id, kind, attributes, start_ns).end(end_ns)
+
+
+    def traceparent(self) -> str | None:
+        span = current_span.get()
+
+        return span.traceparent() if span is not None else None
+
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def traced(name: str):
+    """
+    The traced function decorates a coroutine function, every call is a span.
+
+    :param name: str: Name of the span
+    :return: Decorator
+    :doc-author: Trelent
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """
+        The __call__ function traces sampled requests. The root span is named by the route template,
+        its traceparent is returned in the traceresponse header.
+
+        :param self: Represent the instance of the class
+        :param scope: Scope: ASGI scope
+        :param receive: Receive: ASGI receive channel
+        :param send: Send: ASGI send channel
+        :return: None
+        :doc-author: Trelent
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope["headers"]:
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        span = tracer.start_trace(scope["method"], traceparent,
+                                  {"http.method": scope["method"], "http.target": scope["path"]})
+        if span is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_trace(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.attributes["http.status_code"] = message["status"]
+                if message["status"] >= 500:
+                    span.error = f"HTTP {message['status']}"
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (b"traceresponse", span.traceparent().encode())]
+            await send(message)
+
+        token = current_span.set(span)
+        try:
+            await self.app(scope, receive, send_with_trace)
+        except BaseException as err:
+            span.error = repr(err)
+            raise
+        finally:
+            current_span.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                span.name = f"{scope['method']} {route}"
+                span.attributes["http.route"] = route
+            tracer.finish_trace(span)
+
+
+def instrument_fastapi() -> None:
+    """
+    The instrument_fastapi function traces validation and encoding of response models,
+    which FastAPI runs in fastapi.routing.serialize_response.
+
+    :return: None
+    :doc-author: Trelent
+    """
+    import fastapi.routing
+
+    serialize_response = fastapi.routing.serialize_response
+    if getattr(serialize_response, "__traced__", False):
+        return
+
+    @functools.wraps(serialize_response)
+    async def traced_serialize_response(*args, **kwargs):
+        with tracer.span("serialize_response"):
+            return await serialize_response(*args, **kwargs)
+
+    traced_serialize_response.__traced__ = True
+    fastapi.routing.serialize_response = traced_serialize_response
+
+
+def make_tracer(exporter: str, path: str, service_name: str, sample_rate: float) -> Tracer:
+    """
+    The make_tracer function creates the tracer selected in settings.
+
+    :param exporter: str: none, stdout or file
+    :param path: str: File of the file exporter
+    :param service_name: str: Name of the service in exported traces
+    :param sample_rate: float: Probability to trace a request without a traceparent header
+    :return: Tracer
+    :doc-author: Trelent
+    """
+    if exporter == "stdout":
+        return Tracer(JsonLinesExporter(service_name, lambda: sys.stdout), sample_rate)
+    if exporter == "file":
+        return Tracer(JsonLinesExporter(service_name, lambda: open(path, "a", encoding="utf-8")), sample_rate)
+
+    return Tracer(None, sample_rate)
+
+
+tracer = make_tracer(settings.tracing.exporter, settings.tracing.file,
+                     settings.tracing.service_name, settings.tracing.sample_rate)
+
+
+def read_traces(lines) -> dict[str, list[dict]]:
+    """
+    The read_traces function groups spans of OTLP/JSON lines by trace id.
+
+    :param lines: Lines of an OTLP/JSON file
+    :return: A dict of span lists by trace id
+    :doc-author: Trelent
+    """
+    traces: dict[str, list[dict]] = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        for resource in json.loads(line).get("resourceSpans", []):
+            for scope_spans in resource.get("scopeSpans", []):
+                for span in scope_spans.get("spans", []):
+                    traces.setdefault(span["traceId"], []).append(span)
+
+    return traces
+
+
+def format_trace(spans: list[dict]) -> list[str]:
+    """
+    The format_trace function renders a trace as a tree of spans with offsets and durations.
+
+    :param spans: list[dict]: OTLP spans of one trace
+    :return: Lines of the tree
+    :doc-author: Trelent
+    """
+    ids = {span["spanId"] for span in spans}
+    children: dict[str | None, list[dict]] = {}
+    for span in spans:
+        parent = span.get("parentSpanId")
+        children.setdefault(parent if parent in ids else None, []).append(span)
+    start = min(int(span["startTimeUnixNano"]) for span in spans)
+    lines = []
+
+    def walk(span: dict, depth: int) -> None:
+        offset = (int(span["startTimeUnixNano"]) - start) / 1e6
+        duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+        error = " ERROR" if span.get("status", {}).get("code") == STATUS_ERROR else ""
+        lines.append(f"{offset:9.2f} ms {duration:9.2f} ms {'  ' * depth}{span['name']}{error}")
+        for child in sorted(children.get(span["spanId"], []), key=lambda item: int(item["startTimeUnixNano"])):
+            walk(child, depth + 1)
+
+    for root in sorted(children.get(None, []), key=lambda item: int(item["startTimeUnixNano"])):
+        walk(root, 0)
+
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", help="OTLP/JSON lines file, - for stdin")
+    parser.add_argument("--min-ms", type=float, default=0, help="Show traces longer than this")
+    args = parser.parse_args()
+
+    source = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    with source:
+        for trace_id, spans in read_traces(source).items():
+            duration = (max(int(span["endTimeUnixNano"]) for span in spans)
+                        - min(int(span["startTimeUnixNano"]) for span in spans)) / 1e6
+            if duration < args.min_ms:
+                continue
+            print(f"trace {trace_id} {duration:.2f} ms")
+            print("\n".join(format_trace(spans)))
+            print()
@@ -0,0 +1,108 @@
+"""
+Rebuild of the redis birthday calendars from Postgres.
+
+ContactRepo keeps calendars up to date, the rebuild repairs changes lost
+on redis errors or made outside of the API. Run it nightly, e.g. with cron:
+
+    python -m src.workers.birthday_calendar
+    python -m src.workers.birthday_calendar --user 42   # one user
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import redis.asyncio as redis
+from sqlalchemy import select
+from sqlalchemy.orm import Session, sessionmaker
+
+from src.models.contact import Contact
+from src.models.user import User
+from src.services.birthday_calendar import birthday_calendar
+
+
+logger = logging.getLogger(__name__)
+
+
+async def rebuild_owners(db: Session, cache: redis.Redis, owner_ids: list[int]) -> list[int]:
+    """
+    The rebuild_owners function replaces calendars of the users with birthdays read from Postgres.
+    Versions of the calendars are read before the contacts, a calendar changed meanwhile is not written.
+
+    :param db: Session: Database session
+    :param cache: redis.Redis: Redis client
+    :param owner_ids: list[int]: Users whose calendars are rebuilt
+    :return: Ids of users whose calendars changed during the rebuild
+    :doc-author: Trelent
+    """
+    versions = await birthday_calendar.versions(cache, owner_ids)
+    birthdays = {owner_id: [] for owner_id in owner_ids}
+    statement = select(Contact.user_id, Contact.id, Contact.birth_date).where(Contact.user_id.in_(owner_ids))
+    for owner_id, contact_id, birth_date in db.execute(statement):
+        birthdays[owner_id].append((contact_id, birth_date))
+
+    return [owner_id for owner_id in owner_ids
+            if not await birthday_calendar.build(cache, owner_id, birthdays[owner_id], versions[owner_id])]
+
+
+async def rebuild(session_factory: sessionmaker, cache: redis.Redis, user_id: int | None=None,
+                  batch_size: int=1000) -> int:
+    """
+    The rebuild function replaces calendars of all users, or of one user, with
+    birthdays read from Postgres, batch_size users at a time. Calendars changed
+    during the rebuild are rebuilt once more, if they change again they are left
+    to the incremental updates.
+
+    :param session_factory: sessionmaker: Factory of database sessions
+    :param cache: redis.Redis: Redis client
+    :param user_id: int | None: Rebuild only the calendar of this user
+    :param batch_size: int: Users rebuilt at once
+    :return: Number of rebuilt calendars
+    :doc-author: Trelent
+    """
+    rebuilt = 0
+    conflicts = []
+    last_id = 0
+    with session_factory() as db:
+        while True:
+            statement = select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+            if user_id is not None:
+                statement = statement.where(User.id == user_id)
+            owner_ids = list(db.scalars(statement))
+            if not owner_ids:
+                break
+
+            last_id = owner_ids[-1]
+            changed = await rebuild_owners(db, cache, owner_ids)
+            rebuilt += len(owner_ids) - len(changed)
+            conflicts.extend(changed)
+
+        for start in range(0, len(conflicts), batch_size):
+            owner_ids = conflicts[start:start + batch_size]
+            changed = await rebuild_owners(db, cache, owner_ids)
+            rebuilt += len(owner_ids) - len(changed)
+            if changed:
+                logger.warning("Calendars of users %s changed during the rebuild, skipped", changed)
+
+    return rebuilt
+
+
+async def main(user_id: int | None) -> None:
+    from src.dependencies.cache import get_client, close_cache
+    from src.dependencies.db import SessionLocal
+
+    started = time.perf_counter()
+    try:
+        rebuilt = await rebuild(SessionLocal, get_client(), user_id)
+    finally:
+        await close_cache()
+    logger.info("Rebuilt %s birthday calendars in %.1f s", rebuilt, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", type=int, help="Rebuild the calendar of one user")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    asyncio.run(main(args.user))
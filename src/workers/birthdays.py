@@ -0,0 +1,173 @@
+"""
+Daily birthday digest: one email per user listing contacts with upcoming birthdays.
+
+All owners are served by one streaming query over the month/day index of
+contacts, rows are grouped per owner and written to the outbox in batches,
+the outbox worker sends them over the pooled mail connections.
+
+A run is idempotent per day: every digest has the dedup key
+``birthday_digest:<day>:<user id>``. It is also resumable: the last user of a
+committed batch is kept in Redis, a restarted run continues after it.
+Schedule it once a day, e.g. with cron:
+
+    python -m src.workers.birthdays
+    python -m src.workers.birthdays --day 2024-02-28   # run for another day
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import date
+from itertools import groupby, islice
+
+import redis.asyncio as redis
+from prometheus_client import start_http_server
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from src.conf.config import settings
+from src.models.contact import Contact
+from src.models.user import User
+from src.repository.contacts_repo import upcoming_days, birthday_filter
+from src.repository.outbox_repo import OutboxRepo
+from src.services.metrics import BIRTHDAY_DIGESTS, BIRTHDAY_CONTACTS, BIRTHDAY_JOB_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+KIND = "birthday_digest"
+
+
+class BirthdayDigestJob:
+    def __init__(self,
+                 session_factory: sessionmaker,
+                 cache: redis.Redis,
+                 days: int=7,
+                 batch_size: int=500,
+                 cursor_ttl: int=2 * 24 * 3600) -> None:
+        """
+        The __init__ function sets the digest policy.
+
+        :param self: Represent the instance of the class
+        :param session_factory: sessionmaker: Factory of database sessions
+        :param cache: redis.Redis: Keeps the cursor of an unfinished run
+        :param days: int: Number of days in a digest, starting from the day of the run
+        :param batch_size: int: Digests written to the outbox in one transaction, also rows fetched at once
+        :param cursor_ttl: int: Seconds the cursor of a run is kept
+        :return: None
+        :doc-author: Trelent
+        """
+        self.session_factory = session_factory
+        self.cache = cache
+        self.days = days
+        self.batch_size = batch_size
+        self.cursor_ttl = cursor_ttl
+
+
+    @staticmethod
+    def cursor_key(day: date) -> str:
+        return f"birthdays:digest:{day.isoformat()}:cursor"
+
+
+    @staticmethod
+    def dedup_key(day: date, user_id: int) -> str:
+        return f"{KIND}:{day.isoformat()}:{user_id}"
+
+
+    def digests(self, db, day: date, after_user_id: int):
+        """
+        The digests function streams contacts with upcoming birthdays of all users
+        with a server side cursor and yields them grouped per user.
+
+        :param self: Represent the instance of the class
+        :param db: Session: Database session used only for reading
+        :param day: date: First day of the digest
+        :param after_user_id: int: Users up to this id are already done
+        :return: A generator of (user_id, email, contacts) tuples
+        :doc-author: Trelent
+        """
+        days = upcoming_days(day, self.days)
+        order = {month_day: index for index, month_day in enumerate(days)}
+        statement = (select(User.id, User.email, Contact.first_name, Contact.last_name,
+                            Contact.email, Contact.phone, Contact.birth_date)
+                     .join(Contact, Contact.user_id == User.id)
+                     .where(birthday_filter(days), User.id > after_user_id)
+                     .order_by(User.id)
+                     .execution_options(yield_per=self.batch_size))
+
+        for (user_id, email), rows in groupby(db.execute(statement), key=lambda row: (row[0], row[1])):
+            contacts = [{"first_name": row[2], "last_name": row[3], "email": row[4], "phone": row[5],
+                         "birth_date": row[6].isoformat()}
+                        for row in rows]
+            BIRTHDAY_CONTACTS.inc(len(contacts))
+            contacts.sort(key=lambda contact: order.get((int(contact["birth_date"][5:7]),
+                                                         int(contact["birth_date"][8:10])), 0))
+            yield user_id, email, contacts
+
+
+    def write(self, day: date, batch: list[tuple[int, str, list]]) -> int:
+        messages = [(KIND, {"email": email, "day": day.isoformat(), "contacts": contacts}, self.dedup_key(day, user_id))
+                    for user_id, email, contacts in batch]
+        with self.session_factory() as db:
+            return OutboxRepo(db).enqueue_unique(messages)
+
+
+    async def run(self, day: date) -> int:
+        """
+        The run function writes digests of the day to the outbox, continuing after
+        the cursor of an interrupted run. Digests already in the outbox are skipped.
+
+        :param self: Represent the instance of the class
+        :param day: date: Day of the run
+        :return: Number of new digests
+        :doc-author: Trelent
+        """
+        started = time.perf_counter()
+        key = self.cursor_key(day)
+        after_user_id = int(await self.cache.get(key) or 0)
+        if after_user_id:
+            logger.info("Resuming birthday digests of %s after user %s", day, after_user_id)
+
+        written = total = 0
+        with self.session_factory() as db:
+            digests = self.digests(db, day, after_user_id)
+            while batch := await asyncio.to_thread(lambda: list(islice(digests, self.batch_size))):
+                inserted = await asyncio.to_thread(self.write, day, batch)
+                await self.cache.set(key, batch[-1][0], ex=self.cursor_ttl)
+                BIRTHDAY_DIGESTS.labels("written").inc(inserted)
+                BIRTHDAY_DIGESTS.labels("duplicate").inc(len(batch) - inserted)
+                written += inserted
+                total += len(batch)
+
+        elapsed = time.perf_counter() - started
+        BIRTHDAY_JOB_SECONDS.observe(elapsed)
+        logger.info("Birthday digests of %s: %s written, %s already sent, %.1f s (%.0f users/s)",
+                    day, written, total - written, elapsed, total / elapsed if elapsed else 0)
+
+        return written
+
+
+async def main(day: date) -> None:
+    from src.dependencies.cache import get_client, close_cache
+    from src.dependencies.db import SessionLocal
+
+    job = BirthdayDigestJob(SessionLocal, get_client(),
+                            days=settings.birthdays.days,
+                            batch_size=settings.birthdays.batch_size,
+                            cursor_ttl=settings.birthdays.cursor_ttl)
+    try:
+        await job.run(day)
+    finally:
+        await close_cache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--day", type=date.fromisoformat, default=date.today(), help="Day of the digest, today by default")
+    parser.add_argument("--metrics-port", type=int, help="Expose prometheus metrics on this port")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    asyncio.run(main(args.day))
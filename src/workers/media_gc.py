@@ -0,0 +1,61 @@
+"""
+Garbage collection of the local content-addressed media store.
+
+Identical avatars of several users are one file, so replaced avatars are not
+removed when a user uploads a new one. Run the collector from time to time,
+e.g. nightly with cron, to remove files no user refers to:
+
+    python -m src.workers.media_gc
+    python -m src.workers.media_gc --min-age 86400   # keep files written in the last day
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from src.models.user import User
+from src.services.media import LocalMediaStorage
+
+
+logger = logging.getLogger(__name__)
+
+
+def collect(session_factory: sessionmaker, storage: LocalMediaStorage, min_age: float=3600.0) -> int:
+    """
+    The collect function removes stored files which are not the avatar of any user.
+    References are read before the store is listed, files written or uploaded again meanwhile
+    are protected by min_age.
+
+    :param session_factory: sessionmaker: Factory of database sessions
+    :param storage: LocalMediaStorage: The local media store
+    :param min_age: float: Seconds a file is kept after it was written
+    :return: Number of removed files
+    :doc-author: Trelent
+    """
+    with session_factory() as db:
+        referenced = set(db.scalars(select(User.avatar_cld).where(User.avatar_cld.is_not(None)).distinct()))
+
+    return storage.collect_garbage(referenced, min_age)
+
+
+def main(min_age: float) -> None:
+    from src.dependencies.db import SessionLocal
+    from src.services.media import media_storage
+
+    if not isinstance(media_storage, LocalMediaStorage):
+        raise SystemExit("Garbage collection is only needed for MEDIA_BACKEND=local")
+
+    started = time.perf_counter()
+    removed = collect(SessionLocal, media_storage, min_age)
+    logger.info("Removed %s unreferenced media files in %.1f s", removed, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-age", type=float, default=3600.0, help="Keep files written in the last N seconds")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    main(args.min_age)
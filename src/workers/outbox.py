@@ -0,0 +1,209 @@
+"""
+Outbox worker: delivers messages written to the outbox table by API requests.
+
+Messages are claimed with ``FOR UPDATE SKIP LOCKED``, so several workers may
+run side by side. A failed message is retried with exponential backoff and
+moves to dead letters after the last attempt. Delivery is at least once: a
+message of a crashed worker is claimed again when its lease expires.
+
+    python -m src.workers.outbox
+    python -m src.workers.outbox --once           # drain due messages and exit
+    python -m src.workers.outbox --requeue-dead   # retry dead letters
+"""
+import argparse
+import asyncio
+import logging
+import random
+import signal
+
+from prometheus_client import start_http_server
+from sqlalchemy.orm import sessionmaker
+
+from src.conf.config import settings
+from src.repository.outbox_repo import OutboxRepo
+from src.services.mail import confirm_email, password_reset_email, birthday_digest, mail_sender
+from src.services.metrics import OUTBOX_DELIVERED, OUTBOX_FAILED, OUTBOX_DEAD
+
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {
+    "confirm_email": confirm_email,
+    "password_reset_email": password_reset_email,
+    "birthday_digest": birthday_digest,
+}
+
+
+class OutboxWorker:
+    def __init__(self,
+                 session_factory: sessionmaker,
+                 handlers: dict=HANDLERS,
+                 batch_size: int=50,
+                 concurrency: int=8,
+                 max_attempts: int=8,
+                 base_delay: float=5.0,
+                 max_delay: float=3600.0,
+                 lease: float=300.0,
+                 poll_interval: float=1.0) -> None:
+        """
+        The __init__ function sets the delivery policy.
+
+        :param self: Represent the instance of the class
+        :param session_factory: sessionmaker: Factory of database sessions
+        :param handlers: dict: Coroutine functions by message kind, called with the payload as keyword arguments
+        :param batch_size: int: Largest number of messages claimed at once
+        :param concurrency: int: Largest number of messages delivered at the same time
+        :param max_attempts: int: Attempts before a message moves to dead letters
+        :param base_delay: float: Seconds before the first retry, every next retry waits twice longer
+        :param max_delay: float: Longest wait between retries
+        :param lease: float: Seconds a claimed message is hidden from other workers
+        :param poll_interval: float: Seconds to wait when there are no due messages
+        :return: None
+        :doc-author: Trelent
+        """
+        self.session_factory = session_factory
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.stopping = asyncio.Event()
+
+
+    def retry_in(self, attempts: int) -> float | None:
+        """
+        The retry_in function returns the backoff before the next attempt with a random jitter.
+
+        :param self: Represent the instance of the class
+        :param attempts: int: Attempts made
+        :return: Seconds to the next attempt or None if no attempts are left
+        :doc-author: Trelent
+        """
+        if attempts >= self.max_attempts:
+            return None
+
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+
+        return delay * random.uniform(0.8, 1.2)
+
+
+    def _repo_call(self, method: str, *args):
+        with self.session_factory() as db:
+            return getattr(OutboxRepo(db), method)(*args)
+
+
+    async def deliver(self, row) -> None:
+        """
+        The deliver function calls the handler of the message and records the result.
+
+        :param self: Represent the instance of the class
+        :param row: Claimed message with id, kind, payload and attempts
+        :return: None
+        :doc-author: Trelent
+        """
+        async with self.semaphore:
+            handler = self.handlers.get(row.kind)
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler for {row.kind}")
+                await handler(**row.payload)
+            except Exception as err:
+                retry_in = self.retry_in(row.attempts) if handler is not None else None
+                OUTBOX_FAILED.labels(row.kind).inc()
+                if retry_in is None:
+                    OUTBOX_DEAD.labels(row.kind).inc()
+                    logger.error("Outbox message %s (%s) is dead after %s attempts: %r",
+                                 row.id, row.kind, row.attempts, err)
+                else:
+                    logger.warning("Outbox message %s (%s) failed, retry in %.0f s: %r",
+                                   row.id, row.kind, retry_in, err)
+                await asyncio.to_thread(self._repo_call, "mark_failed", row.id, repr(err), retry_in)
+            else:
+                OUTBOX_DELIVERED.labels(row.kind).inc()
+                await asyncio.to_thread(self._repo_call, "mark_sent", row.id)
+
+
+    async def run_once(self) -> int:
+        """
+        The run_once function claims one batch of due messages and delivers it.
+
+        :param self: Represent the instance of the class
+        :return: Number of claimed messages
+        :doc-author: Trelent
+        """
+        rows = await asyncio.to_thread(self._repo_call, "claim", self.batch_size, self.lease)
+        await asyncio.gather(*(self.deliver(row) for row in rows))
+
+        return len(rows)
+
+
+    async def run(self) -> None:
+        """
+        The run function delivers messages until stop is called, an empty poll waits poll_interval.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        while not self.stopping.is_set():
+            try:
+                claimed = await self.run_once()
+            except Exception as err:
+                logger.exception("Outbox poll failed: %r", err)
+                claimed = 0
+
+            if claimed == 0:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+
+async def main(once: bool) -> None:
+    from src.dependencies.db import SessionLocal
+
+    worker = OutboxWorker(SessionLocal,
+                          batch_size=settings.outbox.batch_size,
+                          concurrency=settings.outbox.concurrency,
+                          max_attempts=settings.outbox.max_attempts,
+                          base_delay=settings.outbox.base_delay,
+                          max_delay=settings.outbox.max_delay,
+                          lease=settings.outbox.lease,
+                          poll_interval=settings.outbox.poll_interval)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        if once:
+            while await worker.run_once():
+                pass
+        else:
+            await worker.run()
+    finally:
+        await mail_sender.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="Deliver due messages and exit")
+    parser.add_argument("--requeue-dead", action="store_true", help="Return dead letters to the queue and exit")
+    parser.add_argument("--metrics-port", type=int, help="Expose prometheus metrics on this port")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.requeue_dead:
+        from src.dependencies.db import SessionLocal
+        with SessionLocal() as db:
+            print(f"Requeued {OutboxRepo(db).requeue_dead()} messages")
+    else:
+        if args.metrics_port:
+            start_http_server(args.metrics_port)
+        asyncio.run(main(args.once))
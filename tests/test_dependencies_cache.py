@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeConnection
+
+from src.dependencies.cache import init_cache, close_cache, get_cache
+from src.services.metrics import REDIS_POOL_IN_USE, REDIS_POOL_CREATED, REDIS_COMMAND_LATENCY
+
+
+class TestCachePool(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.pool = init_cache(connection_class=FakeConnection, server=FakeServer(),
+                               health_check_interval=0, max_connections=4)
+
+
+    async def asyncTearDown(self):
+        await close_cache()
+
+
+    async def test_shared_pool(self):
+        cache1 = await get_cache()
+        cache2 = await get_cache()
+
+        await cache1.set("key", 1)
+
+        self.assertIs(cache1.connection_pool, self.pool)
+        self.assertIs(cache2.connection_pool, self.pool)
+        self.assertEqual(await cache2.get("key"), b"1")
+
+
+    async def test_max_connections(self):
+        cache = await get_cache()
+        created = REDIS_POOL_CREATED._value.get()
+
+        await asyncio.gather(*[cache.incr("counter") for _ in range(20)])
+
+        self.assertEqual(await cache.get("counter"), b"20")
+        self.assertLessEqual(REDIS_POOL_CREATED._value.get() - created, 4)
+        self.assertEqual(REDIS_POOL_IN_USE._value.get(), 0)
+
+
+    async def test_failed_checkout_keeps_gauge(self):
+        async def fail(connection):
+            raise ConnectionError("connection lost")
+
+        self.pool.ensure_connection = fail
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                await self.pool.get_connection()
+
+        self.assertEqual(REDIS_POOL_IN_USE._value.get(), 0)
+        self.assertEqual(len(self.pool._in_use_connections), 0)
+
+
+    async def test_command_latency(self):
+        cache = await get_cache()
+        set_count = self.samples("SET")
+        multi_count = self.samples("MULTI")
+
+        await cache.set("key", 1)
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.incr("counter")
+            pipe.get("key")
+            await pipe.execute()
+
+        self.assertEqual(self.samples("SET"), set_count + 1)
+        self.assertEqual(self.samples("MULTI"), multi_count + 1)
+
+
+    def samples(self, command: str) -> float:
+        for metric in REDIS_COMMAND_LATENCY.collect():
+            for sample in metric.samples:
+                if sample.name.endswith("_count") and sample.labels["command"] == command:
+                    return sample.value
+
+        return 0
+
+
+
+if __name__ == '__main__':
+    unittest.main()
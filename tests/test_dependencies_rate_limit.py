@@ -0,0 +1,42 @@
+import unittest
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from src.dependencies.rate_limit import fetch_principal
+
+
+class TestFetchPrincipal(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.cache = FakeRedis(server=self.server)
+
+
+    async def test_window_budget(self):
+        results = [await fetch_principal(self.cache, "user@example.com", "ratelimit:1:test", 3, 60_000)
+                   for _ in range(4)]
+
+        self.assertEqual([allowed for _, allowed, *_ in results], [True, True, True, False])
+        _, _, current, ttl, wait = results[-1]
+        self.assertEqual(current, 3)
+        self.assertEqual(wait, ttl)
+        self.assertGreater(wait, 59_000)
+
+
+    async def test_burst_shared_by_workers(self):
+        workers = [FakeRedis(server=self.server) for _ in range(2)]
+
+        results = [await fetch_principal(workers[i % 2], "user@example.com", "ratelimit:1:test", 10, 60_000,
+                                         cost=2, burst=4)
+                   for i in range(3)]
+
+        self.assertEqual([allowed for _, allowed, *_ in results], [True, True, False])
+        _, _, current, ttl, wait = results[-1]
+        self.assertEqual(current, 4)
+        self.assertGreater(ttl, wait)
+        self.assertTrue(0 < wait <= 24_000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
 from collections.abc import Callable
 from typing import Any
 import unittest
+from unittest import mock
 
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+import redis.asyncio as redis
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from datetime import date, timedelta
@@ -10,6 +14,8 @@ from src.models.contact import Contact
 from src.models.user import User, Base
 from src.schemas.contact_schema import ContactModel, ContactResponse
 from src.repository.contacts_repo import ContactRepo
+from src.services.birthday_calendar import birthday_calendar, calendar_key
+from src.services.metrics import BIRTHDAY_CALENDAR_ERRORS
 import os
 import dotenv
 
@@ -351,6 +357,67 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result, [])
 
 
+    async def test_get_birthdays_from_calendar(self):
+        user = self.users[0]
+        cache = FakeRedis(server=FakeServer())
+        repo = ContactRepo(db=self.session, user=user, cache=cache)
+
+        result = await repo.get_birthdays(2)
+
+        self.assertListEqual(result, self.contacts[0:2])
+        self.assertTrue(await cache.exists(calendar_key(user.id)))
+        self.assertListEqual(await repo.get_birthdays(1), self.contacts[0:1])
+
+
+    async def test_calendar_follows_changes(self):
+        user = self.users[0]
+        cache = FakeRedis(server=FakeServer())
+        repo = ContactRepo(db=self.session, user=user, cache=cache)
+        await repo.get_birthdays(2)
+        body = ContactModel(first_name="Ivan", last_name="Franko", email="franko@gmail.com",
+                            phone="+380501234567", birth_date=(date.today() + timedelta(days=1)).replace(year=1856), description=None)
+
+        created = await repo.create_contact(body)
+        self.assertListEqual(await repo.get_birthdays(2), self.contacts[0:2] + [created])
+
+        body.birth_date = (date.today() + timedelta(days=5)).replace(year=1856)
+        await repo.update_contact(created.id, body)
+        self.assertListEqual(await repo.get_birthdays(2), self.contacts[0:2])
+        self.assertListEqual(await repo.get_birthdays(6), self.contacts[0:2] + [created])
+
+        await repo.delete_contact(self.contacts[0].id)
+        self.assertListEqual(await repo.get_birthdays(6), [self.contacts[1], created])
+
+
+    async def test_calendar_errors_after_commit(self):
+        user = self.users[0]
+        cache = FakeRedis(server=FakeServer())
+        repo = ContactRepo(db=self.session, user=user, cache=cache)
+        body = ContactModel(first_name="Lesya", last_name="Ukrainka", email="ukrainka@gmail.com",
+                            phone="+380501234568", birth_date=date.today().replace(year=1871), description=None)
+        errors = BIRTHDAY_CALENDAR_ERRORS.labels("update")._value.get()
+
+        with mock.patch.object(cache, "eval", side_effect=redis.ConnectionError("down")):
+            created = await repo.create_contact(body)
+            await repo.delete_contact(created.id)
+
+        self.assertIsNotNone(created.id)
+        self.assertIsNone(self.session.get(Contact, created.id))
+        self.assertEqual(BIRTHDAY_CALENDAR_ERRORS.labels("update")._value.get(), errors + 2)
+
+
+    async def test_get_birthdays_falls_back_on_build_conflict(self):
+        user = self.users[0]
+        cache = FakeRedis(server=FakeServer())
+        repo = ContactRepo(db=self.session, user=user, cache=cache)
+
+        with mock.patch.object(birthday_calendar, "version", return_value=-1):
+            result = await repo.get_birthdays(2)
+
+        self.assertListEqual(result, self.contacts[0:2])
+        self.assertFalse(await cache.exists(calendar_key(user.id)))
+
+
     async def test_get_unique_contact_found(self):
         user = self.users[0]
         contact = self.contacts[1]
@@ -1,13 +1,15 @@
+import pickle
 from typing import Any
 import unittest
 from unittest.mock import patch, Mock
 
+from fakeredis.aioredis import FakeRedis
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from src.models.user import User, Base
 from src.schemas.user_schema import UserModel
-from src.repository.users_repo import UserRepo
+from src.repository.users_repo import UserRepo, USER_CACHE_TTL, user_cache_key
 from src.services.hash_handler import pwd_handler
 from src.services.media import MediaCloud
 import os
@@ -75,7 +77,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
                         password="555"
                         )
         
-        with patch.object(pwd_handler, "get_password_hash", return_value=password) as hash_mock:
+        with patch.object(pwd_handler, "get_password_hash_async", return_value=password) as hash_mock:
             result = await UserRepo(db=self.session).create_user(user)
 
             self.assertEqual(result, User(email=user.username, password=user.password))
@@ -95,7 +97,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
     async def test_update_password(self):
         user = self.users[1]
         password = "000"
-        with patch.object(pwd_handler, "get_password_hash", return_value=password) as hash_mock:
+        with patch.object(pwd_handler, "get_password_hash_async", return_value=password) as hash_mock:
             result = await UserRepo(db=self.session).update_password(user=user, password=password)
 
             self.assertEqual(result.password, password)
@@ -156,5 +158,17 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.avatar_cld, public_id)
 
 
+    async def test_update_keeps_snapshot_fresh(self):
+        user = self.users[0]
+        cache = FakeRedis()
+        
+        result = await UserRepo(db=self.session, cache=cache).confirmed_email(user.email)
+        snapshot = pickle.loads(await cache.get(user_cache_key(user.email)))
+
+        self.assertTrue(snapshot.confirmed)
+        self.assertEqual(snapshot.id, result.id)
+        self.assertLessEqual(await cache.ttl(user_cache_key(user.email)), USER_CACHE_TTL)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,140 @@
+import pytest
+from fakeredis.aioredis import FakeRedis
+from pyinstrument import Profiler
+
+from src.conf.config import settings
+from src.dependencies import cache
+from src.dependencies.cache import get_client
+from src.services import profiling
+from src.services.profiling import ProfileStore, profile_store
+
+
+@pytest.fixture
+def admin(monkeypatch, user):
+    monkeypatch.setattr(settings, "admin_emails", [user.get("username")])
+
+
+@pytest.fixture(autouse=True)
+def profiling_cache(monkeypatch, cache_server):
+    monkeypatch.setattr(profiling, "get_client", lambda: FakeRedis(server=cache_server))
+
+
+@pytest.fixture(autouse=True)
+def profiles_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(profile_store, "directory", tmp_path)
+
+    return tmp_path
+
+
+def test_profiles_forbidden(client, token):
+    response = client.get("/api/admin/profiles", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 403, response.text
+
+
+def test_profile_header_ignored_for_users(client, token, profiles_dir):
+    response = client.get("/api/contacts/", params={"limit": 100},
+                          headers={"Authorization": f"Bearer {token}", "X-Profile": "1"})
+
+    assert response.status_code == 200, response.text
+    assert "x-profile-id" not in response.headers
+    assert list(profiles_dir.iterdir()) == []
+
+
+def test_profile_request(client, token, admin):
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.get("/api/contacts/", params={"limit": 100}, headers={**headers, "X-Profile": "1"})
+
+    assert response.status_code == 200, response.text
+    name = response.headers["x-profile-id"]
+    assert "-GET-api_contacts-" in name
+
+    profiles = client.get("/api/admin/profiles", headers=headers).json()
+    assert [profile["name"] for profile in profiles] == [name]
+
+    download = client.get(f"/api/admin/profiles/{name}", headers=headers)
+    assert download.status_code == 200
+    assert download.headers["content-type"].startswith("text/html")
+    assert "pyinstrument" in download.text
+
+
+def test_profile_header_ignored_for_revoked_token(client, user, admin, profiles_dir):
+    revoked = client.post("/api/auth/signin", data=user).json()["access_token"]
+    headers = {"Authorization": f"Bearer {revoked}"}
+    assert client.post("/api/auth/logout", headers=headers).status_code == 200
+
+    response = client.get("/api/contacts/", params={"limit": 100}, headers={**headers, "X-Profile": "1"})
+
+    assert "x-profile-id" not in response.headers
+    assert list(profiles_dir.iterdir()) == []
+
+
+def test_download_unknown_profile(client, token, admin):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.get("/api/admin/profiles/missing.html", headers=headers).status_code == 404
+    assert client.get("/api/admin/profiles/..%2Fmain.py", headers=headers).status_code == 404
+    assert profile_store.path("../main.html") is None
+
+
+def test_store_keeps_latest_speedscope_profiles(tmp_path):
+    store = ProfileStore(str(tmp_path), "speedscope", keep=2)
+    for i in range(3):
+        profiler = Profiler()
+        profiler.start()
+        sum(range(1000))
+        profiler.stop()
+        store.save(f"profile-{i}.speedscope.json", profiler)
+
+    assert len(store.list()) == 2
+    assert '"$schema": "https://www.speedscope.app/file-format-schema.json"' in store.list()[0].read_text()
+
+
+def test_memory_endpoints_forbidden(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.post("/api/admin/memory/tracemalloc/start", headers=headers).status_code == 403
+    assert client.get("/api/admin/memory/objects", headers=headers).status_code == 403
+
+
+def test_tracemalloc_snapshot_diff(client, token, admin):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    assert client.post("/api/admin/memory/snapshots", headers=headers).status_code == 409
+
+    started = client.post("/api/admin/memory/tracemalloc/start", params={"frames": 2}, headers=headers).json()
+    try:
+        assert started["tracing"] and started["frames"] == 2
+        first = client.post("/api/admin/memory/snapshots", headers=headers).json()
+        leak = [bytearray(1024) for _ in range(1000)]
+        second = client.post("/api/admin/memory/snapshots", headers=headers).json()
+
+        response = client.get("/api/admin/memory/snapshots/diff", headers=headers,
+                               params={"first": first["id"], "second": second["id"], "limit": 5})
+        assert response.status_code == 200, response.text
+        top = response.json()[0]
+        assert "test_router_admin.py" in top["location"]
+        assert top["size_diff"] >= 1000 * 1024
+        assert top["count_diff"] >= 1000
+
+        response = client.get("/api/admin/memory/snapshots/diff", headers=headers,
+                               params={"first": first["id"], "second": 999})
+        assert response.status_code == 404
+        assert len(leak) == 1000
+    finally:
+        stopped = client.post("/api/admin/memory/tracemalloc/stop", headers=headers).json()
+
+    assert not stopped["tracing"] and stopped["snapshots"] == []
+
+
+def test_object_counts(client, token, admin):
+    assert get_client().connection_pool is cache.pool
+    response = client.get("/api/admin/memory/objects", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200, response.text
+    counts = response.json()
+    assert counts["entities"]["User"]["total"] >= 1
+    assert {"Contact", "OutboxMessage"} <= counts["entities"].keys()
+    assert counts["sessions"] >= 1
+    # The test keeps no client, the shared pool of the app is still alive
+    assert counts["redis"]["pools"] >= 1
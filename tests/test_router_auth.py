@@ -1,14 +1,20 @@
+import asyncio
 from unittest.mock import MagicMock, patch
 from fastapi.testclient import TestClient
+from fakeredis.aioredis import FakeRedis
 
 from src.models.user import User
+from src.models.outbox import OutboxMessage
+from src.repository.users_repo import user_cache_key
 from src.routes.auth import security
 from src.services.auth import auth_token
+from src.services.hash_handler import pwd_handler, make_context
+from src.services.revocation import revocation_list
+from src.services.login_throttle import login_throttle
+from src.services.metrics import PASSWORD_REHASHED
 
 
-def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.confirm_email", mock_send_email)
+def test_create_user(client, session, user):
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -17,9 +23,12 @@ def test_create_user(client, user, monkeypatch):
     data = response.json()
     assert data["user"]["email"] == user.get("username")
     assert "id" in data["user"]
+    message = session.query(OutboxMessage).filter(OutboxMessage.kind == "confirm_email").one()
+    assert message.payload == {"email": user.get("username"), "host": "http://testserver/"}
+    assert message.status == "pending"
 
 
-def test_repeat_create_user(client, user):
+def test_repeat_create_user(client, session, user):
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -27,6 +36,7 @@ def test_repeat_create_user(client, user):
     assert response.status_code == 409, response.text
     data = response.json()
     assert data["detail"] == "user is already exists"
+    assert session.query(OutboxMessage).filter(OutboxMessage.kind == "confirm_email").count() == 1
 
 
 def test_signin_user_not_confirmed(client, user):
@@ -52,6 +62,34 @@ def test_signin_user(client, session, user):
     assert data["token_type"] == "bearer"
 
 
+def test_signin_rehash(client, session, user, monkeypatch):
+    monkeypatch.setattr(pwd_handler, "rounds", 5)
+    monkeypatch.setattr(pwd_handler, "pwd_context", make_context(["bcrypt"], rounds=5))
+    pwd_handler.shutdown()
+    current_user: User = session.query(User).filter(User.email == user.get('username')).first()
+    old_hash = make_context(["bcrypt"], rounds=4).hash(user.get("password"))
+    current_user.password = old_hash
+    session.commit()
+    rehashed = PASSWORD_REHASHED._value.get()
+
+    try:
+        response = client.post(
+            "/api/auth/signin",
+            data=user,
+        )
+    finally:
+        pwd_handler.shutdown()
+
+    assert response.status_code == 200, response.text
+    assert PASSWORD_REHASHED._value.get() == rehashed + 1
+    session.expire_all()
+    current_user: User = session.query(User).filter(User.email == user.get('username')).first()
+    assert current_user.password != old_hash
+    assert current_user.password.startswith("$2b$05$")
+    assert not pwd_handler.pwd_context.needs_update(current_user.password)
+    assert pwd_handler.verify_password(user.get("password"), current_user.password)
+
+
 def test_signin_wrong_password(client, user):
     response = client.post(
         "/api/auth/signin",
@@ -72,16 +110,115 @@ def test_signin_wrong_email(client, user):
     assert data["detail"] == "Invalid email"
 
 
+def test_signin_unknown_email_cached(client, user):
+    with patch("src.routes.auth.UserRepo.get_user_by_email") as get_user:
+        response = client.post(
+            "/api/auth/signin",
+            data={"username": 'email', "password": user.get('password')},
+        )
+
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid email"
+    get_user.assert_not_called()
+
+
+def test_signin_throttled(client, user, cache_server, monkeypatch):
+    monkeypatch.setattr(login_throttle, "account_attempts", 1)
+    data = {"username": user.get('username'), "password": 'password'}
+
+    response = client.post("/api/auth/signin", data=data)
+    assert response.status_code == 401, response.text
+
+    with patch.object(pwd_handler, "verify_and_update_async") as verify:
+        response = client.post("/api/auth/signin", data=user)
+
+    assert response.status_code == 429, response.text
+    assert int(response.headers["Retry-After"]) > 0
+    verify.assert_not_called()
+
+    asyncio.run(login_throttle.succeed(FakeRedis(server=cache_server), user.get('username')))
+
+
 def test_refresh_token(client, session, user):
-    cur_user: User = session.query(User).filter(User.email == user.get('username')).first()
-    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {cur_user.refresh_token}"})
+    tokens = client.post("/api/auth/signin", data=user).json()
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
     
     upd_user: User = session.query(User).filter(User.email == user.get('username')).first()
     assert response.status_code == 200, response.text
     data = response.json()
     assert data["access_token"] is not None
-    assert data["refresh_token"] == upd_user.refresh_token
+    assert data["refresh_token"] != tokens["refresh_token"]
     assert data["token_type"] is not None
+    assert upd_user.refresh_token is None
+
+
+def test_refresh_token_reads_tier(client, session, user, cache_server):
+    tokens = client.post("/api/auth/signin", data=user).json()
+    cur_user: User = session.query(User).filter(User.email == user.get('username')).first()
+    cur_user.tier = "pro"
+    session.commit()
+    asyncio.run(FakeRedis(server=cache_server).delete(user_cache_key(user.get('username'))))
+
+    try:
+        response = client.get("/api/auth/refresh_token",
+                              headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    finally:
+        cur_user.tier = "default"
+        session.commit()
+        asyncio.run(FakeRedis(server=cache_server).delete(user_cache_key(user.get('username'))))
+
+    assert response.status_code == 200, response.text
+    for token in response.json()["access_token"], response.json()["refresh_token"]:
+        payload = asyncio.run(auth_token.get_payload(token))
+        assert payload["tier"] == "pro"
+        assert payload["uid"] == cur_user.id
+
+
+def test_refresh_token_reuse(client, user):
+    tokens = client.post("/api/auth/signin", data=user).json()
+    other_device = client.post("/api/auth/signin", data=user).json()
+    new_tokens = client.get("/api/auth/refresh_token", 
+                            headers={"Authorization": f"Bearer {tokens['refresh_token']}"}).json()
+
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Invalid refresh token"
+
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {new_tokens['refresh_token']}"})
+    assert response.status_code == 401, response.text
+
+    response = client.get("/api/auth/refresh_token", 
+                          headers={"Authorization": f"Bearer {other_device['refresh_token']}"})
+    assert response.status_code == 200, response.text
+
+
+def test_refresh_token_legacy(client, session, user):
+    legacy_token = asyncio.run(auth_token.create_refresh_token({"sub": user.get("username")}))
+    cur_user: User = session.query(User).filter(User.email == user.get('username')).first()
+    cur_user.refresh_token = legacy_token
+    session.commit()
+
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {legacy_token}"})
+
+    assert response.status_code == 200, response.text
+    cur_user: User = session.query(User).filter(User.email == user.get('username')).first()
+    assert cur_user.refresh_token is None
+    response = client.get("/api/auth/refresh_token", 
+                          headers={"Authorization": f"Bearer {response.json()['refresh_token']}"})
+    assert response.status_code == 200, response.text
+
+
+def test_logout(client, user):
+    tokens = client.post("/api/auth/signin", data=user).json()
+    response = client.post("/api/auth/logout", 
+                           json={"refresh_token": tokens["refresh_token"]},
+                           headers={"Authorization": f"Bearer {tokens['access_token']}"})
+    
+    assert response.status_code == 200, response.text
+    payload = asyncio.run(auth_token.get_payload(tokens["access_token"]))
+    assert payload["jti"] in revocation_list.bloom
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {tokens['refresh_token']}"})
+    assert response.status_code == 401, response.text
 
 
 def test_refresh_token_invalid_token(client):
@@ -92,15 +229,15 @@ def test_refresh_token_invalid_token(client):
     assert data["detail"] == "Invalid token"
 
 
-def test_forgot_password(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.password_reset_email", mock_send_email)
+def test_forgot_password(client, session, user):
     response = client.post("/api/auth/forgot_password", json={"email": user.get("username")})
 
     assert response.status_code == 200, response.text
     data = response.json()
     assert data["result"] == True
     assert data["detail"] is not None
+    message = session.query(OutboxMessage).filter(OutboxMessage.kind == "password_reset_email").one()
+    assert message.payload["email"] == user.get("username")
 
 
 def test_reset_password(client, user, monkeypatch, session):
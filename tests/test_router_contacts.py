@@ -0,0 +1,81 @@
+from datetime import date
+
+from src.conf.config import settings
+from src.routes.contacts import CONTACTS_PER_UNIT
+from src.services.metrics import RATE_LIMIT_REJECTED
+
+
+def test_get_contacts_rate_limit(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    times = settings.rate_limit.policies["contacts:list"].times
+    cost = 100 // CONTACTS_PER_UNIT
+    for i in range(times // cost):
+        response = client.get("/api/contacts/", headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.headers["RateLimit-Limit"] == str(times)
+        assert response.headers["RateLimit-Remaining"] == str(times - cost * (i + 1))
+        assert 0 < int(response.headers["RateLimit-Reset"]) <= 60
+
+    rejected_locally = RATE_LIMIT_REJECTED.labels("local")._value.get()
+    response = client.get("/api/contacts/", headers=headers)
+
+    assert response.status_code == 429, response.text
+    assert int(response.headers["Retry-After"]) > 0
+    assert response.headers["RateLimit-Remaining"] == "0"
+    assert RATE_LIMIT_REJECTED.labels("local")._value.get() == rejected_locally + 1
+
+
+def test_rate_limit_per_route(client, token):
+    response = client.get("/api/contacts/birthdays", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200, response.text
+
+
+def test_rate_limit_cost(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    times = settings.rate_limit.policies["contacts:birthdays"].times
+
+    response = client.get("/api/contacts/birthdays", params={"days": 3}, headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert int(response.headers["RateLimit-Remaining"]) == times - 7 - 3
+
+
+def test_rate_limit_small_request_fits(client, token):
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/api/contacts/", params={"limit": 10}, headers=headers)
+
+    assert response.status_code == 429, response.text
+
+    body = {"first_name": "Ann", "last_name": "Lee", "email": "ann@example.com",
+            "phone": "+380501234567", "birth_date": "2000-01-01", "description": None}
+    response = client.post("/api/contacts/", json=body, headers=headers)
+
+    assert response.status_code == 201, response.text
+
+    response = client.get(f"/api/contacts/{response.json()['id']}", headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert response.headers["RateLimit-Remaining"] == str(settings.rate_limit.policies["contacts:read"].times - 1)
+
+
+def test_birthdays_query_budget(client, token, max_queries):
+    headers = {"Authorization": f"Bearer {token}"}
+    birth_date = date.today().replace(year=1992).isoformat()
+    for name in ("Bob", "Eve", "Dan"):
+        body = {"first_name": name, "last_name": "Lee", "email": f"{name.lower()}@example.com",
+                "phone": "+380501234567", "birth_date": birth_date, "description": None}
+        assert client.post("/api/contacts/", json=body, headers=headers).status_code == 201
+
+    with max_queries(2):
+        response = client.get("/api/contacts/birthdays", params={"days": 1}, headers=headers)
+
+    assert response.status_code == 200, response.text
+    assert {contact["first_name"] for contact in response.json()} == {"Bob", "Eve", "Dan"}
+
+
+def test_get_contacts_invalid_token(client):
+    response = client.get("/api/contacts/", headers={"Authorization": "Bearer test"})
+
+    assert response.status_code == 401, response.text
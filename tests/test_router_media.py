@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from src.services.media import LocalMediaStorage
+
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def media(client, tmp_path, monkeypatch):
+    storage = LocalMediaStorage(str(tmp_path), "/media")
+    monkeypatch.setattr("src.routes.media.media_storage", storage)
+
+    return asyncio.run(storage.avatar_upload(DATA))
+
+
+def test_media_file(client, media):
+    response = client.get(media.url)
+
+    assert response.status_code == 200, response.text
+    assert response.content == DATA
+    assert response.headers["ETag"] == f'"{media.public_id}"'
+    assert "immutable" in response.headers["Cache-Control"]
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["Content-Type"] == "image/jpeg"
+
+
+def test_media_file_not_modified(client, media):
+    response = client.get(media.url, headers={"If-None-Match": f'"{media.public_id}"'})
+
+    assert response.status_code == 304, response.text
+    assert response.content == b""
+
+
+def test_media_file_range(client, media):
+    response = client.get(media.url, headers={"Range": "bytes=10-19"})
+
+    assert response.status_code == 206, response.text
+    assert response.content == DATA[10:20]
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(DATA)}"
+
+
+def test_media_file_suffix_range(client, media):
+    response = client.get(media.url, headers={"Range": "bytes=-100"})
+
+    assert response.status_code == 206, response.text
+    assert response.content == DATA[-100:]
+
+
+def test_media_file_if_range_mismatch(client, media):
+    response = client.get(media.url, headers={"Range": "bytes=10-19", "If-Range": '"other"'})
+
+    assert response.status_code == 200, response.text
+    assert response.content == DATA
+
+
+def test_media_file_range_not_satisfiable(client, media):
+    response = client.get(media.url, headers={"Range": f"bytes={len(DATA)}-"})
+
+    assert response.status_code == 416, response.text
+    assert response.headers["Content-Range"] == f"bytes */{len(DATA)}"
+
+
+def test_media_file_head(client, media):
+    response = client.head(media.url)
+
+    assert response.status_code == 200, response.text
+    assert response.headers["Content-Length"] == str(len(DATA))
+    assert response.content == b""
+
+
+def test_media_file_not_found(client, media):
+    assert client.get("/media/" + "0" * 64 + ".jpeg").status_code == 404
+    assert client.get("/media/../etc.jpeg").status_code == 404
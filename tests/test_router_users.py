@@ -1,15 +1,18 @@
+import asyncio
+import io
 import pytest
-from unittest.mock import MagicMock
 
-from cloudinary.uploader import upload_image
+import httpx
+from fakeredis.aioredis import FakeRedis
+from PIL import Image
 
+from main import app
+from src.dependencies.token_user import get_user_by_token
+from src.repository.users_repo import user_cache_key
 from src.models.user import User
-from pathlib import Path
 
 @pytest.fixture
-def cur_user(client, session, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.confirm_email", mock_send_email)
+def cur_user(client, session, user):
     client.post("api/auth/signup", json=user)
     new_user: User = session.query(User).filter(User.email==user.get("username")).first()
     new_user.confirmed = True
@@ -18,9 +21,10 @@ def cur_user(client, session, user, monkeypatch):
     return new_user
 
 
-def test_users_me(client, session, cur_user):
+def test_users_me(client, session, cur_user, max_queries):
     
-    response = client.get("/api/users/me")
+    with max_queries(1):
+        response = client.get("/api/users/me")
 
     assert response.status_code == 200, response.text
     data = response.json()
@@ -32,27 +36,50 @@ def test_users_me(client, session, cur_user):
 
 
 def test_user_avatar(client, session, cur_user, monkeypatch):
-    url = "www.test/1212/reeyey.jpeg"
+    url = "https://res.test/1212/reeyey.jpeg"
     public_id = "1212/reeyey"
-    mock_upload = MagicMock()
-    mock_upload.return_value = MagicMock(url=url, public_id=public_id)
-    monkeypatch.setattr("src.services.media.upload_image", mock_upload)
+    uploads = []
 
-    file_name = "test.jpeg"
-    path = Path(file_name)
-    if not path.exists():
-        path.touch()
+    def handler(request: httpx.Request):
+        uploads.append(request)
+        return httpx.Response(200, json={"secure_url": url, "public_id": public_id})
 
-    response = client.patch("/api/users/avatar" ,files={"file": open(file_name, 'rb')})
+    monkeypatch.setattr("src.services.media.http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    image = io.BytesIO()
+    Image.new("RGB", (1200, 800), "red").save(image, format="PNG")
 
-    if path.exists():
-        path.unlink()
+    response = client.patch("/api/users/avatar", files={"file": ("test.png", image.getvalue(), "image/png")})
 
-    assert response.status_code == 200, response.text
+    assert response.status_code == 202, response.text
+    assert response.json()["status"] == "pending"
+    assert len(uploads) == 1
+    assert b"image/jpeg" in uploads[0].content
+    session.expire_all()
     upd_user = session.query(User).filter(User.email==cur_user.email).first()
     assert upd_user.avatar == url
     assert upd_user.avatar_cld == public_id
     assert upd_user.id == cur_user.id
 
-    
-    
\ No newline at end of file
+
+def test_user_avatar_invalid_image(client, cur_user):
+    response = client.patch("/api/users/avatar", files={"file": ("test.jpeg", b"not an image", "image/jpeg")})
+
+    assert response.status_code == 400, response.text
+
+
+def test_users_me_from_snapshot(client, cur_user, user, cache_server, max_queries):
+    token = client.post("/api/auth/signin", data=user).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    asyncio.run(FakeRedis(server=cache_server).delete(user_cache_key(user.get("username"))))
+    override = app.dependency_overrides.pop(get_user_by_token)
+    try:
+        with max_queries(1) as statements:
+            client.get("/api/users/me", headers=headers)
+        assert len(statements) > 0
+        with max_queries(0):
+            response = client.get("/api/users/me", headers=headers)
+    finally:
+        app.dependency_overrides[get_user_by_token] = override
+
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == user.get("username")
@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from jose import jwt
+
+from src.conf.config import settings
+from src.services import keys
+from src.services.auth import auth_token
+from src.services.keys import KeyRing
+
+
+@pytest.fixture
+def keyring(tmp_path, monkeypatch):
+    keys.write_key(tmp_path, "20240101000000-00000000", keys.generate_private_pem("ES256"))
+    keyring = KeyRing("ES256", keys_dir=str(tmp_path))
+    monkeypatch.setattr(auth_token, "keyring", keyring)
+
+    return keyring
+
+
+def test_jwks_symmetric(client, monkeypatch):
+    monkeypatch.setattr(auth_token, "keyring", None)
+    response = client.get("/.well-known/jwks.json")
+
+    assert response.status_code == 200, response.text
+    assert response.json() == {"keys": []}
+
+
+def test_jwks(client, keyring):
+    response = client.get("/.well-known/jwks.json")
+
+    assert response.status_code == 200, response.text
+    assert "max-age" in response.headers["cache-control"]
+    keys = response.json()["keys"]
+    assert len(keys) == 1
+    assert keys[0]["kid"] == keyring.active.kid
+    assert "d" not in keys[0]
+
+
+def test_jwks_not_modified(client, keyring):
+    response = client.get("/.well-known/jwks.json", headers={"If-None-Match": keyring.jwks_etag})
+
+    assert response.status_code == 304, response.text
+
+
+def test_token_verified_by_jwks(client, keyring):
+    token = asyncio.run(auth_token.create_access_token({"sub": "user@example.com"}))
+    keyring.rotate()
+    new_token = asyncio.run(auth_token.create_access_token({"sub": "user@example.com"}))
+
+    jwks = client.get("/.well-known/jwks.json").json()
+
+    assert jwt.get_unverified_header(token)["kid"] != jwt.get_unverified_header(new_token)["kid"]
+    for item in (token, new_token):
+        payload = jwt.decode(item, jwks, algorithms=["ES256"])
+        assert payload["sub"] == "user@example.com"
+        assert asyncio.run(auth_token.get_payload(item)) == payload
+
+
+def test_key_rotated_on_disk(keyring, tmp_path, monkeypatch):
+    monkeypatch.setattr(keys, "FORCED_CHECK_INTERVAL", 0)
+    other_worker = KeyRing("ES256", keys_dir=str(tmp_path))
+    other_worker.rotate()
+    monkeypatch.setattr(auth_token, "keyring", other_worker)
+    token = asyncio.run(auth_token.create_access_token({"sub": "user@example.com"}))
+    monkeypatch.setattr(auth_token, "keyring", keyring)
+
+    assert asyncio.run(auth_token.get_payload(token))["sub"] == "user@example.com"
+    assert keyring.active.kid == other_worker.active.kid
+
+
+def test_no_keys(tmp_path, caplog):
+    with pytest.raises(ValueError):
+        KeyRing("ES256", keys_dir=str(tmp_path))
+
+    keyring = KeyRing("ES256", keys_dir=str(tmp_path), ephemeral=True)
+
+    assert keyring.active.kid in keyring.jwks_body.decode()
+    assert list(tmp_path.iterdir()) == []
+    assert "ephemeral" in caplog.text
+
+
+def test_token_without_kid(keyring, monkeypatch):
+    token = jwt.encode({"sub": "user@example.com", "scope": "access_token"}, settings.secret_key, algorithm="HS256")
+
+    assert asyncio.run(auth_token.get_payload(token)) is None
+
+    monkeypatch.setattr(settings.jwt, "legacy_hs256_until", datetime.now() + timedelta(days=1))
+    assert asyncio.run(auth_token.get_payload(token))["sub"] == "user@example.com"
+
+    monkeypatch.setattr(settings.jwt, "legacy_hs256_until", datetime.now() - timedelta(days=1))
+    assert asyncio.run(auth_token.get_payload(token)) is None
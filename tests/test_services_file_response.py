@@ -0,0 +1,50 @@
+import tempfile
+import unittest
+
+from src.services.file_response import RangedFileResponse, RangeNotSatisfiable, parse_range
+
+
+class TestParseRange(unittest.TestCase):
+
+    def test_ranges(self):
+        self.assertEqual(parse_range("bytes=0-9", 100), (0, 10))
+        self.assertEqual(parse_range("bytes=90-", 100), (90, 10))
+        self.assertEqual(parse_range("bytes=90-200", 100), (90, 10))
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 10))
+
+
+    def test_ignored(self):
+        self.assertIsNone(parse_range(None, 100))
+        self.assertIsNone(parse_range("bytes=0-1,5-6", 100))
+        self.assertIsNone(parse_range("items=0-1", 100))
+        self.assertIsNone(parse_range("bytes=9-1", 100))
+
+
+    def test_not_satisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range("bytes=100-", 100)
+
+
+class TestZeroCopy(unittest.IsolatedAsyncioTestCase):
+
+    async def test_zerocopysend(self):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(b"0123456789")
+            file.flush()
+            response = RangedFileResponse(file.name, range_header="bytes=2-5")
+            scope = {"type": "http", "method": "GET", "extensions": {"http.response.zerocopysend": {}}}
+
+            await response(scope, None, send)
+
+        self.assertEqual(messages[0]["status"], 206)
+        self.assertEqual(messages[1]["type"], "http.response.zerocopysend")
+        self.assertEqual((messages[1]["offset"], messages[1]["count"]), (2, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
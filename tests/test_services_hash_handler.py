@@ -0,0 +1,66 @@
+import asyncio
+import time
+import unittest
+
+from src.services.hash_handler import PasswordHandler, HashPoolSaturated, make_context, recommend
+
+
+class TestPasswordHandler(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.handler = PasswordHandler(pool_size=1, queue_size=1)
+
+
+    def tearDown(self):
+        self.handler.shutdown()
+
+
+    async def test_hash_and_verify(self):
+        hashed = await self.handler.get_password_hash_async("secret")
+
+        self.assertTrue(await self.handler.verify_password_async("secret", hashed))
+        self.assertFalse(await self.handler.verify_password_async("wrong", hashed))
+        self.assertTrue(self.handler.verify_password("secret", hashed))
+
+
+    async def test_saturated(self):
+        jobs = [self.handler.get_password_hash_async("secret") for _ in range(3)]
+
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+
+        self.assertIsInstance(results[2], HashPoolSaturated)
+        self.assertTrue(all(isinstance(result, str) for result in results[:2]))
+        self.assertEqual(self.handler._pending, 0)
+
+
+    async def test_shutdown_does_not_wait_for_running_jobs(self):
+        await self.handler.get_password_hash_async("secret")
+        job = asyncio.create_task(self.handler._submit("hash", time.sleep, 1))
+        await asyncio.sleep(0.1)
+
+        start = time.perf_counter()
+        self.handler.shutdown()
+
+        self.assertLess(time.perf_counter() - start, 0.5)
+        job.cancel()
+
+
+class TestCalibration(unittest.TestCase):
+
+    def test_recommend(self):
+        results = [(10, 60.0), (11, 120.0), (12, 240.0), (13, 480.0)]
+
+        self.assertEqual(recommend(results, 250), 12)
+        self.assertEqual(recommend(results, 10), 10)
+
+
+    def test_needs_update(self):
+        old_hash = make_context(["bcrypt"], rounds=4).hash("secret")
+        context = make_context(["bcrypt"], rounds=5)
+
+        self.assertTrue(context.needs_update(old_hash))
+        self.assertFalse(context.needs_update(context.hash("secret")))
+
+
+if __name__ == '__main__':
+    unittest.main()
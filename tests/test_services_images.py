@@ -0,0 +1,37 @@
+import io
+import unittest
+
+from PIL import Image
+
+from src.services.images import prepare_avatar, InvalidImage, AVATAR_SIZE
+
+
+def encode(image: Image.Image, format: str) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format=format)
+    return output.getvalue()
+
+
+class TestPrepareAvatar(unittest.TestCase):
+
+    def test_square_jpeg(self):
+        data = prepare_avatar(encode(Image.new("RGB", (1600, 900), "blue"), "JPEG"))
+
+        avatar = Image.open(io.BytesIO(data))
+        self.assertEqual(avatar.format, "JPEG")
+        self.assertEqual(avatar.size, (AVATAR_SIZE, AVATAR_SIZE))
+
+
+    def test_transparent_png(self):
+        data = prepare_avatar(encode(Image.new("RGBA", (200, 400), (0, 0, 0, 0)), "PNG"), size=100)
+
+        self.assertEqual(Image.open(io.BytesIO(data)).size, (100, 100))
+
+
+    def test_invalid_image(self):
+        with self.assertRaises(InvalidImage):
+            prepare_avatar(b"not an image")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from fakeredis.aioredis import FakeRedis
+
+from src.services.login_throttle import LoginThrottle, lock_key
+
+
+class TestLoginThrottle(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.cache = FakeRedis()
+        self.throttle = LoginThrottle(account_attempts=2, ip_attempts=3, base_delay=1.0, max_delay=5.0)
+
+
+    async def asyncTearDown(self):
+        await self.cache.aclose()
+
+
+    async def test_free_attempts(self):
+        self.assertEqual(await self.throttle.fail(self.cache, "a@example.com", "1.1.1.1", "password"), 0)
+        self.assertEqual(await self.throttle.fail(self.cache, "a@example.com", "1.1.1.1", "password"), 0)
+
+        self.assertEqual(await self.throttle.check(self.cache, "a@example.com", "1.1.1.1"), (0.0, False))
+
+
+    async def test_exponential_backoff(self):
+        delays = [await self.throttle.fail(self.cache, "a@example.com", f"1.1.1.{i}", "password") for i in range(6)]
+
+        self.assertEqual(delays, [0, 0, 1.0, 2.0, 4.0, 5.0])
+        retry_after, _ = await self.throttle.check(self.cache, "a@example.com", "2.2.2.2")
+        self.assertGreater(retry_after, 4.0)
+
+
+    async def test_ip_lock(self):
+        for i in range(4):
+            await self.throttle.fail(self.cache, f"user{i}@example.com", "1.1.1.1", "password")
+
+        retry_after, _ = await self.throttle.check(self.cache, "other@example.com", "1.1.1.1")
+        self.assertGreater(retry_after, 0)
+        self.assertEqual(await self.throttle.check(self.cache, "other@example.com", "2.2.2.2"), (0.0, False))
+
+
+    async def test_succeed_resets_account(self):
+        for _ in range(3):
+            await self.throttle.fail(self.cache, "a@example.com", "1.1.1.1", "password")
+
+        await self.throttle.succeed(self.cache, "a@example.com")
+
+        self.assertFalse(await self.cache.exists(lock_key("account", "a@example.com")))
+        self.assertEqual(await self.throttle.fail(self.cache, "a@example.com", "2.2.2.2", "password"), 0)
+
+
+    async def test_unknown_email(self):
+        await self.throttle.remember_unknown(self.cache, "a@example.com")
+
+        self.assertEqual(await self.throttle.check(self.cache, "a@example.com", "1.1.1.1"), (0.0, True))
+
+        await self.throttle.forget_unknown(self.cache, "a@example.com")
+
+        self.assertEqual(await self.throttle.check(self.cache, "a@example.com", "1.1.1.1"), (0.0, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
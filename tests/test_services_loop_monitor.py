@@ -0,0 +1,72 @@
+import asyncio
+import time
+import unittest
+
+from src.services.loop_monitor import LoopMonitor, task_scopes
+from src.services.metrics import EVENT_LOOP_LAG, EVENT_LOOP_BLOCKED
+from src.services.telemetry import UNMATCHED
+
+
+class Route:
+    path = "/api/contacts/{contact_id}"
+
+
+def blocking_handler():
+    time.sleep(0.3)
+
+
+class TestLoopMonitor(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.monitor = LoopMonitor(interval=0.02, threshold=0.05)
+        self.monitor.start()
+
+
+    async def asyncTearDown(self):
+        await self.monitor.stop()
+
+
+    def blocked_count(self, route=Route.path):
+        return EVENT_LOOP_BLOCKED.labels(route)._value.get()
+
+
+    def lag_count(self):
+        return next(sample.value for sample in EVENT_LOOP_LAG.collect()[0].samples
+                    if sample.name == "event_loop_lag_seconds_count")
+
+
+    async def test_blocking_call_is_reported_with_route(self):
+        async def handler():
+            task_scopes[asyncio.current_task()] = {"type": "http", "path": "/api/contacts/1", "route": Route()}
+            blocking_handler()
+
+        blocked, lags = self.blocked_count(), self.lag_count()
+        with self.assertLogs("src.services.loop_monitor", "WARNING") as logs:
+            await asyncio.create_task(handler())
+            await asyncio.sleep(0.05)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(Route.path, logs.output[0])
+        self.assertIn("blocking_handler", logs.output[0])
+        self.assertEqual(self.blocked_count(), blocked + 1)
+        self.assertGreater(self.lag_count(), lags)
+
+
+    async def test_unrouted_request_is_reported_as_unmatched(self):
+        async def handler():
+            task_scopes[asyncio.current_task()] = {"type": "http", "path": "/scanner/probe/1"}
+            blocking_handler()
+
+        blocked = self.blocked_count(UNMATCHED)
+        with self.assertLogs("src.services.loop_monitor", "WARNING") as logs:
+            await asyncio.create_task(handler())
+            await asyncio.sleep(0.05)
+
+        self.assertNotIn("/scanner/probe/1", logs.output[0])
+        self.assertEqual(self.blocked_count(UNMATCHED), blocked + 1)
+        self.assertNotIn("/scanner/probe/1", [sample.labels["route"] for sample in EVENT_LOOP_BLOCKED.collect()[0].samples])
+
+
+    async def test_idle_loop_is_not_reported(self):
+        with self.assertNoLogs("src.services.loop_monitor", "WARNING"):
+            await asyncio.sleep(0.2)
@@ -0,0 +1,133 @@
+import asyncio
+import socket
+import unittest
+from email.message import EmailMessage
+from unittest.mock import patch
+
+from aiosmtpd.controller import Controller
+
+from src.services.mailer import MailSender, MailSenderClosed, templates
+from src.services import mail
+
+
+class Collector:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def message(number: int) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = f"Message {number}"
+    msg["From"] = "sender@example.com"
+    msg["To"] = f"user{number}@example.com"
+    msg.set_content("Hello")
+    return msg
+
+
+class TestMailSender(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.collector = Collector()
+        self.controller = Controller(self.collector, hostname="127.0.0.1", port=free_port())
+        self.controller.start()
+        self.sender = MailSender(hostname="127.0.0.1", port=self.controller.port, use_tls=False,
+                                 pool_size=2, batch_size=5)
+
+
+    async def asyncTearDown(self):
+        await self.sender.close()
+
+
+    def tearDown(self):
+        self.controller.stop()
+
+
+    async def test_pooled_connections(self):
+        await asyncio.gather(*(self.sender.send(message(i)) for i in range(12)))
+        await self.sender.send(message(12))
+
+        self.assertEqual(len(self.collector.messages), 13)
+        self.assertEqual(self.sender.connections_opened, 2)
+
+
+    async def test_slow_connection_does_not_block_others(self):
+        sent = asyncio.Event()
+        original = self.sender._send_chunk
+
+        async def send_chunk(client, chunk):
+            if chunk[0][0]["Subject"] == "Message 0":
+                await sent.wait()
+            await original(client, chunk)
+
+        self.sender.chunk_size = 1
+        with patch.object(self.sender, "_send_chunk", send_chunk):
+            slow = asyncio.ensure_future(self.sender.send(message(0)))
+            await asyncio.sleep(0)
+            await asyncio.wait_for(asyncio.gather(*(self.sender.send(message(i)) for i in range(1, 4))), 5)
+            self.assertFalse(slow.done())
+            sent.set()
+            await slow
+
+        self.assertEqual(len(self.collector.messages), 4)
+
+
+    async def test_close_fails_queued_messages(self):
+        self.sender._start()
+        self.sender._worker.cancel()
+        future = asyncio.ensure_future(self.sender.send(message(0)))
+        await asyncio.sleep(0)
+
+        await self.sender.close()
+
+        with self.assertRaises(MailSenderClosed):
+            await asyncio.wait_for(future, 1)
+
+
+    async def test_reconnect(self):
+        await self.sender.send(message(0))
+        for client in self.sender._pool._queue:
+            if client is not None:
+                client.close()
+
+        await self.sender.send(message(1))
+
+        self.assertEqual(len(self.collector.messages), 2)
+
+
+    async def test_confirm_email(self):
+        with patch.object(mail, "mail_sender", self.sender):
+            await mail.confirm_email("user@example.com", "http://testserver/")
+
+        envelope = self.collector.messages[0]
+        self.assertEqual(envelope.rcpt_tos, ["user@example.com"])
+        self.assertIn(b"http://testserver/api/auth/confirmed_email/", envelope.content)
+
+
+    async def test_connection_error(self):
+        sender = MailSender(hostname="127.0.0.1", port=free_port(), use_tls=False, timeout=1)
+
+        with self.assertRaises(OSError):
+            await sender.send(message(0))
+
+        await sender.close()
+
+
+class TestTemplates(unittest.TestCase):
+
+    def test_compiled_once(self):
+        self.assertIs(templates.get_template("password_reset_email.html"),
+                      templates.get_template("password_reset_email.html"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from src.services.media import LocalMediaStorage, MediaCloud, make_storage
+
+
+class TestLocalMediaStorage(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LocalMediaStorage(self.tmp.name, "/media/")
+
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+
+    async def test_content_addressed(self):
+        data = b"avatar"
+        digest = hashlib.sha256(data).hexdigest()
+
+        media = await self.storage.avatar_upload(data)
+
+        self.assertEqual(media.public_id, digest)
+        self.assertEqual(media.url, f"/media/{digest}.jpeg")
+        self.assertEqual(self.storage.path(digest).read_bytes(), data)
+
+
+    async def test_dedup(self):
+        first = await self.storage.avatar_upload(b"avatar", public_id="old")
+        second = await self.storage.avatar_upload(b"avatar")
+
+        self.assertEqual(first, second)
+        files = [path for path in Path(self.tmp.name).rglob("*") if path.is_file()]
+        self.assertEqual(len(files), 1)
+
+
+    async def test_remove_keeps_shared_file(self):
+        media = await self.storage.avatar_upload(b"avatar")
+
+        self.assertFalse(await self.storage.remove_media(media.public_id))
+        self.assertTrue(self.storage.path(media.public_id).exists())
+
+
+    async def test_collect_garbage(self):
+        used = await self.storage.avatar_upload(b"used")
+        unused = await self.storage.avatar_upload(b"unused")
+        fresh = await self.storage.avatar_upload(b"fresh")
+        old = time.time() - 7200
+        for media in (used, unused):
+            os.utime(self.storage.path(media.public_id), (old, old))
+
+        removed = self.storage.collect_garbage({used.public_id}, min_age=3600)
+
+        self.assertEqual(removed, 1)
+        self.assertTrue(self.storage.path(used.public_id).exists())
+        self.assertFalse(self.storage.path(unused.public_id).exists())
+        self.assertTrue(self.storage.path(fresh.public_id).exists())
+
+
+    async def test_collect_garbage_keeps_reuploaded_file(self):
+        media = await self.storage.avatar_upload(b"old")
+        old = time.time() - 7200
+        os.utime(self.storage.path(media.public_id), (old, old))
+
+        referenced = set()
+        again = await self.storage.avatar_upload(b"old")
+        removed = self.storage.collect_garbage(referenced, min_age=3600)
+
+        self.assertEqual(again.public_id, media.public_id)
+        self.assertEqual(removed, 0)
+        self.assertTrue(self.storage.path(media.public_id).exists())
+
+
+class TestMakeStorage(unittest.TestCase):
+
+    def test_backends(self):
+        self.assertIsInstance(make_storage("cloudinary"), MediaCloud)
+        self.assertIsInstance(make_storage("local"), LocalMediaStorage)
+        with self.assertRaises(ValueError):
+            make_storage("s3")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import logging
+
+import pytest
+from sqlalchemy import text
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.services.metrics import DB_REPEATED_STATEMENTS, DB_SLOW_QUERIES
+from src.services.query_log import query_log, statement_shape
+from src.services.telemetry import PrometheusMiddleware
+from tests.conftest import engine
+
+
+def test_statement_shape():
+    first = statement_shape("SELECT * FROM contacts WHERE contacts.id IN (%(id_1_1)s, %(id_1_2)s)")
+    second = statement_shape("SELECT * FROM contacts WHERE contacts.id IN (%(id_1_1)s)")
+
+    assert first == second == "SELECT * FROM contacts WHERE contacts.id IN (...)"
+    assert statement_shape("SELECT 1") == "SELECT 1"
+
+
+def test_slow_query_with_plan(monkeypatch, caplog):
+    monkeypatch.setattr(query_log, "slow_threshold", 0.0)
+    slow = DB_SLOW_QUERIES.labels("background")._value.get()
+
+    with caplog.at_level(logging.WARNING, logger="src.services.query_log"):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT generate_series(1, :count)"), {"count": 3})
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+
+    assert DB_SLOW_QUERIES.labels("background")._value.get() >= slow + 2
+    assert "SELECT generate_series(1, %(count)s)" in caplog.text
+    assert "ProjectSet" in caplog.text
+
+
+def test_failed_explain_keeps_transaction(monkeypatch):
+    monkeypatch.setattr(query_log, "slow_threshold", 0.0)
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert query_log.explain_plan(conn.connection.cursor(), "SELECT * FROM missing_table", {}) is None
+        assert conn.execute(text("SELECT 2")).scalar() == 2
+
+
+@pytest.fixture
+def repeating_client():
+    app = FastAPI()
+    app.add_middleware(PrometheusMiddleware)
+
+    @app.get("/loop")
+    async def loop():
+        with engine.connect() as conn:
+            for contact_id in range(4):
+                conn.execute(text("SELECT :id"), {"id": contact_id})
+        return "ok"
+
+    return TestClient(app)
+
+
+def test_repeated_statement(repeating_client, monkeypatch, caplog):
+    monkeypatch.setattr(query_log, "repeat_threshold", 3)
+    repeated = DB_REPEATED_STATEMENTS.labels("/loop")._value.get()
+
+    with caplog.at_level(logging.WARNING, logger="src.services.query_log"):
+        assert repeating_client.get("/loop").status_code == 200
+
+    assert DB_REPEATED_STATEMENTS.labels("/loop")._value.get() == repeated + 1
+    assert "Possible N+1 in /loop: statement ran 4 times" in caplog.text
+
+
+def test_below_repeat_threshold(repeating_client, monkeypatch):
+    monkeypatch.setattr(query_log, "repeat_threshold", 4)
+    repeated = DB_REPEATED_STATEMENTS.labels("/loop")._value.get()
+
+    repeating_client.get("/loop")
+
+    assert DB_REPEATED_STATEMENTS.labels("/loop")._value.get() == repeated
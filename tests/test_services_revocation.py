@@ -0,0 +1,125 @@
+import secrets
+import time
+import unittest
+from unittest import mock
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+
+from src.services.revocation import BloomFilter, RevocationList, LOG_KEY
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        items = [secrets.token_urlsafe(16) for _ in range(1000)]
+        for item in items:
+            bloom.add(item)
+
+        self.assertTrue(all(item in bloom for item in items))
+
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        for _ in range(1000):
+            bloom.add(secrets.token_urlsafe(16))
+
+        probes = 20000
+        false_positives = sum(secrets.token_urlsafe(16) in bloom for _ in range(probes))
+
+        self.assertLess(false_positives / probes, 0.02)
+        self.assertAlmostEqual(bloom.expected_error_rate(), 0.01, delta=0.002)
+
+
+class TestRevocationList(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        server = FakeServer()
+        self.cache = FakeRedis(server=server)
+        self.other_cache = FakeRedis(server=server)
+
+
+    async def test_revoke(self):
+        revocations = RevocationList(capacity=100, error_rate=0.01)
+        jti = secrets.token_urlsafe(16)
+
+        await revocations.revoke(self.cache, jti, int(time.time()) + 60)
+
+        self.assertTrue(await revocations.is_revoked(self.cache, jti))
+        self.assertFalse(await revocations.is_revoked(self.cache, secrets.token_urlsafe(16)))
+
+
+    async def test_revoke_expired(self):
+        revocations = RevocationList(capacity=100, error_rate=0.01)
+        jti = secrets.token_urlsafe(16)
+
+        await revocations.revoke(self.cache, jti, int(time.time()) - 1)
+
+        self.assertFalse(await revocations.is_revoked(self.cache, jti))
+
+
+    async def test_sync_other_worker(self):
+        worker1 = RevocationList(capacity=100, error_rate=0.01)
+        worker2 = RevocationList(capacity=100, error_rate=0.01)
+        jti = secrets.token_urlsafe(16)
+
+        await worker1.revoke(self.cache, jti, int(time.time()) + 60)
+        self.assertFalse(await worker2.is_revoked(self.other_cache, jti))
+
+        await worker2.sync(self.other_cache)
+        self.assertTrue(await worker2.is_revoked(self.other_cache, jti))
+
+
+    async def test_sync_incremental(self):
+        worker1 = RevocationList(capacity=100, error_rate=0.01)
+        worker2 = RevocationList(capacity=100, error_rate=0.01)
+        await worker1.revoke(self.cache, secrets.token_urlsafe(16), int(time.time()) + 60)
+        await worker2.sync(self.other_cache)
+
+        jtis = [secrets.token_urlsafe(16) for _ in range(3)]
+        for jti in jtis:
+            await worker1.revoke(self.cache, jti, int(time.time()) + 60)
+
+        with mock.patch.object(worker2, "rebuild", side_effect=AssertionError("rebuilt")):
+            await worker2.sync(self.other_cache)
+
+        self.assertEqual(worker2.version, 4)
+        for jti in jtis:
+            self.assertTrue(await worker2.is_revoked(self.other_cache, jti))
+
+
+    async def test_sync_trimmed_log_rebuilds(self):
+        worker1 = RevocationList(capacity=100, error_rate=0.01)
+        worker2 = RevocationList(capacity=100, error_rate=0.01)
+        await worker2.sync(self.other_cache)
+        jtis = [secrets.token_urlsafe(16) for _ in range(3)]
+        for jti in jtis:
+            await worker1.revoke(self.cache, jti, int(time.time()) + 60)
+        await self.cache.zremrangebyrank(LOG_KEY, 0, 0)
+
+        await worker2.sync(self.other_cache)
+
+        self.assertEqual(worker2.version, 3)
+        for jti in jtis:
+            self.assertTrue(await worker2.is_revoked(self.other_cache, jti))
+
+
+    async def test_report(self):
+        revocations = RevocationList(capacity=100, error_rate=0.01)
+        jti = secrets.token_urlsafe(16)
+        await revocations.revoke(self.cache, jti, int(time.time()) + 60)
+
+        await revocations.is_revoked(self.cache, jti)
+        for _ in range(100):
+            await revocations.is_revoked(self.cache, secrets.token_urlsafe(16))
+
+        report = revocations.report()
+        self.assertEqual(report["lookups"], 101)
+        self.assertEqual(report["revoked"], 1)
+        self.assertEqual(report["false_positives"], report["redis_lookups"] - 1)
+        self.assertLessEqual(report["observed_false_positive_rate"], 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
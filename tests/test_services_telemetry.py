@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+
+from src.services.metrics import HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT, DB_REQUEST_QUERIES
+from src.services.telemetry import collect_metrics
+
+
+def sample(metric, suffix: str, **labels) -> float:
+    for family in metric.collect():
+        for item in family.samples:
+            if item.name.endswith(suffix) and all(item.labels.get(k) == v for k, v in labels.items()):
+                return item.value
+
+    return 0
+
+
+def test_route_template_labels(client, session):
+    route = "/api/contacts/{contact_id}"
+    requests = sample(HTTP_REQUESTS, "_total", method="GET", route=route, status="401")
+    latency = sample(HTTP_LATENCY, "_count", method="GET", route=route)
+
+    client.get("/api/contacts/1", headers={"Authorization": "Bearer test"})
+    client.get("/api/contacts/2", headers={"Authorization": "Bearer test"})
+
+    assert sample(HTTP_REQUESTS, "_total", method="GET", route=route, status="401") == requests + 2
+    assert sample(HTTP_LATENCY, "_count", method="GET", route=route) == latency + 2
+    assert sample(HTTP_REQUESTS, "_total", method="GET", route="/api/contacts/1") == 0
+    assert HTTP_IN_FLIGHT._value.get() == 0
+
+
+def test_unmatched_path(client):
+    requests = sample(HTTP_REQUESTS, "_total", method="GET", route="unmatched", status="404")
+
+    response = client.get("/no/such/path")
+
+    assert response.status_code == 404
+    assert sample(HTTP_REQUESTS, "_total", method="GET", route="unmatched", status="404") == requests + 1
+
+
+def test_queries_per_request(client, session):
+    route = "/halthchecker"
+    count = sample(DB_REQUEST_QUERIES, "_count", route=route)
+    total = sample(DB_REQUEST_QUERIES, "_sum", route=route)
+
+    response = client.post(route)
+
+    assert response.status_code == 200, response.text
+    assert sample(DB_REQUEST_QUERIES, "_count", route=route) == count + 1
+    assert sample(DB_REQUEST_QUERIES, "_sum", route=route) >= total + 1
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "http_request_duration_seconds_bucket" in response.text
+    assert b"http_requests_in_flight" in collect_metrics()
+
+
+def test_multiprocess_mode(tmp_path):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    worker = ("from src.services.metrics import HTTP_REQUESTS; "
+              "HTTP_REQUESTS.labels('GET', '/api/users/me', '200').inc(3)")
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], env=env, check=True)
+
+    scrape = ("from src.services.telemetry import collect_metrics; "
+              "print(collect_metrics().decode())")
+    output = subprocess.run([sys.executable, "-c", scrape], env=env, check=True,
+                            capture_output=True, text=True).stdout
+
+    assert 'http_requests_total{method="GET",route="/api/users/me",status="200"} 6.0' in output
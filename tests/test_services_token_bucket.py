@@ -0,0 +1,62 @@
+import unittest
+
+from src.services.token_bucket import LocalRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLocalRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = LocalRateLimiter(slack=0.5, max_keys=2, clock=self.clock)
+
+
+    def test_burst_with_slack(self):
+        results = [self.limiter.acquire("key", times=10, seconds=60) for _ in range(16)]
+
+        self.assertEqual(results[:15], [0.0] * 15)
+        self.assertGreater(results[15], 0)
+
+
+    def test_burst_smaller_than_budget(self):
+        results = [self.limiter.acquire("key", times=10, seconds=60, cost=2, burst=4) for _ in range(4)]
+
+        self.assertEqual(results[:3], [0.0] * 3)
+        self.assertAlmostEqual(results[3], 2 / (15 / 60))
+
+
+    def test_refill(self):
+        for _ in range(15):
+            self.limiter.acquire("key", times=10, seconds=60)
+
+        self.clock.now += 4
+
+        self.assertEqual(self.limiter.acquire("key", times=10, seconds=60), 0.0)
+        self.assertGreater(self.limiter.acquire("key", times=10, seconds=60), 0)
+
+
+    def test_block_lease(self):
+        self.limiter.acquire("key", times=10, seconds=60)
+        self.limiter.block("key", 30)
+
+        self.assertAlmostEqual(self.limiter.acquire("key", times=10, seconds=60), 30)
+        self.clock.now += 30
+        self.assertEqual(self.limiter.acquire("key", times=10, seconds=60), 0.0)
+
+
+    def test_max_keys(self):
+        for key in ("key1", "key2", "key3"):
+            self.limiter.acquire(key, times=1, seconds=60)
+
+        self.assertEqual(list(self.limiter._buckets), ["key2", "key3"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from src.services.tracing import (JsonLinesExporter, Tracer, tracer, current_span, parse_traceparent,
+                                  read_traces, format_trace, STATUS_ERROR)
+
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class MemoryExporter(JsonLinesExporter):
+    def __init__(self) -> None:
+        super().__init__("test", lambda: None)
+        self.lines = []
+
+
+    def export(self, trace) -> None:
+        self.lines.append(self.encode(trace))
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = MemoryExporter()
+    monkeypatch.setattr(tracer, "exporter", exporter)
+    monkeypatch.setattr(tracer, "sample_rate", 1.0)
+
+    return exporter
+
+
+def test_parse_traceparent():
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-00") == (TRACE_ID, PARENT_ID, False)
+    assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
+
+
+def test_sampling():
+    exporter = MemoryExporter()
+
+    assert Tracer(exporter, sample_rate=0.0).start_trace("GET") is None
+    assert Tracer(exporter, sample_rate=1.0).start_trace("GET", f"00-{TRACE_ID}-{PARENT_ID}-00") is None
+    assert Tracer(None, sample_rate=1.0).start_trace("GET") is None
+
+    span = Tracer(exporter, sample_rate=0.0).start_trace("GET", f"00-{TRACE_ID}-{PARENT_ID}-01")
+    assert span.trace.trace_id == TRACE_ID
+    assert span.parent_id == PARENT_ID
+
+
+def test_untraced_span_is_noop():
+    with tracer.span("nothing") as span:
+        assert span is None
+
+
+def test_request_spans(client, token, exporter):
+    response = client.get("/api/contacts/birthdays", params={"days": 1},
+                          headers={"Authorization": f"Bearer {token}", "traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+
+    assert response.status_code == 200, response.text
+    assert response.headers["traceresponse"].startswith(f"00-{TRACE_ID}-")
+    spans = read_traces(exporter.lines)[TRACE_ID]
+    names = {span["name"] for span in spans}
+    assert {"GET /api/contacts/birthdays", "jwt.decode", "rate_limit", "user.lookup",
+            "db.query", "serialize_response"} <= names
+    root = next(span for span in spans if span["name"] == "GET /api/contacts/birthdays")
+    assert root["parentSpanId"] == PARENT_ID
+    assert all(span["parentSpanId"] in {s["spanId"] for s in spans} for span in spans if span is not root)
+
+
+def test_password_span(client, user, token, exporter):
+    response = client.post("/api/auth/signin", data=user)
+
+    assert response.status_code == 200, response.text
+    [spans] = read_traces(exporter.lines).values()
+    assert "password.verify" in {span["name"] for span in spans}
+
+
+def test_error_status(exporter):
+    root = tracer.start_trace("GET")
+    token = current_span.set(root)
+    try:
+        with pytest.raises(ValueError):
+            with tracer.span("failing"):
+                raise ValueError("boom")
+    finally:
+        current_span.reset(token)
+    tracer.finish_trace(root)
+
+    [spans] = read_traces(exporter.lines).values()
+    failing = next(span for span in spans if span["name"] == "failing")
+    assert failing["status"]["code"] == STATUS_ERROR
+    assert "boom" in failing["status"]["message"]
+
+
+def test_file_export_and_collector(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    file_tracer = Tracer(JsonLinesExporter("test", lambda: open(path, "a", encoding="utf-8")), sample_rate=1.0)
+    root = file_tracer.start_trace("GET /api/users/me")
+    token = current_span.set(root)
+    file_tracer.record("db.query", root.start_ns + 1_000_000, root.start_ns + 3_000_000)
+    current_span.reset(token)
+    file_tracer.finish_trace(root)
+    file_tracer.shutdown()
+
+    request = json.loads(path.read_text().splitlines()[0])
+    resource = request["resourceSpans"][0]
+    assert resource["resource"]["attributes"][0]["value"]["stringValue"] == "test"
+    [spans] = read_traces(path.read_text().splitlines()).values()
+    lines = format_trace(spans)
+    assert lines[0].endswith("GET /api/users/me")
+    assert lines[1].strip().endswith("db.query")
+    assert "2.00 ms" in lines[1]